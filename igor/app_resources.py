@@ -0,0 +1,114 @@
+import os
+import time
+from datetime import datetime
+
+import streamlit as st
+
+from comps import COMPS_PATH, CompsIndex, load_comps
+from drift import DRIFT_REFERENCE_PATH, load_monitor
+from instrumentation import StageTimer
+from model_registry import ModelWatcher, available_tiers
+from parallel_stack import ConcurrentStackPredictor
+from prediction_cache import PredictionCache, model_version
+from price_surface import SURFACE_PATH, load_surface
+from row_encoder import RowEncoder
+
+# ==============================
+# ОБЩИЕ РЕСУРСЫ ПРИЛОЖЕНИЙ
+# ==============================
+# Модель, кэш предсказаний, индекс аналогов, поверхность цен и сводки сдвига
+# входов создаются один раз на процесс сервера (st.cache_resource). Они живут
+# в обычном модуле, а не в скрипте main2.py: ключ такого кэша - модуль, имя и
+# исходный код функции, поэтому startup.py может создать и прогреть их в том
+# же процессе до запуска Streamlit, и первая сессия получит готовые объекты.
+
+CURRENT_YEAR = datetime.now().year
+
+
+@st.cache_resource
+def get_stage_timer():
+    # Один таймер на процесс; METRICS_PORT включает эндпоинт Prometheus
+    timer = StageTimer()
+    if os.environ.get('METRICS_PORT'):
+        timer.start_metrics_server(int(os.environ['METRICS_PORT']))
+    return timer
+
+
+# Один наблюдатель на уровень модели (full и fast): новая текущая версия в
+# реестре загружается в фоне, прогревается и подменяет старую без
+# перезапуска сервера. Каждый расчет берет watcher.active один раз
+@st.cache_resource(max_entries=2)
+def get_model_watcher(tier):
+    timer = get_stage_timer()
+
+    def make_encoder(model):
+        # Шаблон строки кодируется один раз, дальше только поля пользователя;
+        # базовые модели стека считаются параллельно в постоянном пуле потоков
+        return RowEncoder(model, CURRENT_YEAR, timer=timer,
+                          stack_predictor=ConcurrentStackPredictor(model, timer=timer))
+
+    return ModelWatcher(tier, make_encoder=make_encoder)
+
+
+@st.cache_resource
+def get_prediction_cache():
+    # Один кэш на все сессии сервера
+    return PredictionCache(maxsize=2048, ttl=3600)
+
+
+# Индекс похожих продаж: файл из train.py, без него - строится по train.csv
+# (доли секунды). Ключ - метка файла: после переобучения индекс перечитывается
+@st.cache_resource(max_entries=1)
+def load_comps_index(version):
+    path = version[0]
+    if os.path.exists(path):
+        return load_comps(path)
+    if os.path.exists('train.csv'):
+        return CompsIndex.from_csv('train.csv')
+    return None
+
+
+def get_comps_index():
+    return load_comps_index(model_version(COMPS_PATH))
+
+
+# Поверхность цен для мгновенной оценки (price_surface.py); ключ - метка файла
+@st.cache_resource(max_entries=1)
+def load_price_surface(version):
+    return load_surface(version[0]) if os.path.exists(version[0]) else None
+
+
+def get_price_surface():
+    return load_price_surface(model_version(SURFACE_PATH))
+
+
+# Сводки входов для контроля сдвига (drift.py): одни на процесс, ключ - метка
+# файла эталона; после переобучения счет начинается заново
+@st.cache_resource(max_entries=1)
+def load_drift_monitor(version):
+    return load_monitor(version[0])
+
+
+def get_drift_monitor():
+    return load_drift_monitor(model_version(DRIFT_REFERENCE_PATH))
+
+
+# ==============================
+# ПРОГРЕВ ДО ПРИЕМА ЗАПРОСОВ
+# ==============================
+def warm_up(tiers=None):
+    # Создает все ресурсы первой сессии; модель прогревается в ModelWatcher
+    # (predict строки из DEFAULT_VALUES и RowEncoder). -> {ресурс: секунды}
+    timings = {}
+    for tier in tiers or available_tiers():
+        start = time.perf_counter()
+        watcher = get_model_watcher(tier)
+        timings[f'модель {tier}'] = time.perf_counter() - start
+        if watcher.active is None:
+            raise RuntimeError(f"Модель уровня {tier} не загружена: {watcher.last_error}")
+    for name, getter in (('кэш предсказаний', get_prediction_cache), ('похожие продажи', get_comps_index),
+                         ('поверхность цен', get_price_surface), ('сдвиг входов', get_drift_monitor)):
+        start = time.perf_counter()
+        getter()
+        timings[name] = time.perf_counter() - start
+    return timings
@@ -0,0 +1,181 @@
+import argparse
+import gc
+import multiprocessing as mp
+import os
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import model_io
+import schema
+from features import TRAIN_YEAR, prepare_batch
+from intervals import get_intervals
+from model_utils import limit_model_threads
+
+# ==============================
+# ПАКЕТНЫЙ РАСЧЕТ СТОИМОСТИ
+# ==============================
+# Пример:
+#   python batch_predict.py test.csv predictions.csv --chunksize 50000
+#
+# Файл читается чанками (CSV или Parquet), для каждого чанка применяются
+# значения по умолчанию и инженерные фичи из features.py, модель вызывается
+# один раз на чанк, результат дописывается в выходной CSV в формате res2.csv.
+# Если в модели есть интервалы (intervals.py), добавляются колонки
+# SalePriceLow и SalePriceHigh; --no-intervals - ровно формат res2.csv.
+#
+# Параллельный режим (--workers N): модель загружается один раз в главном
+# процессе, воркеры получают ее через fork (copy-on-write), без повторного
+# unpickle. Число внутренних потоков моделей в каждом воркере ограничено,
+# чтобы N воркеров не конкурировали за ядра.
+
+
+def iter_chunks(path, chunksize):
+    # Чанки в типах схемы (schema.py): категории - category, числа - узкие типы
+    if path.endswith('.parquet') or path.endswith('.pq'):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize):
+            yield schema.apply_schema(batch.to_pandas())
+    else:
+        yield from schema.read_csv(path, chunksize=chunksize)
+
+
+def predict_chunk(model, chunk, offset, current_year=TRAIN_YEAR, with_intervals=True):
+    if 'Id' in chunk.columns:
+        ids = chunk['Id'].to_numpy()
+    else:
+        ids = np.arange(offset + 1, offset + len(chunk) + 1)
+    input_df = prepare_batch(chunk, current_year)
+    log_pred = model.predict(input_df)
+    result = pd.DataFrame({'Id': ids, 'SalePrice': np.expm1(log_pred)})
+    intervals = get_intervals(model) if with_intervals else None
+    if intervals is not None:
+        # Границы интервала - поиск в таблице остатков, на скорость чанка не влияют
+        result['SalePriceLow'], result['SalePriceHigh'] = intervals.predict_interval(
+            log_pred, input_df['Neighborhood'].astype(object))
+    return result
+
+
+def run_batch(model, input_path, output_path, chunksize=50000, current_year=TRAIN_YEAR, with_intervals=True):
+    total_rows = 0
+    start = time.perf_counter()
+
+    with open(output_path, 'w', newline='') as out:
+        for i, chunk in enumerate(iter_chunks(input_path, chunksize)):
+            chunk_start = time.perf_counter()
+            result = predict_chunk(model, chunk, total_rows, current_year, with_intervals)
+            result.to_csv(out, header=(i == 0), index=False)
+            total_rows += len(result)
+
+            chunk_time = time.perf_counter() - chunk_start
+            print(f"Чанк {i + 1}: {len(result)} строк за {chunk_time:.2f} с "
+                  f"({len(result) / max(chunk_time, 1e-9):,.0f} строк/с)")
+            problems = schema.validate(chunk)
+            if not problems.empty:
+                print("  проверка схемы: " + "; ".join(
+                    f"{p.column} - {p.problem} ({p.rows}, например {p.examples})" for p in problems.itertuples()))
+
+    elapsed = time.perf_counter() - start
+    print(f"Готово: {total_rows} строк за {elapsed:.2f} с "
+          f"({total_rows / max(elapsed, 1e-9):,.0f} строк/с) -> {output_path}")
+    return total_rows, elapsed
+
+
+# ==============================
+# ПАРАЛЛЕЛЬНЫЙ РЕЖИМ
+# ==============================
+# Модель для воркеров: выставляется до fork и наследуется дочерними процессами
+_worker_model = None
+
+
+def _init_worker(n_threads):
+    from threadpoolctl import threadpool_limits
+    limit_model_threads(_worker_model, n_threads)
+    threadpool_limits(limits=n_threads)
+
+
+def _score_chunk(chunk, offset, current_year, with_intervals):
+    start = time.perf_counter()
+    result = predict_chunk(_worker_model, chunk, offset, current_year, with_intervals)
+    return os.getpid(), result, time.perf_counter() - start
+
+
+def run_parallel(model, input_path, output_path, chunksize=50000, current_year=TRAIN_YEAR,
+                 workers=None, threads_per_worker=None, with_intervals=True):
+    global _worker_model
+    workers = workers or os.cpu_count()
+    threads_per_worker = threads_per_worker or max(1, os.cpu_count() // workers)
+
+    _worker_model = model
+    # Объекты модели не трогаются сборщиком мусора -> страницы остаются общими
+    gc.freeze()
+
+    worker_stats = {}
+    total_rows = 0
+    offset = 0
+    start = time.perf_counter()
+
+    def write_result(async_result, out, header):
+        pid, result, seconds = async_result.get()
+        result.to_csv(out, header=header, index=False)
+        rows, busy = worker_stats.get(pid, (0, 0.0))
+        worker_stats[pid] = (rows + len(result), busy + seconds)
+        return len(result)
+
+    ctx = mp.get_context('fork')
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(threads_per_worker,)) as pool, \
+            open(output_path, 'w', newline='') as out:
+        # В очереди не больше 2 чанков на воркер -> память ограничена
+        pending = deque()
+        for chunk in iter_chunks(input_path, chunksize):
+            pending.append(pool.apply_async(_score_chunk, (chunk, offset, current_year, with_intervals)))
+            offset += len(chunk)
+            if len(pending) >= 2 * workers:
+                total_rows += write_result(pending.popleft(), out, total_rows == 0)
+        while pending:
+            total_rows += write_result(pending.popleft(), out, total_rows == 0)
+
+    gc.unfreeze()
+    elapsed = time.perf_counter() - start
+
+    for pid, (rows, busy) in sorted(worker_stats.items()):
+        print(f"Воркер {pid}: {rows} строк, {busy:.2f} с работы "
+              f"({rows / max(busy, 1e-9):,.0f} строк/с)")
+    print(f"Готово: {total_rows} строк за {elapsed:.2f} с "
+          f"({total_rows / max(elapsed, 1e-9):,.0f} строк/с, воркеров: {workers}, "
+          f"потоков на воркер: {threads_per_worker}) -> {output_path}")
+    return total_rows, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетный расчет стоимости домов")
+    parser.add_argument('input', help="CSV или Parquet в формате test.csv")
+    parser.add_argument('output', help="CSV с колонками Id,SalePrice (и SalePriceLow,SalePriceHigh)")
+    parser.add_argument('--model', default=None,
+                        help="house_price_model.pkl или каталог из model_io.py export")
+    parser.add_argument('--tier', choices=['full', 'fast'], default='full',
+                        help="Уровень модели, если --model не задан")
+    parser.add_argument('--chunksize', type=int, default=50000)
+    parser.add_argument('--current-year', type=int, default=TRAIN_YEAR,
+                        help="Год для расчета HouseAge/RemodAge")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Число процессов (0 - по числу ядер)")
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help="Потоков моделей на воркер (по умолчанию ядра / воркеры)")
+    parser.add_argument('--no-intervals', action='store_true',
+                        help="Только Id,SalePrice, как res2.csv (без границ интервала)")
+    args = parser.parse_args()
+
+    model = model_io.load_model(args.model or model_io.resolve_model_path(args.tier))
+    if args.workers == 1:
+        run_batch(model, args.input, args.output, args.chunksize, args.current_year, not args.no_intervals)
+    else:
+        run_parallel(model, args.input, args.output, args.chunksize, args.current_year,
+                     args.workers or None, args.threads_per_worker, not args.no_intervals)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import model_io
+from features import prepare_batch
+from prediction_cache import CACHE_KEY_FEATURES
+
+# ==============================
+# БЕНЧМАРКИ ИНФЕРЕНСА И ОБУЧЕНИЯ
+# ==============================
+# Разделы:
+#   load     - холодная загрузка модели (отдельный процесс): время и прирост RSS
+#   latency  - одна строка по пути main2.py (RowEncoder + параллельный стек): p50/p95/p99
+#   batch    - пропускная способность predict на 1/100/10k/1M строк
+#   models   - стоимость predict каждой базовой модели стека
+#   train    - полное обучение стека (train.py)
+# Строки для замеров синтезируются из распределений train.csv с фиксированным
+# seed, поэтому запуски сравнимы. Результат - плоский JSON с метриками; при
+# --baseline каждая метрика сравнивается с сохраненной, ухудшение больше
+# --tolerance помечается как регрессия (код выхода 1).
+#
+# Пример:
+#   python bench.py --sections load latency batch models --save-baseline
+#   python bench.py --baseline bench_baseline.json
+
+SECTIONS = ('load', 'latency', 'batch', 'models', 'train')
+BATCH_SIZES = (1, 100, 10_000, 1_000_000)
+# Синтезируется один раз; большие батчи собираются из его кусков
+SYNTH_ROWS = 50_000
+RESULTS_PATH = 'bench_results.json'
+BASELINE_PATH = 'bench_baseline.json'
+
+# Метрики, где больше - лучше; у остальных (время, память) лучше меньше
+HIGHER_IS_BETTER_SUFFIXES = ('rows_per_s',)
+
+# Изменения меньше порога - шум замера, а не регрессия
+NOISE_FLOOR = {'_ms': 0.1, '_us': 1.0}
+
+
+def synthesize_rows(train, n_rows, seed=0):
+    # Каждая колонка независимо выбирается из ее значений в train.csv
+    # (с пропусками в той же доле): маргинальные распределения сохраняются
+    rng = np.random.default_rng(seed)
+    source = train.drop(columns=['Id', 'SalePrice'], errors='ignore')
+    data = {col: source[col].to_numpy()[rng.integers(0, len(source), n_rows)] for col in source.columns}
+    df = pd.DataFrame(data)
+    df.insert(0, 'Id', np.arange(1, n_rows + 1))
+    return df
+
+
+def main2_inputs(row):
+    # Тот же словарь, что main2.py собирает из виджетов
+    inputs = {col: row[col] for col in CACHE_KEY_FEATURES}
+    inputs['YearRemodAdd'] = max(inputs['YearRemodAdd'], inputs['YearBuilt'])
+    inputs['GarageYrBlt'] = inputs['YearBuilt']
+    inputs['1stFlrSF'] = max(500, inputs['GrLivArea'] // 2)
+    inputs['2ndFlrSF'] = max(0, inputs['GrLivArea'] - inputs['GrLivArea'] // 2)
+    return inputs
+
+
+def percentiles_ms(times, prefix):
+    times_ms = np.asarray(times) * 1000
+    return {f"{prefix}_p{q}_ms": float(np.percentile(times_ms, q)) for q in (50, 95, 99)}
+
+
+# ==============================
+# РАЗДЕЛЫ
+# ==============================
+def bench_load(model_path):
+    result = model_io.measure_load(model_path)
+    return {
+        'load.time_s': result['load_time'],
+        'load.rss_mb': result['rss_delta'] / 2**20,
+        'load.artifact_mb': result['size'] / 2**20,
+    }
+
+
+def bench_latency(model, rows, runs=300):
+    from parallel_stack import ConcurrentStackPredictor
+    from row_encoder import RowEncoder
+
+    # main2.py считает в CURRENT_YEAR = текущий год
+    current_year = datetime.now().year
+    inputs = [main2_inputs(row) for row in rows.head(runs).to_dict('records')]
+    with ConcurrentStackPredictor(model) as predictor:
+        encoder = RowEncoder(model, current_year, stack_predictor=predictor)
+        encoder.predict(inputs[0])
+        times = []
+        for user_inputs in inputs:
+            start = time.perf_counter()
+            encoder.predict(user_inputs)
+            times.append(time.perf_counter() - start)
+    return percentiles_ms(times, 'latency.single_row')
+
+
+def bench_batch(model, rows, batch_sizes=BATCH_SIZES, chunksize=SYNTH_ROWS):
+    from batch_predict import predict_chunk
+
+    results = {}
+    for size in batch_sizes:
+        # Большие объемы - чанками, как batch_predict.py
+        repeats = max(1, min(20, 1000 // size))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for offset in range(0, size, chunksize):
+                chunk = rows.iloc[offset % len(rows):offset % len(rows) + min(chunksize, size - offset)]
+                predict_chunk(model, chunk, offset)
+        elapsed = (time.perf_counter() - start) / repeats
+        results[f"batch.{size}.seconds"] = elapsed
+        results[f"batch.{size}.rows_per_s"] = size / elapsed
+        print(f"  {size:>9} строк: {elapsed:.3f} с, {size / elapsed:,.0f} строк/с")
+    return results
+
+
+def _median_ms(fn, X, runs):
+    fn(X)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(X)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def bench_models(model, rows, runs=200, batch_rows=1000):
+    stack = model.named_steps['stack']
+    preprocessor = model.named_steps['preprocessor']
+    x_batch = preprocessor.transform(prepare_batch(rows.head(batch_rows)))
+    x_row = x_batch.iloc[:1] if hasattr(x_batch, 'iloc') else x_batch[:1]
+
+    results = {'models.preprocessor.row_ms': _median_ms(preprocessor.transform, prepare_batch(rows.head(1)), runs)}
+    for name, est in stack.named_estimators_.items():
+        results[f"models.{name}.row_ms"] = _median_ms(est.predict, x_row, runs)
+        results[f"models.{name}.batch_row_us"] = _median_ms(est.predict, x_batch, 3) / len(x_batch) * 1000
+    return results
+
+
+def bench_train(train_path, test_path, cores):
+    from sklearn import config_context
+
+    from preprocessing import load_dataset
+    from train import train_stack
+
+    data = load_dataset(train_path, test_path, verbose=False)
+    with config_context(transform_output="pandas"):
+        _, report = train_stack(data['X_train'], data['y_train_log'], data['one_hot_coder'],
+                                data['target_coder'], cores)
+    return {'train.wall_s': report['wall_seconds'], 'train.cpu_s': report['cpu_seconds']}
+
+
+# ==============================
+# СРАВНЕНИЕ С БАЗОВОЙ ЛИНИЕЙ
+# ==============================
+def compare(metrics, baseline, tolerance):
+    rows = []
+    for key, value in metrics.items():
+        if key not in baseline or not baseline[key]:
+            continue
+        change = value / baseline[key] - 1
+        worse = -change if key.endswith(HIGHER_IS_BETTER_SUFFIXES) else change
+        floor = next((v for suffix, v in NOISE_FLOOR.items() if key.endswith(suffix)), 0.0)
+        regression = worse > tolerance and abs(value - baseline[key]) > floor
+        rows.append({'metric': key, 'baseline': baseline[key], 'current': value,
+                     'change': change, 'regression': regression})
+    return pd.DataFrame(rows, columns=['metric', 'baseline', 'current', 'change', 'regression'])
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import warnings
+
+    parser = argparse.ArgumentParser(description="Бенчмарки загрузки, предсказания и обучения")
+    parser.add_argument('--model', default=None)
+    parser.add_argument('--tier', choices=['full', 'fast'], default='full')
+    parser.add_argument('--sections', nargs='+', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=list(BATCH_SIZES))
+    parser.add_argument('--train', default='train.csv')
+    parser.add_argument('--test', default='test.csv')
+    parser.add_argument('--cores', type=int, default=os.cpu_count(), help="Ядер для раздела train")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--baseline', default=None, help="JSON прошлого запуска для сравнения")
+    parser.add_argument('--save-baseline', action='store_true', help=f"Сохранить результат в {BASELINE_PATH}")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    model_path = args.model or model_io.resolve_model_path(args.tier)
+    rows = synthesize_rows(pd.read_csv(args.train), SYNTH_ROWS, args.seed)
+
+    metrics = {}
+    model = None
+    for section in args.sections:
+        print(f"[{section}]")
+        start = time.perf_counter()
+        if section == 'load':
+            metrics.update(bench_load(model_path))
+        elif section == 'train':
+            metrics.update(bench_train(args.train, args.test, args.cores))
+        else:
+            model = model or model_io.load_model(model_path)
+            if section == 'latency':
+                metrics.update(bench_latency(model, rows))
+            elif section == 'batch':
+                metrics.update(bench_batch(model, rows, args.batch_sizes))
+            else:
+                metrics.update(bench_models(model, rows))
+        print(f"  готово за {time.perf_counter() - start:.1f} с")
+
+    result = {'environment': {**environment(), 'model': model_path, 'seed': args.seed}, 'metrics': metrics}
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    print()
+    for key, value in metrics.items():
+        print(f"{key:<40}{value:>14.3f}")
+    print(f"Результат: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        table = compare(metrics, baseline['metrics'], args.tolerance)
+        print(f"\nСравнение с {args.baseline} ({baseline['environment'].get('commit')}):")
+        print(table.assign(change=table['change'].map('{:+.1%}'.format)).to_string(index=False))
+        regressions = table[table['regression']]
+        if len(regressions):
+            print(f"Регрессии (хуже более чем на {args.tolerance:.0%}): {', '.join(regressions['metric'])}")
+            sys.exit(1)
+        print("Регрессий нет")
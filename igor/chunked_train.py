@@ -0,0 +1,436 @@
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from scipy.optimize import nnls
+from sklearn.linear_model import SGDRegressor
+from sklearn.preprocessing import StandardScaler
+
+from batch_predict import iter_chunks
+from fast_tier import rmsle
+from features import add_engineered_features
+from preprocessing import PREPROCESSING_CONFIG
+
+# ==============================
+# ОБУЧЕНИЕ ЧАНКАМИ (ДАННЫЕ БОЛЬШЕ ПАМЯТИ)
+# ==============================
+# Ноутбук держит train и test целиком в pandas (pd.concat), и стек из 11
+# моделей с 5 фолдами на миллионах строк не обучить. Здесь файл читается
+# чанками в три прохода, в памяти никогда нет больше одного чанка:
+#   1. статистики: моды для заполнения пропусков, частоты категорий и суммы
+#      log1p(SalePrice) по категориям - все складывается по чанкам;
+#   2. кодирование: те же шаги, что preprocessing.preprocess (заполнение,
+#      инженерные фичи, OneHot для колонок с <= 3 значениями, сглаженное
+#      target-кодирование для остальных), результат - float32 на диск
+#      (.npy, читается через mmap); каждая 10-я строка по Id - отложенная;
+#   3. модели, которые умеют учиться по частям: LightGBM строит гистограммы
+#      из lgb.Sequence поверх mmap-файлов, XGBoost - ExtMemQuantileDMatrix
+#      (квантованные страницы на диске), линейная модель - SGDRegressor.partial_fit.
+# Веса смеси подбираются на отложенных строках (NNLS). Результат - ChunkedModel
+# с predict() на входе prepare_batch, как у обычной модели, поэтому его можно
+# отдать в batch_predict.py --model.
+#
+# Пример:
+#   python synthetic.py train_1m.csv --rows 1000000
+#   python chunked_train.py train_1m.csv --output chunked_model.joblib
+#   python chunked_train.py --scaling 100000 300000 1000000 --rounds 100
+
+CHUNKSIZE = 100_000
+SPILL_DIR = '.chunked_spill'
+
+# Строки с Id % HOLDOUT_EVERY == 0 не участвуют в обучении
+HOLDOUT_EVERY = 10
+
+# Вес глобального среднего в target-кодировании (как m-estimate): редкие
+# категории тянутся к среднему. Фолдов, как у TargetEncoder, нет - на
+# миллионах строк утечка через одну строку пренебрежима
+TARGET_SMOOTHING = 20
+
+# Параметры бустингов - как в train.base_models(), в терминах lgb.train/xgb.train
+LGBM_PARAMS = {
+    'objective': 'regression', 'learning_rate': 0.03, 'max_depth': 5, 'num_leaves': 31,
+    'bagging_fraction': 0.8, 'bagging_freq': 1, 'feature_fraction': 0.8,
+    'lambda_l1': 0.1, 'lambda_l2': 0.1, 'min_data_in_leaf': 20, 'seed': 42, 'verbose': -1,
+}
+XGB_PARAMS = {
+    'tree_method': 'hist', 'eta': 0.03, 'max_depth': 5, 'subsample': 0.8,
+    'colsample_bytree': 0.8, 'alpha': 0.1, 'lambda': 1.0, 'seed': 42, 'verbosity': 0,
+}
+ROUNDS = 800
+SGD_EPOCHS = 3
+# Стандартизованные признаки обрезаются: редкие выбросы (MiscVal, LotArea,
+# редкие категории) иначе разгоняют шаг SGD до расходимости
+SGD_CLIP = 5.0
+
+
+# ==============================
+# ПОТОКОВЫЕ СТАТИСТИКИ И КОДИРОВАНИЕ
+# ==============================
+class StreamingStats:
+    def __init__(self, config=PREPROCESSING_CONFIG):
+        self.config = config
+        self.rows = 0
+        self.y_sum = 0.0
+        self.mode_counts = {}
+        self.category_counts = {}
+        self.category_sums = {}
+        self.categorical = None
+
+    def update(self, chunk):
+        chunk = chunk.copy()
+        chunk[self.config['without_fill']] = chunk[self.config['without_fill']].fillna('without')
+        y_log = np.log1p(chunk['SalePrice'])
+        if self.categorical is None:
+            # Типы колонок - по первому чанку
+            categorical = chunk.drop(columns=['Id', 'SalePrice']).select_dtypes(include=['object', 'category'])
+            self.categorical = categorical.columns.to_list()
+
+        self.rows += len(chunk)
+        self.y_sum += float(y_log.sum())
+        for col in self.config['mode_fill']:
+            counts = chunk[col].value_counts()
+            counts = counts[counts > 0]
+            self.mode_counts[col] = counts.add(self.mode_counts.get(col, 0), fill_value=0)
+        for col in self.categorical:
+            grouped = y_log.groupby(chunk[col], observed=True).agg(['sum', 'count'])
+            self.category_sums[col] = grouped['sum'].add(self.category_sums.get(col, 0), fill_value=0)
+            self.category_counts[col] = grouped['count'].add(self.category_counts.get(col, 0), fill_value=0)
+
+    def finalize(self):
+        y_mean = self.y_sum / self.rows
+        fill_values = {col: counts.idxmax() for col, counts in self.mode_counts.items()}
+        one_hot, target_maps = {}, {}
+        for col in self.categorical:
+            counts = self.category_counts[col]
+            if len(counts) <= self.config['one_hot_max_unique']:
+                one_hot[col] = sorted(counts.index)
+            else:
+                sums = self.category_sums[col]
+                target_maps[col] = (sums + TARGET_SMOOTHING * y_mean) / (counts + TARGET_SMOOTHING)
+        return ChunkEncoder(self.config, fill_values, one_hot, target_maps, y_mean)
+
+
+class ChunkEncoder:
+    def __init__(self, config, fill_values, one_hot, target_maps, target_default):
+        self.config = config
+        self.fill_values = fill_values
+        self.one_hot = one_hot
+        self.target_maps = target_maps
+        self.target_default = target_default
+        self.numeric = None
+
+    def prepare(self, chunk):
+        config = self.config
+        df = chunk.drop(columns=['Id', 'SalePrice'], errors='ignore').copy()
+        df[config['without_fill']] = df[config['without_fill']].fillna('without')
+        df[config['zero_fill']] = df[config['zero_fill']].fillna(0)
+        df['GarageYrBlt'] = df['GarageYrBlt'].fillna(df['YearBuilt'])
+        df = df.fillna(self.fill_values)
+        add_engineered_features(df, config['current_year'])
+        df.loc[df['LotArea'] > config['lot_area_cap'], 'LotArea'] = config['lot_area_cap']
+        return df
+
+    def transform(self, df):
+        if self.numeric is None:
+            skip = set(self.one_hot) | set(self.target_maps)
+            self.numeric = [col for col in df.columns if col not in skip]
+        parts = [df[self.numeric].to_numpy(dtype=np.float32)]
+        for col, categories in self.one_hot.items():
+            values = df[col].to_numpy()
+            parts.append(np.column_stack([values == c for c in categories]).astype(np.float32))
+        for col, mapping in self.target_maps.items():
+            encoded = df[col].astype(object).map(mapping).fillna(self.target_default)
+            parts.append(encoded.to_numpy(dtype=np.float32)[:, None])
+        return np.nan_to_num(np.hstack(parts), copy=False)
+
+    @property
+    def feature_names(self):
+        one_hot = [f"{col}_{c}" for col, categories in self.one_hot.items() for c in categories]
+        return self.numeric + one_hot + list(self.target_maps)
+
+
+# ==============================
+# ИСТОЧНИКИ ДАННЫХ ДЛЯ БУСТИНГОВ
+# ==============================
+class SpillSequence(lgb.Sequence):
+    # Чанк на диске для lgb.Dataset: LightGBM читает его кусками по batch_size
+    batch_size = 65536
+
+    def __init__(self, path):
+        self.data = np.load(path, mmap_mode='r')
+
+    def __getitem__(self, idx):
+        # LightGBM принимает только float64; копируется один батч, а не весь чанк
+        return np.asarray(self.data[idx], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SpillIter(xgb.DataIter):
+    def __init__(self, parts, cache_prefix):
+        self.parts = parts
+        self.position = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self.position == len(self.parts):
+            return False
+        x_path, y_path = self.parts[self.position]
+        input_data(data=np.load(x_path, mmap_mode='r'), label=np.load(y_path))
+        self.position += 1
+        return True
+
+    def reset(self):
+        self.position = 0
+
+
+# ==============================
+# МОДЕЛЬ
+# ==============================
+class ChunkedModel:
+    def __init__(self, encoder, lgbm, xgb_booster, scaler, sgd, weights):
+        self.encoder = encoder
+        self.lgbm = lgbm
+        self.xgb = xgb_booster
+        self.scaler = scaler
+        self.sgd = sgd
+        self.weights = weights
+
+    def encode(self, X):
+        return self.encoder.transform(self.encoder.prepare(X))
+
+    def predict_models(self, Xt):
+        return {
+            'lgbm': self.lgbm.predict(Xt),
+            'xgb': self.xgb.inplace_predict(Xt),
+            'sgd': self.sgd.predict(self.linear_input(Xt)),
+        }
+
+    def linear_input(self, Xt):
+        return np.clip(self.scaler.transform(Xt), -SGD_CLIP, SGD_CLIP)
+
+    def predict(self, X):
+        # X - строки в формате prepare_batch/test.csv; ответ в log1p-шкале
+        predictions = self.predict_models(self.encode(X))
+        return sum(self.weights[name] * pred for name, pred in predictions.items())
+
+
+def _spill_paths(spill_dir, kind, i):
+    return os.path.join(spill_dir, f"{kind}-{i:05d}-X.npy"), os.path.join(spill_dir, f"{kind}-{i:05d}-y.npy")
+
+
+def train_chunked(path, chunksize=CHUNKSIZE, spill_dir=SPILL_DIR, rounds=ROUNDS,
+                  sgd_epochs=SGD_EPOCHS, config=PREPROCESSING_CONFIG, keep_spill=False, verbose=True):
+    timings = {}
+
+    def log(message):
+        if verbose:
+            print(message, flush=True)
+
+    # 1. Статистики
+    start = time.perf_counter()
+    stats = StreamingStats(config)
+    for chunk in iter_chunks(path, chunksize):
+        stats.update(chunk)
+    encoder = stats.finalize()
+    timings['stats'] = time.perf_counter() - start
+    log(f"Статистики: {stats.rows:,} строк, {timings['stats']:.1f} с")
+
+    # 2. Кодирование на диск
+    start = time.perf_counter()
+    os.makedirs(spill_dir, exist_ok=True)
+    scaler = StandardScaler()
+    parts = {'train': [], 'holdout': []}
+    for i, chunk in enumerate(iter_chunks(path, chunksize)):
+        Xt = encoder.transform(encoder.prepare(chunk))
+        y = np.log1p(chunk['SalePrice'].to_numpy(dtype=np.float32))
+        holdout = chunk['Id'].to_numpy() % HOLDOUT_EVERY == 0
+        for kind, mask in (('train', ~holdout), ('holdout', holdout)):
+            x_path, y_path = _spill_paths(spill_dir, kind, i)
+            np.save(x_path, Xt[mask])
+            np.save(y_path, y[mask])
+            parts[kind].append((x_path, y_path))
+        scaler.partial_fit(Xt[~holdout])
+        del chunk, Xt
+    timings['encode'] = time.perf_counter() - start
+    train_rows = sum(len(np.load(y_path)) for _, y_path in parts['train'])
+    log(f"Кодирование: {len(encoder.feature_names)} признаков, {timings['encode']:.1f} с")
+
+    # 3. Модели
+    start = time.perf_counter()
+    y_train = np.concatenate([np.load(y_path) for _, y_path in parts['train']])
+    dataset = lgb.Dataset([SpillSequence(x_path) for x_path, _ in parts['train']], label=y_train,
+                          params={'verbose': -1})
+    lgbm = lgb.train(LGBM_PARAMS, dataset, num_boost_round=rounds)
+    del dataset
+    timings['lgbm'] = time.perf_counter() - start
+    log(f"LightGBM: {rounds} деревьев, {timings['lgbm']:.1f} с")
+
+    start = time.perf_counter()
+    matrix = xgb.ExtMemQuantileDMatrix(SpillIter(parts['train'], os.path.join(spill_dir, 'xgb-cache')))
+    xgb_booster = xgb.train(XGB_PARAMS, matrix, num_boost_round=rounds)
+    del matrix
+    timings['xgb'] = time.perf_counter() - start
+    log(f"XGBoost: {rounds} деревьев, {timings['xgb']:.1f} с")
+
+    start = time.perf_counter()
+    rng = np.random.default_rng(42)
+    sgd = SGDRegressor(alpha=1e-4, random_state=42)
+    model = ChunkedModel(encoder, lgbm, xgb_booster, scaler, sgd, weights=None)
+    for _ in range(sgd_epochs):
+        for index in rng.permutation(len(parts['train'])):
+            x_path, y_path = parts['train'][index]
+            X, y = np.load(x_path), np.load(y_path)
+            order = rng.permutation(len(y))
+            sgd.partial_fit(model.linear_input(X[order]), y[order])
+    timings['sgd'] = time.perf_counter() - start
+    log(f"SGD: {sgd_epochs} эпохи, {timings['sgd']:.1f} с")
+
+    # Веса смеси и оценка на отложенных строках
+    predictions, y_holdout = [], []
+    for x_path, y_path in parts['holdout']:
+        predictions.append(model.predict_models(np.load(x_path)))
+        y_holdout.append(np.load(y_path))
+    y_holdout = np.concatenate(y_holdout)
+    names = list(predictions[0])
+    P = np.column_stack([np.concatenate([p[name] for p in predictions]) for name in names])
+    coef, _ = nnls(P, y_holdout)
+    model.weights = dict(zip(names, coef / coef.sum()))
+    scores = {name: rmsle(y_holdout, P[:, i]) for i, name in enumerate(names)}
+    scores['blend'] = rmsle(y_holdout, P @ np.array([model.weights[name] for name in names]))
+
+    if not keep_spill:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    report = {
+        'rows': stats.rows,
+        'train_rows': train_rows,
+        'holdout_rows': len(y_holdout),
+        'features': len(encoder.feature_names),
+        'timings': timings,
+        'rmsle': scores,
+        'weights': model.weights,
+    }
+    return model, report
+
+
+# ==============================
+# СРАВНЕНИЕ С ОБУЧЕНИЕМ В ПАМЯТИ
+# ==============================
+def train_in_memory(path, rounds=ROUNDS):
+    # Путь ноутбука: весь файл в pandas, preprocess, ColumnTransformer,
+    # затем LightGBM с теми же параметрами (остальной стек еще дороже)
+    from lightgbm import LGBMRegressor
+
+    import schema
+    from preprocessing import preprocess
+    from train import make_preprocessor
+
+    train = schema.read_csv(path)
+    data = preprocess(train, train.iloc[:0].drop(columns='SalePrice'))
+    Xt = make_preprocessor(data['one_hot_coder'], data['target_coder']).fit_transform(data['X_train'], data['y_train_log'])
+    LGBMRegressor(n_estimators=rounds, learning_rate=0.03, max_depth=5, num_leaves=31, subsample=0.8,
+                  subsample_freq=1, colsample_bytree=0.8, reg_alpha=0.1, reg_lambda=0.1,
+                  min_child_samples=20, random_state=42, verbose=-1).fit(Xt, data['y_train_log'])
+
+
+def _peak_rss_mb():
+    # VmHWM сбрасывается при exec, а ru_maxrss наследует пик родителя
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss на Linux - в КБ
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(mode, path, rounds, chunksize):
+    # Запускается в отдельном процессе: пик RSS относится только к этому обучению
+    rss_start = _peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'chunked':
+        train_chunked(path, chunksize, spill_dir=f"{SPILL_DIR}-{os.getpid()}", rounds=rounds, verbose=False)
+    else:
+        train_in_memory(path, rounds)
+    print(json.dumps({'seconds': time.perf_counter() - start, 'peak_rss_mb': _peak_rss_mb(),
+                      'start_rss_mb': rss_start}))
+
+
+def measure(mode, path, rounds, chunksize):
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '_measure', mode, path, str(rounds), str(chunksize)],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        # Например, процесс убит по нехватке памяти
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"код {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def scaling_report(row_counts, train_path='train.csv', rounds=100, chunksize=CHUNKSIZE,
+                   data_dir=SPILL_DIR + '-data', modes=('chunked', 'memory')):
+    from synthetic import write_synthetic
+
+    os.makedirs(data_dir, exist_ok=True)
+    rows = []
+    for n_rows in row_counts:
+        path = os.path.join(data_dir, f"synthetic-{n_rows}.csv")
+        if not os.path.exists(path):
+            write_synthetic(train_path, path, n_rows)
+        for mode in modes:
+            result = measure(mode, path, rounds, chunksize)
+            rows.append({'rows': n_rows, 'mode': mode, **result})
+            print(f"{n_rows:>10,} {mode:>8}: " + (
+                f"{result['seconds']:.1f} с, пик RSS {result['peak_rss_mb']:.0f} МБ "
+                f"(после импортов {result['start_rss_mb']:.0f} МБ)" if 'error' not in result
+                else f"ошибка: {result['error']}"
+            ), flush=True)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    import argparse
+    import warnings
+
+    parser = argparse.ArgumentParser(description="Обучение чанками на данных больше памяти")
+    parser.add_argument('path', nargs='?', help="CSV/Parquet в формате train.csv")
+    parser.add_argument('--output', default='chunked_model.joblib')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    parser.add_argument('--rounds', type=int, default=ROUNDS)
+    parser.add_argument('--spill-dir', default=SPILL_DIR)
+    parser.add_argument('--scaling', nargs='+', type=int, default=None,
+                        help="Число строк синтетических наборов: время и пик RSS, чанками и в памяти")
+    parser.add_argument('--train', default='train.csv', help="Источник синтетических данных для --scaling")
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    if sys.argv[1:2] == ['_measure']:
+        mode, path, rounds, chunksize = sys.argv[2:6]
+        _measure(mode, path, int(rounds), int(chunksize))
+        sys.exit()
+
+    args = parser.parse_args()
+    if args.scaling:
+        scaling_report(args.scaling, args.train, args.rounds, args.chunksize)
+    else:
+        # Через импорт модуля: иначе ChunkedModel запишется в pickle как __main__.ChunkedModel
+        # и не загрузится из batch_predict.py
+        import chunked_train
+        model, report = chunked_train.train_chunked(args.path, args.chunksize, args.spill_dir, args.rounds)
+        joblib.dump(model, args.output)
+        print(f"{report['rows']:,} строк ({report['holdout_rows']:,} отложено), {report['features']} признаков")
+        print("RMSLE на отложенных: " + ", ".join(f"{k} {v:.4f}" for k, v in report['rmsle'].items()))
+        print("Веса смеси: " + ", ".join(f"{k} {v:.2f}" for k, v in report['weights'].items()))
+        print(f"Модель сохранена в {args.output}, пик RSS {_peak_rss_mb():.0f} МБ")
@@ -0,0 +1,225 @@
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+
+# ==============================
+# СКОМПИЛИРОВАННЫЙ ЛЕС
+# ==============================
+# RandomForest/ExtraTrees из sklearn при predict обходят каждое дерево
+# отдельным вызовом (и через joblib), а узлы лежат в 500 отдельных массивах
+# по 72 байта на узел. CompiledForest собирает все деревья леса в общие
+# плоские массивы:
+#   feature   - uint16, номер признака узла
+#   threshold - float32, порог (округлен вниз до float32: sklearn сравнивает
+#               float32-значение признака с float64-порогом, поэтому
+#               результат сравнения не меняется)
+#   children  - int32, пары (левый, правый) потомок; лист ссылается на себя
+#   value     - float64, значение листа
+# и обходит их векторно: на каждом уровне все строки во всех деревьях
+# переходят на следующий узел одной операцией NumPy. Число шагов - глубина
+# самого глубокого дерева; листья ссылаются на себя и стоят на месте, а в
+# глубоких лесах (rf_deep) дошедшие до листа пары периодически убираются.
+#
+# В стеке скомпилированный лес заменяет исходный (compile_forests), поэтому
+# StackingRegressor, RowEncoder и ConcurrentStackPredictor работают с ним
+# как с обычной моделью. fit тоже есть: обучается исходный лес и
+# компилируется - клон стека можно обучать заново.
+#
+# Пример:
+#   python compiled_forest.py --model house_price_model.pkl --output house_price_model_compiled.pkl
+#   python model_io.py export house_price_model.pkl house_price_model --compile-forests
+
+# Базовые модели стека, которые компилируются (train.base_models)
+FOREST_MODELS = ('rf', 'et', 'rf_deep')
+
+# Сколько пар (дерево, строка) обходится за один блок: ограничивает память
+# промежуточных массивов при predict на больших наборах
+BLOCK_SIZE = 1 << 20
+
+# Каждые столько уровней пары, дошедшие до листа, убираются из обхода
+COMPACT_EVERY = 4
+
+
+def _round_down_float32(threshold):
+    # Наибольшее float32, не превосходящее порог: для любого float32 x
+    # x <= порог  <=>  x <= округленный порог
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class CompiledForest(RegressorMixin, BaseEstimator):
+    # estimator - необученный лес (шаблон для fit и get_params)
+    def __init__(self, estimator=None):
+        self.estimator = estimator
+
+    @classmethod
+    def from_forest(cls, forest):
+        return cls(clone(forest))._compile(forest)
+
+    def fit(self, X, y, sample_weight=None):
+        forest = clone(self.estimator).fit(X, y, sample_weight=sample_weight)
+        return self._compile(forest)
+
+    def _compile(self, forest):
+        trees = [tree.tree_ for tree in forest.estimators_]
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise TypeError("Поддерживаются только леса с одним выходом")
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        if sizes.sum() >= np.iinfo(np.int32).max:
+            raise ValueError("Слишком много узлов для int32-индексов")
+
+        feature, threshold, children, value, missing_left = [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == -1
+            left = np.where(leaf, nodes, tree.children_left) + offset
+            right = np.where(leaf, nodes, tree.children_right) + offset
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+            children.append(np.column_stack([left, right]))
+            value.append(tree.value[:, 0, 0])
+            missing_left.append(tree.missing_go_to_left.astype(bool) & ~leaf)
+
+        self.feature_ = np.concatenate(feature).astype(np.uint16)
+        self.threshold_ = _round_down_float32(np.concatenate(threshold))
+        self.children_ = np.concatenate(children).astype(np.int32).ravel()
+        self.value_ = np.concatenate(value)
+        self.missing_go_to_left_ = np.concatenate(missing_left)
+        self.roots_ = offsets.astype(np.int32)
+        self.max_depth_ = max(tree.max_depth for tree in trees)
+        self.n_features_in_ = forest.n_features_in_
+        if hasattr(forest, 'feature_names_in_'):
+            self.feature_names_in_ = forest.feature_names_in_
+        return self
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Ожидается {self.n_features_in_} признаков, получено {X.shape}")
+        n_trees = len(self.roots_)
+        block_rows = max(1, BLOCK_SIZE // n_trees)
+        return np.concatenate([
+            self._predict_block(X[start:start + block_rows])
+            for start in range(0, len(X), block_rows)
+        ]) if len(X) else np.empty(0)
+
+    def _predict_block(self, X):
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots_)
+        flat = X.ravel()
+        offset_dtype = np.int32 if n_rows * n_features < 2**31 else np.int64
+        # Пара (дерево t, строка i) - позиция t * n_rows + i; node - текущий
+        # узел пары, offset - начало строки во flat
+        node = np.repeat(self.roots_, n_rows)
+        offset = np.tile(np.arange(n_rows, dtype=offset_dtype) * n_features, n_trees)
+        pair = np.arange(n_trees * n_rows)
+        values = np.empty(n_trees * n_rows)
+        has_missing = np.isnan(flat).any()
+        for depth in range(1, self.max_depth_ + 1):
+            x = flat[offset + self.feature_[node]]
+            go_right = ~(x <= self.threshold_[node])
+            if has_missing:
+                go_right &= ~(np.isnan(x) & self.missing_go_to_left_[node])
+            node = self.children_[2 * node + go_right]
+            if depth % COMPACT_EVERY == 0 and depth < self.max_depth_:
+                # Глубокие деревья: большинство пар уже в листьях - дальше
+                # обходятся только оставшиеся
+                active = self.children_[2 * node] != node
+                if active.sum() < len(node) // 2:
+                    done = ~active
+                    values[pair[done]] = self.value_[node[done]]
+                    node, offset, pair = node[active], offset[active], pair[active]
+        values[pair] = self.value_[node]
+        # Как в sklearn: среднее предсказаний деревьев
+        return values.reshape(n_trees, n_rows).mean(axis=0)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in
+                   ('feature_', 'threshold_', 'children_', 'value_', 'missing_go_to_left_', 'roots_'))
+
+
+# ==============================
+# ЗАМЕНА ЛЕСОВ В СТЕКЕ
+# ==============================
+def compile_forests(model, names=FOREST_MODELS):
+    # Леса стека заменяются скомпилированными на месте; возвращает имена замененных
+    stack = model.named_steps['stack']
+    compiled = []
+    for name in names:
+        forest = stack.named_estimators_.get(name)
+        if forest is None or isinstance(forest, CompiledForest) or not hasattr(forest, 'estimators_'):
+            continue
+        index = next(i for i, est in enumerate(stack.estimators_) if est is forest)
+        fast = CompiledForest.from_forest(forest)
+        stack.estimators_[index] = fast
+        stack.named_estimators_[name] = fast
+        compiled.append(name)
+    return compiled
+
+
+# ==============================
+# СРАВНЕНИЕ С sklearn
+# ==============================
+if __name__ == '__main__':
+    import argparse
+    import copy
+    import pickle
+    import time
+    import warnings
+
+    import joblib
+    import pandas as pd
+
+    import model_io
+    from features import prepare_batch
+
+    # Через импорт модуля: иначе CompiledForest запишется в pickle как
+    # __main__.CompiledForest и не загрузится из main2.py и service.py
+    from compiled_forest import CompiledForest, compile_forests
+
+    parser = argparse.ArgumentParser(description="Компиляция лесов стека: точность, память, задержка")
+    parser.add_argument('--model', default=model_io.resolve_model_path())
+    parser.add_argument('--data', default='test.csv')
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--output', help="Сохранить модель со скомпилированными лесами")
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    model = model_io.load_model(args.model)
+    X = model.named_steps['preprocessor'].transform(prepare_batch(pd.read_csv(args.data)))
+    stack = model.named_steps['stack']
+
+    def latency(fn, x, runs):
+        fn(x)
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn(x)
+            times.append(time.perf_counter() - start)
+        return np.median(times) * 1000
+
+    print(f"{'Модель':<9}{'узлов':>10}{'sklearn, МБ':>13}{'массивы, МБ':>13}"
+          f"{'1 строка, мс':>19}{f'{len(X)} строк, мс':>22}{'расхождение':>13}")
+    for name in FOREST_MODELS:
+        forest = stack.named_estimators_.get(name)
+        if forest is None or not hasattr(forest, 'estimators_'):
+            continue
+        fast = CompiledForest.from_forest(forest)
+        diff = np.abs(forest.predict(X) - fast.predict(X)).max()
+        row = X[:1]
+        print(f"{name:<9}{len(fast.value_):>10,}"
+              f"{len(pickle.dumps(forest)) / 2**20:>13.1f}{fast.nbytes / 2**20:>13.1f}"
+              f"{latency(forest.predict, row, args.runs):>10.2f} → {latency(fast.predict, row, args.runs):<6.2f}"
+              f"{latency(forest.predict, X, 5):>12.1f} → {latency(fast.predict, X, 5):<7.1f}"
+              f"{diff:>13.1e}")
+
+    compiled_model = copy.deepcopy(model)
+    compile_forests(compiled_model)
+    diff = np.abs(model.named_steps['stack'].predict(X) - compiled_model.named_steps['stack'].predict(X)).max()
+    print(f"Стек: макс. расхождение предсказаний {diff:.1e} (log1p)")
+    if args.output:
+        joblib.dump(compiled_model, args.output)
+        print(f"Сохранено: {args.output} ({model_io.artifact_size(args.output) / 2**20:.1f} МБ)")
@@ -0,0 +1,212 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+import schema
+from prediction_cache import CACHE_KEY_FEATURES
+
+# ==============================
+# ПОХОЖИЕ ПРОДАННЫЕ ДОМА (COMPS)
+# ==============================
+# По десяти полям, которые вводит пользователь main2.py, ищутся K ближайших
+# продаж из train.csv (или любого большого файла того же формата). Индекс -
+# KD-дерево, строится при обучении (train.py) и сохраняется в comps_index.joblib;
+# запрос - O(log n), без перебора всех продаж.
+#
+# Пространство поиска (10 измерений):
+#   - площади - log1p, остальные числа как есть;
+#   - Neighborhood и HouseStyle - сглаженная средняя log-цена категории
+#     (одно измерение вместо 25 + 8 one-hot: KD-дерево плохо работает в
+#     высокой размерности);
+#   - все признаки стандартизуются и умножаются на вес из COMPS_WEIGHTS.
+# Оценщики берут аналоги из того же района, поэтому для каждого района есть
+# свое дерево; общее дерево - для районов, где продаж меньше k.
+#
+# Пример:
+#   python comps.py train.csv                 # построить индекс
+#   python comps.py train_1m.csv --benchmark  # время построения и запроса против перебора
+
+COMPS_PATH = 'comps_index.joblib'
+
+COMPS_FEATURES = CACHE_KEY_FEATURES
+CATEGORY_FEATURES = ('Neighborhood', 'HouseStyle')
+LOG_FEATURES = ('GrLivArea', 'LotArea', 'TotalBsmtSF', 'GarageArea')
+
+# Вес признака в расстоянии после стандартизации: район, площадь и качество
+# важнее остального при подборе аналогов
+COMPS_WEIGHTS = {'Neighborhood': 2.0, 'GrLivArea': 1.5, 'OverallQual': 1.5}
+
+# Сглаживание средней цены редкой категории к общей средней
+CATEGORY_SMOOTHING = 10
+
+COMPS_COLUMNS = ['Id'] + COMPS_FEATURES + ['SalePrice']
+
+
+class CompsIndex:
+    def __init__(self, sales, leaf_size=40):
+        # sales - DataFrame с COMPS_COLUMNS (Id необязателен)
+        sales = sales.dropna(subset=COMPS_FEATURES + ['SalePrice']).reset_index(drop=True)
+        y_log = np.log1p(sales['SalePrice'].to_numpy(dtype=float))
+        self.global_mean = float(y_log.mean())
+        self.encodings = {}
+        for col in CATEGORY_FEATURES:
+            stats = pd.DataFrame({'key': sales[col].astype(object), 'y': y_log}).groupby('key')['y'].agg(['sum', 'count'])
+            smoothed = (stats['sum'] + CATEGORY_SMOOTHING * self.global_mean) / (stats['count'] + CATEGORY_SMOOTHING)
+            self.encodings[col] = smoothed.to_dict()
+
+        X = self._matrix(sales)
+        self.center = X.mean(axis=0)
+        scale = X.std(axis=0)
+        weights = np.array([COMPS_WEIGHTS.get(col, 1.0) for col in COMPS_FEATURES])
+        self.scale = np.where(scale > 0, scale, 1.0) / weights
+        points = (X - self.center) / self.scale
+        self.tree = KDTree(points, leaf_size=leaf_size)
+        # Район -> (позиции продаж района, дерево по ним)
+        self.neighborhood_trees = {}
+        neighborhoods = sales['Neighborhood'].astype(object)
+        for value, positions in neighborhoods.groupby(neighborhoods).indices.items():
+            self.neighborhood_trees[value] = (positions, KDTree(points[positions], leaf_size=leaf_size))
+
+        # Для показа: поля продаж массивами в узких типах схемы, категории -
+        # кодами (без DataFrame: выборка k строк из него дороже самого запроса)
+        if 'Id' not in sales:
+            sales = sales.assign(Id=np.arange(1, len(sales) + 1))
+        typed = schema.apply_schema(sales[COMPS_COLUMNS])
+        self.columns = {}
+        self.categories = {}
+        for col in COMPS_COLUMNS:
+            if isinstance(typed[col].dtype, pd.CategoricalDtype):
+                self.columns[col] = typed[col].cat.codes.to_numpy()
+                self.categories[col] = typed[col].cat.categories.to_numpy(dtype=object)
+            else:
+                self.columns[col] = typed[col].to_numpy()
+        self.n_sales = len(typed)
+
+    @classmethod
+    def from_csv(cls, path, chunksize=None, **kwargs):
+        # Только нужные колонки, сразу в типах схемы: миллионы строк в памяти - десятки МБ
+        data = schema.read_csv(path, usecols=lambda col: col in COMPS_COLUMNS, chunksize=chunksize)
+        if chunksize:
+            data = pd.concat(data, ignore_index=True)
+        return cls(data, **kwargs)
+
+    def _encode(self, col, values):
+        mapping = self.encodings[col]
+        return np.array([mapping.get(v, self.global_mean) for v in values], dtype=float)
+
+    def _matrix(self, df):
+        columns = []
+        for col in COMPS_FEATURES:
+            if col in CATEGORY_FEATURES:
+                columns.append(self._encode(col, df[col].astype(object)))
+            elif col in LOG_FEATURES:
+                columns.append(np.log1p(df[col].to_numpy(dtype=float)))
+            else:
+                columns.append(df[col].to_numpy(dtype=float))
+        return np.column_stack(columns)
+
+    def _vector(self, user_inputs):
+        # Один запрос без DataFrame: десять чисел
+        x = np.empty(len(COMPS_FEATURES))
+        for j, col in enumerate(COMPS_FEATURES):
+            value = user_inputs[col]
+            if col in CATEGORY_FEATURES:
+                x[j] = self.encodings[col].get(value, self.global_mean)
+            elif col in LOG_FEATURES:
+                x[j] = np.log1p(value)
+            else:
+                x[j] = value
+        return ((x - self.center) / self.scale)[None, :]
+
+    def query(self, user_inputs, k=5, same_neighborhood=True):
+        # -> (позиции продаж, расстояния), ближайшие первыми
+        x = self._vector(user_inputs)
+        local = self.neighborhood_trees.get(user_inputs['Neighborhood']) if same_neighborhood else None
+        if local is not None and len(local[0]) >= k:
+            distances, positions = local[1].query(x, k=k)
+            return local[0][positions[0]], distances[0]
+        distances, positions = self.tree.query(x, k=min(k, self.n_sales))
+        return positions[0], distances[0]
+
+    def comps(self, user_inputs, k=5, same_neighborhood=True):
+        positions, distances = self.query(user_inputs, k, same_neighborhood)
+        result = {}
+        for col in COMPS_COLUMNS:
+            values = self.columns[col][positions]
+            result[col] = self.categories[col][values] if col in self.categories else values
+        result['PricePerSqft'] = result['SalePrice'] / result['GrLivArea']
+        result['Distance'] = distances
+        return pd.DataFrame(result)
+
+    def price_per_sqft(self, user_inputs, k=10):
+        # Медиана цены за кв. фут у k ближайших продаж
+        positions, _ = self.query(user_inputs, k)
+        return float(np.median(self.columns['SalePrice'][positions] / self.columns['GrLivArea'][positions]))
+
+    def save(self, path=COMPS_PATH):
+        joblib.dump(self, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return path
+
+
+def load_comps(path=COMPS_PATH):
+    return joblib.load(path)
+
+
+# ==============================
+# ПОСТРОЕНИЕ И ЗАМЕР
+# ==============================
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from features import DEFAULT_VALUES
+
+    # Через импорт модуля: иначе CompsIndex запишется в pickle как __main__.CompsIndex
+    from comps import CompsIndex
+
+    parser = argparse.ArgumentParser(description="Индекс похожих продаж (KD-дерево)")
+    parser.add_argument('path', nargs='?', default='train.csv')
+    parser.add_argument('--output', default=COMPS_PATH)
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--benchmark', action='store_true', help="Сравнить запрос с линейным перебором")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = CompsIndex.from_csv(args.path, chunksize=args.chunksize)
+    build = time.perf_counter() - start
+    index.save(args.output)
+    print(f"{index.n_sales:,} продаж, построение {build:.1f} с, "
+          f"{os.path.getsize(args.output) / 2**20:.1f} МБ -> {args.output}")
+
+    inputs = {col: DEFAULT_VALUES[col] for col in COMPS_FEATURES} | {'TotalBsmtSF': 1000, 'HouseStyle': '2Story'}
+    print(index.comps(inputs, args.k).to_string(index=False))
+
+    if args.benchmark:
+        rng = np.random.default_rng(0)
+        neighborhoods = sorted(index.neighborhood_trees)
+        queries = [dict(inputs, GrLivArea=int(rng.integers(600, 4000)), OverallQual=int(rng.integers(1, 11)),
+                        YearBuilt=int(rng.integers(1900, 2010)), Neighborhood=rng.choice(neighborhoods))
+                   for _ in range(200)]
+        points = index.tree.get_arrays()[0]
+
+        def brute(user_inputs):
+            distances = ((points - index._vector(user_inputs)) ** 2).sum(axis=1)
+            return np.argpartition(distances, args.k)[:args.k]
+
+        for title, fn in (("KD-дерево", lambda q: index.query(q, args.k, same_neighborhood=False)),
+                          ("дерево района", lambda q: index.query(q, args.k)), ("перебор", brute),
+                          ("KD-дерево + таблица", lambda q: index.comps(q, args.k)),
+                          ("цена за кв. фут", index.price_per_sqft)):
+            times = []
+            for q in queries:
+                t = time.perf_counter()
+                fn(q)
+                times.append(time.perf_counter() - t)
+            print(f"{title:>20}: p50 {np.median(times) * 1000:.3f} мс, p99 {np.percentile(times, 99) * 1000:.3f} мс")
+        same = all(set(index.query(q, args.k, same_neighborhood=False)[0]) == set(brute(q)) for q in queries[:50])
+        print(f"Соседи совпадают с перебором: {'да' if same else 'нет'}")
@@ -0,0 +1,284 @@
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from prediction_cache import CACHE_KEY_FEATURES
+
+# ==============================
+# СДВИГ ВХОДНЫХ ДАННЫХ
+# ==============================
+# Следим, не уходят ли поля, которые вводят пользователи main2.py, от
+# распределения train.csv, на котором обучена модель. Запросы не хранятся:
+#   - эталон (drift_reference.json) строится при обучении: для числового поля -
+#     границы децилей train.csv плюс минимум и максимум, для категории - доли
+#     значений;
+#   - в процессе сервера DriftMonitor держит для каждого поля гистограмму по
+#     этим же границам (или счетчики категорий) - память постоянная, обновление
+#     одного запроса - bisect и сложение, единицы микросекунд;
+#   - старые запросы забываются экспоненциально (HALF_LIFE запросов): вес
+#     каждого нового запроса растет в 2 ** (1 / HALF_LIFE) раз, вместо того
+#     чтобы на каждом запросе умножать все счетчики.
+# Расхождение - PSI (population stability index) доли живых запросов в
+# корзине против доли train.csv: < 0.1 - сдвига нет, 0.1-0.25 - умеренный,
+# > 0.25 - значительный. Значения вне [мин, макс] train.csv попадают в крайние
+# корзины, которых в эталоне нет, и сразу поднимают PSI.
+#
+# Пример:
+#   python drift.py train.csv                       # эталон -> drift_reference.json
+#   python drift.py train.csv --stream test.csv     # PSI потока test.csv и время обновления
+
+DRIFT_REFERENCE_PATH = 'drift_reference.json'
+
+DRIFT_FEATURES = CACHE_KEY_FEATURES
+CATEGORY_FEATURES = ('Neighborhood', 'HouseStyle')
+
+# Децили train.csv - внутренние границы корзин числового поля
+N_QUANTILES = 10
+
+# Через столько запросов вес старого запроса уменьшается вдвое
+HALF_LIFE = 500
+
+# Меньше (взвешенных) запросов - PSI не показывается: шум
+MIN_OBSERVATIONS = 30
+
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+
+# Доля пустой корзины при расчете PSI (логарифм нуля)
+PSI_EPSILON = 1e-4
+
+# Категория, которой нет в train.csv
+OTHER_CATEGORY = '(другое)'
+
+# Когда вес нового запроса превышает это число, счетчики нормируются
+_RESCALE_AT = 1e100
+
+
+# ==============================
+# ЭТАЛОН ПО TRAIN.CSV
+# ==============================
+def build_reference(df, source=None):
+    features = {}
+    for col in DRIFT_FEATURES:
+        values = df[col].dropna()
+        if col in CATEGORY_FEATURES:
+            shares = values.astype(str).value_counts(normalize=True)
+            features[col] = {
+                'kind': 'category',
+                'categories': shares.index.tolist() + [OTHER_CATEGORY],
+                'proportions': shares.tolist() + [0.0],
+            }
+        else:
+            values = values.to_numpy(dtype=float)
+            inner = np.quantile(values, np.arange(1, N_QUANTILES) / N_QUANTILES)
+            # [мин, децили..., следующее число после макс]: корзина 0 - ниже
+            # минимума train.csv, последняя - выше максимума
+            edges = np.unique(np.concatenate([[values.min()], inner, [np.nextafter(values.max(), np.inf)]]))
+            counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+            features[col] = {
+                'kind': 'numeric',
+                'edges': edges.tolist(),
+                'proportions': (counts / counts.sum()).tolist(),
+                'median': float(np.median(values)),
+            }
+    return {
+        'source': source,
+        'rows': len(df),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'features': features,
+    }
+
+
+def reference_from_csv(path):
+    return build_reference(pd.read_csv(path, usecols=DRIFT_FEATURES), source=path)
+
+
+def save_reference(reference, path=DRIFT_REFERENCE_PATH):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(reference, f, indent=2, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def load_reference(path=DRIFT_REFERENCE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def psi(live, reference):
+    live = np.maximum(np.asarray(live, dtype=float), PSI_EPSILON)
+    reference = np.maximum(np.asarray(reference, dtype=float), PSI_EPSILON)
+    return float(np.sum((live - reference) * np.log(live / reference)))
+
+
+def psi_status(value):
+    if value < PSI_MODERATE:
+        return 'нет'
+    return 'умеренный' if value < PSI_SIGNIFICANT else 'значительный'
+
+
+# ==============================
+# ПОТОКОВЫЕ СВОДКИ
+# ==============================
+class DriftMonitor:
+    def __init__(self, reference, half_life=HALF_LIFE):
+        self.reference = reference
+        self.half_life = half_life
+        self._edges = {}
+        self._categories = {}
+        self._counts = {}
+        for col, spec in reference['features'].items():
+            if spec['kind'] == 'numeric':
+                self._edges[col] = spec['edges']
+            else:
+                self._categories[col] = {value: i for i, value in enumerate(spec['categories'])}
+            self._counts[col] = [0.0] * len(spec['proportions'])
+        self._other = {col: index[OTHER_CATEGORY] for col, index in self._categories.items()}
+        self._growth = 2.0 ** (1.0 / half_life)
+        self._weight = 1.0
+        self._total = 0.0
+        self._lock = threading.Lock()
+        self.observations = 0
+        # Время update: сумма и максимум, для панели и замера накладных расходов
+        self.update_seconds = 0.0
+        self.max_update_seconds = 0.0
+
+    def update(self, user_inputs):
+        start = time.perf_counter()
+        with self._lock:
+            weight = self._weight
+            counts = self._counts
+            for col, edges in self._edges.items():
+                counts[col][bisect_right(edges, user_inputs[col])] += weight
+            for col, index in self._categories.items():
+                counts[col][index.get(user_inputs[col], self._other[col])] += weight
+            self._total += weight
+            self.observations += 1
+            self._weight = weight * self._growth
+            if self._weight > _RESCALE_AT:
+                self._rescale()
+            # Под той же блокировкой, что observations: иначе параллельные
+            # сессии теряют приращения и среднее занижается
+            elapsed = time.perf_counter() - start
+            self.update_seconds += elapsed
+            self.max_update_seconds = max(self.max_update_seconds, elapsed)
+
+    def _rescale(self):
+        scale = 1.0 / self._weight
+        for values in self._counts.values():
+            for i in range(len(values)):
+                values[i] *= scale
+        self._total *= scale
+        self._weight = 1.0
+
+    @property
+    def effective_observations(self):
+        # Сумма весов в единицах последнего запроса: с забыванием не больше
+        # HALF_LIFE / ln 2 ~ 720 при HALF_LIFE = 500
+        return self._total * self._growth / self._weight
+
+    @property
+    def mean_update_seconds(self):
+        return self.update_seconds / self.observations if self.observations else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            total = self._total
+            shares = {col: [value / total for value in values] if total else list(values)
+                      for col, values in self._counts.items()}
+        return shares
+
+    def scores(self):
+        # Таблица для панели: признак, PSI, статус, пояснение
+        shares = self.snapshot()
+        rows = []
+        for col, spec in self.reference['features'].items():
+            live, ref = shares[col], spec['proportions']
+            value = psi(live, ref)
+            if spec['kind'] == 'numeric':
+                outside = live[0] + live[-1]
+                detail = f"медиана ≈ {self._median(spec['edges'], live):.0f} (train {spec['median']:.0f})"
+                if outside > 0.01:
+                    detail += f", вне диапазона train {outside:.0%}"
+            else:
+                # Категория с наибольшим перекосом доли относительно train.csv
+                i = int(np.argmax(np.abs(np.array(live) - np.array(ref))))
+                detail = f"{spec['categories'][i]}: {live[i]:.0%} (train {ref[i]:.0%})"
+            rows.append({'feature': col, 'psi': value, 'status': psi_status(value), 'detail': detail})
+        return rows
+
+    @staticmethod
+    def _median(edges, shares):
+        # Медиана по гистограмме: линейно внутри корзины; крайние корзины -
+        # граница диапазона train.csv
+        cumulative = 0.0
+        for i, share in enumerate(shares):
+            if cumulative + share >= 0.5 and share > 0:
+                if i == 0:
+                    return edges[0]
+                if i == len(shares) - 1:
+                    return edges[-1]
+                return edges[i - 1] + (0.5 - cumulative) / share * (edges[i] - edges[i - 1])
+            cumulative += share
+        return math.nan
+
+
+def load_monitor(path=DRIFT_REFERENCE_PATH, train_path='train.csv'):
+    # Эталон из train.py; без него - по train.csv (доли секунды); без обоих - None
+    if os.path.exists(path):
+        return DriftMonitor(load_reference(path))
+    if os.path.exists(train_path):
+        return DriftMonitor(reference_from_csv(train_path))
+    return None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Эталон распределения входов и замер сдвига")
+    parser.add_argument('path', nargs='?', default='train.csv')
+    parser.add_argument('--output', default=DRIFT_REFERENCE_PATH)
+    parser.add_argument('--stream', help="CSV, строки которого подаются как запросы (например test.csv)")
+    args = parser.parse_args()
+
+    reference = reference_from_csv(args.path)
+    save_reference(reference, args.output)
+    print(f"Эталон по {reference['rows']:,} строкам {args.path} -> {args.output} "
+          f"({os.path.getsize(args.output) / 1024:.1f} КБ)")
+
+    if args.stream:
+        requests = pd.read_csv(args.stream, usecols=DRIFT_FEATURES).dropna()
+        shifted = requests.assign(GrLivArea=requests['GrLivArea'] * 1.5,
+                                  YearBuilt=np.minimum(requests['YearBuilt'] + 20, 2020),
+                                  Neighborhood='NridgHt')
+        for title, frame in ((args.stream, requests), (f"{args.stream}, сдвинутый", shifted)):
+            monitor = DriftMonitor(reference)
+            records = frame.to_dict('records')
+            for record in records:
+                monitor.update(record)
+            start = time.perf_counter()
+            rows = monitor.scores()
+            scores_ms = (time.perf_counter() - start) * 1000
+            print(f"\n{title}: {monitor.observations} запросов (с забыванием ~{monitor.effective_observations:.0f}); "
+                  f"update в среднем {monitor.mean_update_seconds * 1e6:.1f} мкс, "
+                  f"макс {monitor.max_update_seconds * 1e6:.0f} мкс; scores {scores_ms:.2f} мс")
+            for row in rows:
+                print(f"  {row['feature']:<14}PSI {row['psi']:>6.3f}  {row['status']:<13}{row['detail']}")
+
+        # Накладные расходы без конкуренции за блокировку
+        monitor = DriftMonitor(reference)
+        records = requests.to_dict('records') * 50
+        times = np.empty(len(records))
+        for i, record in enumerate(records):
+            start = time.perf_counter()
+            monitor.update(record)
+            times[i] = time.perf_counter() - start
+        print(f"\nupdate на {len(records):,} запросах: p50 {np.median(times) * 1e6:.1f} мкс, "
+              f"p99 {np.percentile(times, 99) * 1e6:.1f} мкс")
@@ -0,0 +1,142 @@
+import copy
+import time
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import KFold, cross_val_predict
+from sklearn.pipeline import Pipeline
+
+# ==============================
+# БЫСТРЫЙ УРОВЕНЬ МОДЕЛИ
+# ==============================
+# Для каждой базовой модели стека меряется задержка на одну строку и ее вклад
+# в out-of-fold RMSLE. Затем жадно выкидываются модели с наименьшей потерей
+# точности на миллисекунду, пока сумма задержек не уложится в бюджет.
+# Оставшиеся обученные модели переиспользуются, заново обучается только
+# мета-модель на их OOF-предсказаниях (так же, как в StackingRegressor.fit).
+#
+# Пример:
+#   python fast_tier.py --budget-ms 5
+
+
+def rmsle(y_log, pred_log):
+    return float(np.sqrt(np.mean((np.asarray(y_log) - np.asarray(pred_log)) ** 2)))
+
+
+def measure_latency(stack, x_row, runs=50):
+    # Медианная задержка predict на одной строке, мс
+    latencies = {}
+    for name, est in zip(stack.named_estimators_, stack.estimators_):
+        est.predict(x_row)
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            est.predict(x_row)
+            times.append(time.perf_counter() - start)
+        latencies[name] = float(np.median(times) * 1000)
+    return latencies
+
+
+def oof_predictions(stack, Xt, y_log, cv=5):
+    # Как StackingRegressor.fit: клон каждой модели, KFold без перемешивания
+    folds = KFold(n_splits=cv)
+    columns = []
+    for name, est in zip(stack.named_estimators_, stack.estimators_):
+        print(f"OOF: {name}")
+        columns.append(cross_val_predict(clone(est), Xt, y_log, cv=folds))
+    return np.column_stack(columns)
+
+
+def meta_oof_rmsle(stack, oof, y_log, cols):
+    meta = clone(stack.final_estimator_)
+    pred = cross_val_predict(meta, oof[:, cols], y_log, cv=KFold(n_splits=5, shuffle=True, random_state=42))
+    return rmsle(y_log, pred)
+
+
+def select_models(stack, oof, y_log, latencies, budget_ms):
+    names = list(stack.named_estimators_)
+    selected = list(range(len(names)))
+    lat = np.array([latencies[n] for n in names])
+    current = meta_oof_rmsle(stack, oof, y_log, selected)
+
+    while lat[selected].sum() > budget_ms and len(selected) > 1:
+        best = None
+        for i in selected:
+            rest = [j for j in selected if j != i]
+            score = meta_oof_rmsle(stack, oof, y_log, rest)
+            # Потеря точности на сэкономленную миллисекунду
+            cost = (score - current) / max(lat[i], 1e-6)
+            if best is None or cost < best[0]:
+                best = (cost, i, score)
+        _, removed, current = best
+        selected.remove(removed)
+        print(f"  убрана {names[removed]} ({lat[removed]:.2f} мс), OOF RMSLE {current:.4f}")
+    return selected, current
+
+
+def build_fast_model(model, oof, y_log, selected):
+    stack = model.named_steps['stack']
+    names = list(stack.named_estimators_)
+
+    fast_stack = copy.copy(stack)
+    fast_stack.estimators = [stack.estimators[i] for i in selected]
+    fast_stack.estimators_ = [stack.estimators_[i] for i in selected]
+    fast_stack.named_estimators_ = type(stack.named_estimators_)(
+        **{names[i]: stack.estimators_[i] for i in selected}
+    )
+    fast_stack.stack_method_ = [stack.stack_method_[i] for i in selected]
+    fast_stack.final_estimator_ = clone(stack.final_estimator_).fit(oof[:, selected], y_log)
+
+    return Pipeline([
+        ('preprocessor', model.named_steps['preprocessor']),
+        ('stack', fast_stack),
+    ])
+
+
+if __name__ == '__main__':
+    import argparse
+    import warnings
+
+    import joblib
+
+    import model_io
+    from features import load_train
+
+    parser = argparse.ArgumentParser(description="Сборка быстрого уровня стека под бюджет задержки")
+    parser.add_argument('--model', default=model_io.resolve_model_path())
+    parser.add_argument('--train', default='train.csv')
+    parser.add_argument('--budget-ms', type=float, default=5.0,
+                        help="Бюджет суммарной задержки базовых моделей на строку, мс")
+    parser.add_argument('--output', default=model_io.FAST_PICKLE_PATH)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    model = model_io.load_model(args.model)
+    stack = model.named_steps['stack']
+    X, y_log = load_train(args.train)
+
+    # Кросс-фиттинг TargetEncoder, как при обучении пайплайна
+    Xt = np.asarray(clone(model.named_steps['preprocessor']).fit_transform(X, y_log), dtype=float)
+    x_row = np.asarray(model.named_steps['preprocessor'].transform(X.iloc[:1]), dtype=float)
+
+    latencies = measure_latency(stack, x_row)
+    oof = oof_predictions(stack, Xt, y_log)
+    names = list(stack.named_estimators_)
+    full_rmsle = meta_oof_rmsle(stack, oof, y_log, list(range(len(names))))
+
+    print(f"\n{'Модель':<10}{'мс/строка':>10}{'OOF RMSLE':>11}{'без нее':>10}")
+    for i, name in enumerate(names):
+        rest = [j for j in range(len(names)) if j != i]
+        print(f"{name:<10}{latencies[name]:>10.2f}{rmsle(y_log, oof[:, i]):>11.4f}"
+              f"{meta_oof_rmsle(stack, oof, y_log, rest):>10.4f}")
+    print(f"Полный стек: {sum(latencies.values()):.2f} мс, OOF RMSLE {full_rmsle:.4f}\n")
+
+    selected, fast_rmsle = select_models(stack, oof, y_log, latencies, args.budget_ms)
+    fast_model = build_fast_model(model, oof, y_log, selected)
+    joblib.dump(fast_model, args.output)
+
+    fast_latency = sum(latencies[names[i]] for i in selected)
+    print(f"\nБыстрый уровень: {', '.join(names[i] for i in selected)}")
+    print(f"Задержка {fast_latency:.2f} мс (бюджет {args.budget_ms} мс), "
+          f"OOF RMSLE {fast_rmsle:.4f} ({fast_rmsle - full_rmsle:+.4f} к полному стеку)")
+    print(f"Сохранено: {args.output}")
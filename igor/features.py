@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+import schema
+
+# ==============================
+# ПРИЗНАКИ МОДЕЛИ
+# ==============================
+# Год, относительно которого считались возрасты при обучении (project.ipynb)
+TRAIN_YEAR = 2020
+
+# Как в ноутбуке: площадь участка обрезается сверху после расчета инженерных
+# фич, так что LotRatio считается по необрезанной площади
+LOT_AREA_CAP = 500000
+
+ALL_FEATURES = [
+    'MSSubClass', 'MSZoning', 'LotFrontage', 'LotArea', 'Street', 'Alley', 'LotShape',
+    'LandContour', 'Utilities', 'LotConfig', 'LandSlope', 'Neighborhood', 'Condition1',
+    'Condition2', 'BldgType', 'HouseStyle', 'OverallQual', 'OverallCond', 'YearBuilt',
+    'YearRemodAdd', 'RoofStyle', 'RoofMatl', 'Exterior1st', 'Exterior2nd', 'MasVnrType',
+    'MasVnrArea', 'ExterQual', 'ExterCond', 'Foundation', 'BsmtQual', 'BsmtCond',
+    'BsmtExposure', 'BsmtFinType1', 'BsmtFinSF1', 'BsmtFinType2', 'BsmtFinSF2',
+    'BsmtUnfSF', 'TotalBsmtSF', 'Heating', 'HeatingQC', 'CentralAir', 'Electrical',
+    '1stFlrSF', '2ndFlrSF', 'LowQualFinSF', 'GrLivArea', 'BsmtFullBath', 'BsmtHalfBath',
+    'FullBath', 'HalfBath', 'BedroomAbvGr', 'KitchenAbvGr', 'KitchenQual', 'TotRmsAbvGrd',
+    'Functional', 'Fireplaces', 'FireplaceQu', 'GarageType', 'GarageYrBlt', 'GarageFinish',
+    'GarageCars', 'GarageArea', 'GarageQual', 'GarageCond', 'PavedDrive', 'WoodDeckSF',
+    'OpenPorchSF', 'EnclosedPorch', '3SsnPorch', 'ScreenPorch', 'PoolArea', 'PoolQC',
+    'Fence', 'MiscFeature', 'MiscVal', 'MoSold', 'YrSold', 'SaleType', 'SaleCondition'
+]
+
+DEFAULT_VALUES = {
+    'MSSubClass': 20, 'LotFrontage': 0, 'LotArea': 10000, 'OverallQual': 6, 'OverallCond': 6,
+    'YearBuilt': 1980, 'YearRemodAdd': 1980, 'MasVnrArea': 0, 'BsmtFinSF1': 0, 'BsmtFinSF2': 0,
+    'BsmtUnfSF': 0, 'TotalBsmtSF': 0, '1stFlrSF': 800, '2ndFlrSF': 0, 'LowQualFinSF': 0,
+    'GrLivArea': 1500, 'BsmtFullBath': 0, 'BsmtHalfBath': 0, 'FullBath': 2, 'HalfBath': 1,
+    'BedroomAbvGr': 3, 'KitchenAbvGr': 1, 'TotRmsAbvGrd': 6, 'Fireplaces': 1, 'GarageYrBlt': 1980,
+    'GarageCars': 2, 'GarageArea': 500, 'WoodDeckSF': 0, 'OpenPorchSF': 0, 'EnclosedPorch': 0,
+    '3SsnPorch': 0, 'ScreenPorch': 0, 'PoolArea': 0, 'MiscVal': 0, 'MoSold': 6, 'YrSold': 2020,
+    'MSZoning': 'RL', 'Street': 'Pave', 'Alley': 'without', 'LotShape': 'Reg', 'LandContour': 'Lvl',
+    'Utilities': 'AllPub', 'LotConfig': 'Inside', 'LandSlope': 'Gtl', 'Neighborhood': 'CollgCr',
+    'Condition1': 'Norm', 'Condition2': 'Norm', 'BldgType': '1Fam', 'HouseStyle': '1Story',
+    'RoofStyle': 'Gable', 'RoofMatl': 'CompShg', 'Exterior1st': 'VinylSd', 'Exterior2nd': 'VinylSd',
+    'MasVnrType': 'without', 'ExterQual': 'TA', 'ExterCond': 'TA', 'Foundation': 'PConc',
+    'BsmtQual': 'without', 'BsmtCond': 'without', 'BsmtExposure': 'without', 'BsmtFinType1': 'without',
+    'BsmtFinType2': 'without', 'Heating': 'GasA', 'HeatingQC': 'Ex', 'CentralAir': 'Y',
+    'Electrical': 'SBrkr', 'KitchenQual': 'TA', 'Functional': 'Typ', 'FireplaceQu': 'without',
+    'GarageType': 'without', 'GarageFinish': 'without', 'GarageQual': 'without', 'GarageCond': 'without',
+    'PavedDrive': 'Y', 'PoolQC': 'without', 'Fence': 'without', 'MiscFeature': 'without',
+    'SaleType': 'WD', 'SaleCondition': 'Normal'
+}
+
+ENGINEERED_FEATURES = [
+    'HouseAge', 'RemodAge', 'IsOldNotRemod', 'QualCondDiff', 'HasGarage', 'HasBsmt', 'LotRatio'
+]
+
+# Порядок колонок, на котором обучен house_price_model.pkl
+MODEL_FEATURES = ALL_FEATURES + ENGINEERED_FEATURES
+
+
+# ==============================
+# СБОРКА ВХОДА МОДЕЛИ
+# ==============================
+def build_input_row(user_inputs):
+    # Значения пользователя поверх значений по умолчанию
+    data = {}
+    for col in ALL_FEATURES:
+        if col in user_inputs:
+            data[col] = user_inputs[col]
+        else:
+            data[col] = DEFAULT_VALUES[col]
+    return data
+
+
+def fill_defaults(df):
+    # Недостающие колонки и пропуски заполняются так же, как в приложении
+    df = df.reindex(columns=ALL_FEATURES)
+    df['GarageYrBlt'] = df['GarageYrBlt'].fillna(df['YearBuilt'])
+    return df.fillna(DEFAULT_VALUES)
+
+
+def add_engineered_features(df, current_year=TRAIN_YEAR):
+    # Инженерные фичи (векторно, работает и для одной строки, и для чанка)
+    df['HouseAge'] = current_year - df['YearBuilt']
+    df['RemodAge'] = current_year - df['YearRemodAdd']
+    df['IsOldNotRemod'] = ((df['HouseAge'] > 50) &
+                           (df['RemodAge'] == df['HouseAge'])).astype(int)
+    df['QualCondDiff'] = df['OverallQual'] - df['OverallCond']
+    df['HasGarage'] = (df['GarageArea'] > 0).astype(int)
+    df['HasBsmt'] = (df['TotalBsmtSF'] > 0).astype(int)
+    df['LotRatio'] = df['LotArea'] / df['GrLivArea'].replace(0, 1)
+    df['LotRatio'] = df['LotRatio'].replace([np.inf, -np.inf], 0)
+    return df
+
+
+def clip_lot_area(df):
+    df['LotArea'] = df['LotArea'].clip(upper=LOT_AREA_CAP)
+    return df
+
+
+def make_input_df(user_inputs, current_year=TRAIN_YEAR):
+    input_df = pd.DataFrame([build_input_row(user_inputs)])
+    return clip_lot_area(add_engineered_features(input_df, current_year))
+
+
+def prepare_batch(df, current_year=TRAIN_YEAR):
+    return clip_lot_area(add_engineered_features(fill_defaults(df), current_year))
+
+
+def load_train(path='train.csv', current_year=TRAIN_YEAR):
+    # train.csv -> признаки модели и таргет в log1p-шкале, как в project.ipynb
+    train = schema.read_csv(path)
+    y_log = np.log1p(train['SalePrice'])
+    return prepare_batch(train, current_year), y_log
@@ -0,0 +1,147 @@
+import contextlib
+import time
+
+# ==============================
+# ЗАМЕР ЭТАПОВ ПРЕДСКАЗАНИЯ
+# ==============================
+# StageTimer передается в RowEncoder и ConcurrentStackPredictor и замеряет
+# кодирование строки, каждую базовую модель и мета-модель. Таймер один на
+# процесс и сам хранит только гистограммы Prometheus (если запущен сервер
+# prometheus_client). Время этапов одного запроса (панель отладки) пишется в
+# словарь timings, который передает вызывающий: encoder.predict(..., timings={}).
+# Поэтому сессии не переключают и не перетирают замеры друг друга. Без
+# Prometheus и без timings этап делает только проверку и возвращает общий
+# nullcontext - без замеров и без аллокаций.
+#
+# Пример:
+#   timer = StageTimer()
+#   timer.start_metrics_server(9100)      # http://127.0.0.1:9100/metrics
+#   encoder = RowEncoder(model, stack_predictor=ConcurrentStackPredictor(model, timer=timer), timer=timer)
+#   timings = {}
+#   encoder.predict(user_inputs, timings=timings)   # {этап: секунды} этого запроса
+
+_NULL_STAGE = contextlib.nullcontext()
+
+_METRICS = {}
+
+
+def _metrics():
+    # Метрики регистрируются один раз на процесс (Streamlit перезапускает
+    # скрипт, но не модули)
+    import prometheus_client
+
+    if not _METRICS:
+        _METRICS['stage_seconds'] = prometheus_client.Histogram(
+            'house_price_stage_seconds', "Время этапа предсказания", ['stage'],
+            buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+        )
+        _METRICS['predictions'] = prometheus_client.Counter(
+            'house_price_predictions_total', "Предсказания по источнику", ['source'],
+        )
+    return _METRICS
+
+
+class _Stage:
+    __slots__ = ('timer', 'name', 'timings', 'start')
+
+    def __init__(self, timer, name, timings):
+        self.timer = timer
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter() - self.start, self.timings)
+
+
+class StageTimer:
+    def __init__(self):
+        self.prometheus = False
+
+    def start_metrics_server(self, port, addr='127.0.0.1'):
+        # prometheus_client необязателен и импортируется только здесь: без
+        # METRICS_PORT он не замедляет старт приложения
+        try:
+            import prometheus_client
+        except ImportError:
+            raise RuntimeError("prometheus_client не установлен") from None
+        self._stage_seconds = _metrics()['stage_seconds']
+        self._predictions = _metrics()['predictions']
+        prometheus_client.start_http_server(port, addr=addr)
+        self.prometheus = True
+
+    def measuring(self, timings=None):
+        return timings is not None or self.prometheus
+
+    def stage(self, name, timings=None):
+        if timings is None and not self.prometheus:
+            return _NULL_STAGE
+        return _Stage(self, name, timings)
+
+    def call(self, name, timings, fn, *args):
+        # Для задач в пуле потоков: вызов fn(*args) с замером
+        start = time.perf_counter()
+        result = fn(*args)
+        self.record(name, time.perf_counter() - start, timings)
+        return result
+
+    def record(self, name, seconds, timings=None):
+        # timings - словарь запроса; потоки пула пишут в разные ключи
+        if timings is not None:
+            timings[name] = seconds
+        if self.prometheus:
+            self._stage_seconds.labels(name).observe(seconds)
+
+    def count_prediction(self, source):
+        # source: 'cache' или 'model'
+        if self.prometheus:
+            self._predictions.labels(source).inc()
+
+
+# ==============================
+# НАКЛАДНЫЕ РАСХОДЫ
+# ==============================
+if __name__ == '__main__':
+    import argparse
+    import warnings
+
+    import numpy as np
+
+    import model_io
+    from parallel_stack import ConcurrentStackPredictor
+    from row_encoder import RowEncoder
+
+    parser = argparse.ArgumentParser(description="Задержка RowEncoder с выключенным и включенным таймером")
+    parser.add_argument('--model', default=model_io.resolve_model_path())
+    parser.add_argument('--runs', type=int, default=300)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    model = model_io.load_model(args.model)
+    inputs = {'GrLivArea': 1500, 'OverallQual': 7, 'Neighborhood': 'CollgCr'}
+
+    # Стоимость одного этапа у выключенного таймера
+    timer = StageTimer()
+    start = time.perf_counter()
+    for _ in range(100_000):
+        with timer.stage('x'):
+            pass
+    print(f"Этап при выключенном таймере: {(time.perf_counter() - start) / 100_000 * 1e9:.0f} нс")
+
+    with ConcurrentStackPredictor(model, timer=timer) as predictor:
+        encoder = RowEncoder(model, stack_predictor=predictor, timer=timer)
+        encoder.predict(inputs)
+        for title, measure in (("выключен", False), ("включен", True)):
+            times = []
+            for _ in range(args.runs):
+                timings = {} if measure else None
+                start = time.perf_counter()
+                encoder.predict(inputs, timings=timings)
+                times.append(time.perf_counter() - start)
+            print(f"{title:>12}: p50 {np.percentile(times, 50) * 1000:.3f} мс, "
+                  f"p99 {np.percentile(times, 99) * 1000:.3f} мс")
+            if measure:
+                for name, seconds in sorted(timings.items(), key=lambda kv: -kv[1]):
+                    print(f"{name:>14}: {seconds * 1000:.3f} мс")
@@ -0,0 +1,187 @@
+import numpy as np
+
+# ==============================
+# ИНТЕРВАЛЫ ЦЕНЫ ПО OOF-ОСТАТКАМ
+# ==============================
+# Конформный интервал: берутся остатки стека на train.csv, которые получены
+# без утечки (мета-модель по кросс-валидации на OOF-предсказаниях базовых
+# моделей, train.oof_predictions). Нижняя и верхняя граница - квантили
+# остатков log1p(цена) - прогноз. Если новые дома похожи на обучающие, то с
+# вероятностью coverage цена попадает в [прогноз + нижний, прогноз + верхний].
+# На запросе интервал - поиск в таблице, без бутстрепа стека из 11 моделей.
+#
+# Остатки дешевых и дорогих домов разные, поэтому квантили считаются отдельно
+# по группам (Mondrian-вариант):
+#   band         - ценовой диапазон прогноза (N_BANDS диапазонов равной численности)
+#   neighborhood - район; районы, где продаж меньше MIN_GROUP, берут общие границы
+#   global       - одни границы на все дома
+#
+# Интервалы хранятся в самой модели (атрибут prediction_intervals_ пайплайна),
+# поэтому попадают и в pickle, и в каталог model_io export, и в реестр.
+#
+# Пример:
+#   python intervals.py --model house_price_model.pkl             # покрытие на отложенной половине
+#   python intervals.py --by neighborhood --coverage 0.8 --save   # пересчитать без переобучения
+
+INTERVAL_COVERAGE = 0.9
+INTERVAL_BY = 'band'
+N_BANDS = 5
+
+# Меньше продаж в группе - квантиль ненадежен, берутся общие границы
+MIN_GROUP = 40
+
+MODEL_ATTRIBUTE = 'prediction_intervals_'
+
+
+def conformal_bounds(residuals, coverage):
+    # Квантили с поправкой на конечную выборку: (n + 1) вместо n
+    residuals = np.asarray(residuals, dtype=float)
+    n = len(residuals)
+    alpha = 1 - coverage
+    low = max(np.floor((n + 1) * alpha / 2) / n, 0.0)
+    high = min(np.ceil((n + 1) * (1 - alpha / 2)) / n, 1.0)
+    return (float(np.quantile(residuals, low, method='lower')),
+            float(np.quantile(residuals, high, method='higher')))
+
+
+class ResidualIntervals:
+    # pred_log, y_log - OOF-прогноз и факт в log1p; neighborhoods - районы тех же строк
+    def __init__(self, pred_log, y_log, neighborhoods=None, coverage=INTERVAL_COVERAGE,
+                 by=INTERVAL_BY, n_bands=N_BANDS, min_group=MIN_GROUP):
+        if by not in ('global', 'band', 'neighborhood'):
+            raise ValueError(f"Неизвестная группировка: {by}")
+        if by == 'neighborhood' and neighborhoods is None:
+            raise ValueError("Для группировки по району нужны районы продаж")
+        self.pred_log = np.asarray(pred_log, dtype=float)
+        self.residuals = np.asarray(y_log, dtype=float) - self.pred_log
+        self.neighborhoods = None if neighborhoods is None else np.asarray(neighborhoods, dtype=object)
+        self.coverage = coverage
+        self.by = by
+        self.min_group = min_group
+
+        self.global_bounds = conformal_bounds(self.residuals, coverage)
+        self.band_edges = np.quantile(self.pred_log, np.arange(1, n_bands) / n_bands) if by == 'band' else None
+        self.group_bounds = {}
+        if by == 'band':
+            bands = np.searchsorted(self.band_edges, self.pred_log, side='right')
+            for band in range(n_bands):
+                self.group_bounds[band] = conformal_bounds(self.residuals[bands == band], coverage)
+        elif by == 'neighborhood':
+            for value in np.unique(self.neighborhoods):
+                group = self.residuals[self.neighborhoods == value]
+                if len(group) >= min_group:
+                    self.group_bounds[value] = conformal_bounds(group, coverage)
+
+    def _groups(self, pred_log, neighborhoods):
+        if self.by == 'band':
+            return np.searchsorted(self.band_edges, pred_log, side='right')
+        if self.by == 'neighborhood' and neighborhoods is not None:
+            return np.asarray(neighborhoods, dtype=object)
+        return np.full(len(pred_log), None, dtype=object)
+
+    def bounds_log(self, pred_log, neighborhoods=None):
+        # -> (нижняя, верхняя) граница в log1p для каждой строки
+        pred_log = np.atleast_1d(np.asarray(pred_log, dtype=float))
+        groups = self._groups(pred_log, neighborhoods)
+        offsets = np.array([self.group_bounds.get(group, self.global_bounds) for group in groups.tolist()])
+        return pred_log + offsets[:, 0], pred_log + offsets[:, 1]
+
+    def predict_interval(self, pred_log, neighborhoods=None):
+        # -> (нижняя, верхняя) граница цены в долларах
+        low, high = self.bounds_log(pred_log, neighborhoods)
+        return np.expm1(low), np.expm1(high)
+
+    def interval(self, pred_log, neighborhood=None):
+        # Один дом (приложение): два числа
+        low, high = self.predict_interval([pred_log], None if neighborhood is None else [neighborhood])
+        return float(low[0]), float(high[0])
+
+    def recalibrate(self, **kwargs):
+        # Те же остатки, другие покрытие или группировка
+        params = {'coverage': self.coverage, 'by': self.by, 'min_group': self.min_group,
+                  'n_bands': N_BANDS if self.band_edges is None else len(self.band_edges) + 1}
+        return ResidualIntervals(self.pred_log, self.pred_log + self.residuals, self.neighborhoods,
+                                 **{**params, **kwargs})
+
+
+def attach_intervals(model, intervals):
+    setattr(model, MODEL_ATTRIBUTE, intervals)
+    return model
+
+
+def get_intervals(model):
+    # None - модель обучена до появления интервалов (переобучите train.py)
+    return getattr(model, MODEL_ATTRIBUTE, None)
+
+
+# ==============================
+# ПРОВЕРКА ПОКРЫТИЯ
+# ==============================
+def split_coverage(intervals, by, coverage, seed=0):
+    # Калибровка на случайной половине остатков, покрытие и ширина - на другой
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(intervals.residuals))
+    calibration, evaluation = order[::2], order[1::2]
+    neighborhoods = intervals.neighborhoods
+    pick = (lambda rows: None) if neighborhoods is None else (lambda rows: neighborhoods[rows])
+    half = ResidualIntervals(intervals.pred_log[calibration],
+                             intervals.pred_log[calibration] + intervals.residuals[calibration],
+                             pick(calibration), coverage, by, min_group=intervals.min_group // 2)
+    pred = intervals.pred_log[evaluation]
+    y_log = pred + intervals.residuals[evaluation]
+    low, high = half.bounds_log(pred, pick(evaluation))
+    inside = (y_log >= low) & (y_log <= high)
+    bands = np.searchsorted(np.quantile(pred, [0.2, 0.4, 0.6, 0.8]), pred, side='right')
+    return {
+        'coverage': float(inside.mean()),
+        'band_coverage': [float(inside[bands == band].mean()) for band in range(5)],
+        'width': float(np.median(np.expm1(high) - np.expm1(low))),
+        'relative_width': float(np.median((np.expm1(high) - np.expm1(low)) / np.expm1(pred))),
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    import joblib
+
+    import model_io
+
+    # Через импорт модуля: иначе пересчитанные интервалы запишутся в pickle
+    # как __main__.ResidualIntervals
+    from intervals import attach_intervals, get_intervals
+
+    parser = argparse.ArgumentParser(description="Интервалы цены по OOF-остаткам: покрытие и ширина")
+    parser.add_argument('--model', default=model_io.resolve_model_path())
+    parser.add_argument('--coverage', type=float, default=None)
+    parser.add_argument('--by', choices=['global', 'band', 'neighborhood'], default=None)
+    parser.add_argument('--save', action='store_true', help="Записать пересчитанные интервалы в pickle модели")
+    args = parser.parse_args()
+
+    model = model_io.load_model(args.model)
+    intervals = get_intervals(model)
+    if intervals is None:
+        raise SystemExit(f"В {args.model} нет интервалов: переобучите модель (python train.py)")
+    coverage = args.coverage or intervals.coverage
+
+    print(f"{len(intervals.residuals)} OOF-остатков, цель покрытия {coverage:.0%}; "
+          f"калибровка на половине, проверка на другой")
+    print(f"{'группы':<14}{'покрытие':>10}{'по ценовым квинтилям':>34}{'ширина':>12}{'ширина/цена':>13}")
+    for by in ('global', 'band', 'neighborhood'):
+        if by == 'neighborhood' and intervals.neighborhoods is None:
+            continue
+        result = split_coverage(intervals, by, coverage)
+        bands = ' '.join(f"{value:.2f}" for value in result['band_coverage'])
+        print(f"{by:<14}{result['coverage']:>10.1%}{bands:>34}"
+              f"{result['width']:>12,.0f}{result['relative_width']:>13.1%}")
+
+    if args.coverage or args.by:
+        intervals = intervals.recalibrate(**{key: value for key, value in
+                                             (('coverage', args.coverage), ('by', args.by)) if value})
+        print(f"Пересчитано: покрытие {intervals.coverage:.0%}, группы {intervals.by}")
+        if args.save:
+            if os.path.isdir(args.model):
+                raise SystemExit("--save работает с pickle; для каталога export пересоберите его из pickle")
+            joblib.dump(attach_intervals(model, intervals), args.model)
+            print(f"Сохранено: {args.model}")
@@ -1,7 +1,10 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
-import joblib
+
+from app_resources import get_model_watcher, get_prediction_cache
+from features import make_input_df
+from model_registry import available_tiers
+from prediction_cache import make_cache_key
 
 CURRENT_YEAR = 2020
 
@@ -18,7 +21,7 @@ NEIGHBORHOOD_MAPPING = {
     'Iowa DOT and Rail Road': 'IDOTRR',
     'Meadow Village': 'MeadowV',
     'Mitchell': 'Mitchel',
-    'North Ames': 'Names',
+    'North Ames': 'NAmes',
     'Northridge': 'NoRidge',
     'Northpark Villa': 'NPkVill',
     'Northridge Heights': 'NridgHt',
@@ -45,52 +48,18 @@ HOUSE_STYLE_MAPPING = {
 }
 
 
-ALL_FEATURES = [
-    'MSSubClass', 'MSZoning', 'LotFrontage', 'LotArea', 'Street', 'Alley', 'LotShape',
-    'LandContour', 'Utilities', 'LotConfig', 'LandSlope', 'Neighborhood', 'Condition1',
-    'Condition2', 'BldgType', 'HouseStyle', 'OverallQual', 'OverallCond', 'YearBuilt',
-    'YearRemodAdd', 'RoofStyle', 'RoofMatl', 'Exterior1st', 'Exterior2nd', 'MasVnrType',
-    'MasVnrArea', 'ExterQual', 'ExterCond', 'Foundation', 'BsmtQual', 'BsmtCond',
-    'BsmtExposure', 'BsmtFinType1', 'BsmtFinSF1', 'BsmtFinType2', 'BsmtFinSF2',
-    'BsmtUnfSF', 'TotalBsmtSF', 'Heating', 'HeatingQC', 'CentralAir', 'Electrical',
-    '1stFlrSF', '2ndFlrSF', 'LowQualFinSF', 'GrLivArea', 'BsmtFullBath', 'BsmtHalfBath',
-    'FullBath', 'HalfBath', 'BedroomAbvGr', 'KitchenAbvGr', 'KitchenQual', 'TotRmsAbvGrd',
-    'Functional', 'Fireplaces', 'FireplaceQu', 'GarageType', 'GarageYrBlt', 'GarageFinish',
-    'GarageCars', 'GarageArea', 'GarageQual', 'GarageCond', 'PavedDrive', 'WoodDeckSF',
-    'OpenPorchSF', 'EnclosedPorch', '3SsnPorch', 'ScreenPorch', 'PoolArea', 'PoolQC',
-    'Fence', 'MiscFeature', 'MiscVal', 'MoSold', 'YrSold', 'SaleType', 'SaleCondition'
-]
-
-DEFAULT_VALUES = {
-    'MSSubClass': 20, 'LotFrontage': 0, 'LotArea': 10000, 'OverallQual': 6, 'OverallCond': 6,
-    'YearBuilt': 1980, 'YearRemodAdd': 1980, 'MasVnrArea': 0, 'BsmtFinSF1': 0, 'BsmtFinSF2': 0,
-    'BsmtUnfSF': 0, 'TotalBsmtSF': 0, '1stFlrSF': 800, '2ndFlrSF': 0, 'LowQualFinSF': 0,
-    'GrLivArea': 1500, 'BsmtFullBath': 0, 'BsmtHalfBath': 0, 'FullBath': 2, 'HalfBath': 1,
-    'BedroomAbvGr': 3, 'KitchenAbvGr': 1, 'TotRmsAbvGrd': 6, 'Fireplaces': 1, 'GarageYrBlt': 1980,
-    'GarageCars': 2, 'GarageArea': 500, 'WoodDeckSF': 0, 'OpenPorchSF': 0, 'EnclosedPorch': 0,
-    '3SsnPorch': 0, 'ScreenPorch': 0, 'PoolArea': 0, 'MiscVal': 0, 'MoSold': 6, 'YrSold': 2020,
-    'MSZoning': 'RL', 'Street': 'Pave', 'Alley': 'without', 'LotShape': 'Reg', 'LandContour': 'Lvl',
-    'Utilities': 'AllPub', 'LotConfig': 'Inside', 'LandSlope': 'Gtl', 'Neighborhood': 'CollgCr',
-    'Condition1': 'Norm', 'Condition2': 'Norm', 'BldgType': '1Fam', 'HouseStyle': '1Story',
-    'RoofStyle': 'Gable', 'RoofMatl': 'CompShg', 'Exterior1st': 'VinylSd', 'Exterior2nd': 'VinylSd',
-    'MasVnrType': 'without', 'ExterQual': 'TA', 'ExterCond': 'TA', 'Foundation': 'PConc',
-    'BsmtQual': 'without', 'BsmtCond': 'without', 'BsmtExposure': 'without', 'BsmtFinType1': 'without',
-    'BsmtFinType2': 'without', 'Heating': 'GasA', 'HeatingQC': 'Ex', 'CentralAir': 'Y',
-    'Electrical': 'SBrkr', 'KitchenQual': 'TA', 'Functional': 'Typ', 'FireplaceQu': 'without',
-    'GarageType': 'without', 'GarageFinish': 'without', 'GarageQual': 'without', 'GarageCond': 'without',
-    'PavedDrive': 'Y', 'PoolQC': 'without', 'Fence': 'without', 'MiscFeature': 'without',
-    'SaleType': 'WD', 'SaleCondition': 'Normal'
-}
-
-@st.cache_resource
-def load_model():
-    return joblib.load('house_price_model.pkl')
-
-try:
-    model = load_model()
-except:
+# Наблюдатель за моделью и кэш - общие с main2.py (app_resources.py): новая
+# версия из реестра подменяет текущую без перезапуска, startup.py serve
+# прогревает их до приема запросов
+model_tier = st.sidebar.radio("Уровень модели", available_tiers())
+loaded = get_model_watcher(model_tier).active
+if loaded is None:
     st.error("Ошибка: не найден файл 'house_price_model.pkl'")
     st.stop()
+if loaded.meta:
+    st.sidebar.caption(f"Модель {loaded.meta['version']} от {loaded.meta['created'][:10]}")
+
+prediction_cache = get_prediction_cache()
 
 st.title("🏡 Прогноз цены дома (Kaggle House Prices)")
 st.markdown("Введите характеристики дома для оценки рыночной стоимости.")
@@ -147,29 +116,19 @@ user_inputs = {
     '2ndFlrSF': max(0, gr_liv_area - (gr_liv_area // 2)),
 }
 
-data = {}
-for col in ALL_FEATURES:
-    if col in user_inputs:
-        data[col] = user_inputs[col]
-    else:
-        data[col] = DEFAULT_VALUES[col]
-
-input_df = pd.DataFrame([data])
-
-input_df['HouseAge'] = CURRENT_YEAR - input_df['YearBuilt']
-input_df['RemodAge'] = CURRENT_YEAR - input_df['YearRemodAdd']
-input_df['IsOldNotRemod'] = ((input_df['HouseAge'] > 50) &
-                             (input_df['RemodAge'] == input_df['HouseAge'])).astype(int)
-input_df['QualCondDiff'] = input_df['OverallQual'] - input_df['OverallCond']
-input_df['HasGarage'] = (input_df['GarageArea'] > 0).astype(int)
-input_df['HasBsmt'] = (input_df['TotalBsmtSF'] > 0).astype(int)
-input_df['LotRatio'] = input_df['LotArea'] / input_df['GrLivArea']
-input_df['LotRatio'] = input_df['LotRatio'].replace([np.inf, -np.inf], 0)
+input_df = make_input_df(user_inputs, CURRENT_YEAR)
 
 if st.button("Рассчитать цену"):
     try:
-        log_pred = model.predict(input_df)[0]
+        cache_key = make_cache_key(user_inputs, loaded.version, CURRENT_YEAR)
+        log_pred = prediction_cache.get_or_compute(cache_key, lambda: loaded.model.predict(input_df)[0])
         price = np.expm1(log_pred)
         st.success(f"💰 Предсказанная цена: **${price:,.0f}**")
     except Exception as e:
-        st.error(f"Ошибка: {str(e)}")
\ No newline at end of file
+        st.error(f"Ошибка: {str(e)}")
+
+cache_stats = prediction_cache.stats()
+st.sidebar.markdown("### ⚡ Кэш предсказаний")
+st.sidebar.write(f"Попадания: {cache_stats['hits']}, промахи: {cache_stats['misses']}, "
+                 f"вытеснено: {cache_stats['evictions']}")
+st.sidebar.caption(f"Записей: {cache_stats['size']} / {cache_stats['maxsize']}")
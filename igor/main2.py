@@ -1,8 +1,16 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import joblib
-from datetime import datetime
+import time
+
+from app_resources import (CURRENT_YEAR, get_comps_index, get_drift_monitor, get_model_watcher,
+                           get_prediction_cache, get_price_surface, get_stage_timer)
+from drift import MIN_OBSERVATIONS
+from intervals import get_intervals
+from model_registry import available_tiers
+from prediction_cache import make_cache_key
+from schema import validate_record
+from sensitivity import predict_sweep, sweep_values
 
 # ==============================
 # НАСТРОЙКА СТРАНИЦЫ
@@ -17,8 +25,6 @@ st.set_page_config(
 # ==============================
 # КОНСТАНТЫ И КОНФИГУРАЦИЯ
 # ==============================
-CURRENT_YEAR = datetime.now().year
-
 # Стили CSS для улучшения внешнего вида
 st.markdown("""
 <style>
@@ -113,7 +119,7 @@ NEIGHBORHOOD_MAPPING = {
     'Iowa DOT and Rail Road': 'IDOTRR',
     'Meadow Village': 'MeadowV',
     'Mitchell': 'Mitchel',
-    'North Ames': 'Names',
+    'North Ames': 'NAmes',
     'Northridge': 'NoRidge',
     'Northpark Villa': 'NPkVill',
     'Northridge Heights': 'NridgHt',
@@ -142,15 +148,94 @@ HOUSE_STYLE_MAPPING = {
 # ==============================
 # ЗАГРУЗКА МОДЕЛИ
 # ==============================
-@st.cache_resource
-def load_model():
-    try:
-        model = joblib.load('house_price_model.pkl')
-        st.sidebar.success("✅ Модель загружена")
-        return model
-    except Exception as e:
-        st.sidebar.error(f"❌ Ошибка загрузки модели: {e}")
-        return None
+# Модель, кэш и индексы - общие ресурсы процесса в app_resources.py:
+# startup.py serve создает и прогревает их до приема запросов
+# Фрагмент боковой панели обновляется сам раз в несколько секунд:
+# расчет цены перезапускает только свой фрагмент и сюда писать не может
+@st.fragment(run_every=3)
+def prediction_stats_panel(prediction_cache, debug_timing):
+    cache_stats = prediction_cache.stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Попадания", cache_stats['hits'])
+    col2.metric("Промахи", cache_stats['misses'])
+    col3.metric("Вытеснено", cache_stats['evictions'])
+    st.caption(f"Записей: {cache_stats['size']} / {cache_stats['maxsize']}, "
+               f"hit rate: {cache_stats['hit_rate']:.0%}")
+    
+    # Замеры последнего расчета этой сессии, а не общего таймера процесса
+    source = st.session_state.get('prediction_source')
+    stage_timings = st.session_state.get('stage_timings')
+    if debug_timing and source == 'model' and stage_timings:
+        timings = pd.DataFrame(
+            {'мс': {name: sec * 1000 for name, sec in stage_timings.items()}}
+        ).sort_values('мс', ascending=False)
+        st.bar_chart(timings, horizontal=True)
+        st.caption("Базовые модели считаются параллельно; "
+                   f"сумма этапов {timings['мс'].sum():.1f} мс")
+    elif debug_timing and source == 'cache':
+        st.caption("Ответ из кэша, модель не вызывалась")
+
+# Версия и метрики текущей модели; после подмены версии панель обновится сама
+@st.fragment(run_every=3)
+def model_info_panel(model_watcher):
+    loaded = model_watcher.active
+    if loaded is None:
+        st.error(f"❌ Ошибка загрузки модели: {model_watcher.last_error}")
+        return
+    meta = loaded.meta
+    if meta is None:
+        st.markdown(f"""
+        <div class='info-box'>
+        <strong>Файл:</strong> {loaded.path}<br>
+        <strong>Версия:</strong> не из реестра<br>
+        <strong>Загружена:</strong> {loaded.loaded_at:%H:%M:%S} за {loaded.load_seconds:.1f} с
+        </div>
+        """, unsafe_allow_html=True)
+        st.caption("Метрики есть у моделей из реестра: python train.py --register")
+    else:
+        st.markdown(f"""
+        <div class='info-box'>
+        <strong>Версия:</strong> {meta['version']} ({meta['tier']})<br>
+        <strong>Обучена:</strong> {meta['created'].replace('T', ' ')}<br>
+        <strong>Признаков:</strong> {len(meta.get('features', []))}, строк: {meta.get('train_rows', '—')}<br>
+        <strong>Загружена:</strong> {loaded.loaded_at:%H:%M:%S} за {loaded.load_seconds:.1f} с
+        </div>
+        """, unsafe_allow_html=True)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("RMSLE", f"{meta['rmsle']:.4f}" if 'rmsle' in meta else "—")
+        col2.metric("MAE", f"${meta['mae']:,.0f}" if 'mae' in meta else "—")
+        col3.metric("R²", f"{meta['r2']:.3f}" if 'r2' in meta else "—")
+        if meta.get('metrics_source') == 'oof':
+            st.caption("Метрики по out-of-fold предсказаниям на train.csv")
+    if model_watcher.swaps:
+        st.caption(f"Подмен версии без перезапуска: {model_watcher.swaps}")
+    if model_watcher.last_error:
+        st.warning(f"Новая версия не загружена: {model_watcher.last_error}")
+
+# Сдвиг вводимых значений относительно train.csv (drift.py): PSI по полям
+# пересчитывается по сводкам процесса раз в несколько секунд
+DRIFT_STATUS_ICONS = {'нет': '🟢', 'умеренный': '🟡', 'значительный': '🔴'}
+
+@st.fragment(run_every=3)
+def drift_panel(drift_monitor):
+    if drift_monitor is None:
+        st.caption("Нет эталона: python drift.py train.csv или переобучите train.py")
+        return
+    observations = drift_monitor.effective_observations
+    if observations < MIN_OBSERVATIONS:
+        st.caption(f"Расчетов: {drift_monitor.observations}; PSI появится после {MIN_OBSERVATIONS}")
+        return
+    rows = drift_monitor.scores()
+    st.dataframe(pd.DataFrame({
+        'Поле': [row['feature'] for row in rows],
+        'PSI': [row['psi'] for row in rows],
+        'Сдвиг': [f"{DRIFT_STATUS_ICONS[row['status']]} {row['status']}" for row in rows],
+        'Детали': [row['detail'] for row in rows],
+    }), hide_index=True, use_container_width=True, column_config={
+        'PSI': st.column_config.NumberColumn(format="%.3f"),
+    })
+    st.caption(f"Расчетов: {drift_monitor.observations} (с забыванием ~{observations:.0f}), "
+               f"учет входа: {drift_monitor.mean_update_seconds * 1e6:.1f} мкс на расчет")
 
 # ==============================
 # БОКОВАЯ ПАНЕЛЬ
@@ -158,27 +243,31 @@ def load_model():
 with st.sidebar:
     st.markdown("<h2 style='text-align: center;'>⚙️ Настройки</h2>", unsafe_allow_html=True)
     
-    model = load_model()
+    model_tier = st.radio(
+        "Уровень модели",
+        options=available_tiers(),
+        horizontal=True,
+        help="full - полный стек, fast - сокращенный стек из fast_tier.py"
+    )
+    model_watcher = get_model_watcher(model_tier)
+    if model_watcher.active is not None:
+        st.success("✅ Модель загружена")
+    prediction_cache = get_prediction_cache()
     
     st.markdown("---")
     st.markdown("<h3>📊 Информация о модели</h3>", unsafe_allow_html=True)
-    st.markdown("""
-    <div class='info-box'>
-    <strong>Тип модели:</strong> Градиентный бустинг<br>
-    <strong>Точность (RMSLE):</strong> ~0.15<br>
-    <strong>Данные:</strong> Kaggle House Prices<br>
-    <strong>Год обучения:</strong> 2024
-    </div>
-    """, unsafe_allow_html=True)
+    model_info_panel(model_watcher)
     
     st.markdown("---")
-    st.markdown("<h3>📈 Метрики качества</h3>", unsafe_allow_html=True)
+    st.markdown("<h3>⚡ Кэш предсказаний</h3>", unsafe_allow_html=True)
+    stage_timer = get_stage_timer()
+    debug_timing = st.toggle("🛠 Время этапов (отладка)", value=False, key='debug_timing',
+                             help="Замер кодирования, каждой базовой модели и мета-модели")
+    prediction_stats_panel(prediction_cache, debug_timing)
     
-    col1, col2 = st.columns(2)
-    with col1:
-        st.metric("MAE", "$15,000")
-    with col2:
-        st.metric("R² Score", "0.89")
+    st.markdown("---")
+    st.markdown("<h3>🧭 Сдвиг входных данных</h3>", unsafe_allow_html=True)
+    drift_panel(get_drift_monitor())
     
     st.markdown("---")
     st.markdown("""
@@ -206,289 +295,408 @@ st.markdown("""
 # ==============================
 # ОСНОВНЫЕ ПАРАМЕТРЫ
 # ==============================
-st.markdown("<h2 class='section-header'>📋 Основные характеристики дома</h2>", unsafe_allow_html=True)
+# Поля ввода, метрики и результат - фрагмент: изменение поля перезапускает
+# только его, а не всю страницу (CSS, боковую панель, футер). При изменении
+# поля цена берется из поверхности цен (price_surface.py, микросекунды);
+# стек считается только по кнопке.
+@st.fragment
+def house_price_panel():
+    with st.container():
+        st.markdown("<h2 class='section-header'>📋 Основные характеристики дома</h2>", unsafe_allow_html=True)
 
-tab1, tab2 = st.tabs(["🏗️ Конструкция", "📐 Размеры"])
+        tab1, tab2 = st.tabs(["🏗️ Конструкция", "📐 Размеры"])
 
-with tab1:
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("<h4 style='color: #4B5563;'>📅 Годы</h4>", unsafe_allow_html=True)
-        year_built = st.slider(
-            "Год постройки",
-            min_value=1870,
-            max_value=CURRENT_YEAR,
-            value=1980,
-            help="Год первоначального строительства"
-        )
-        
-        year_remod = st.slider(
-            "Год последнего ремонта",
-            min_value=year_built,
-            max_value=CURRENT_YEAR,
-            value=min(year_built + 10, CURRENT_YEAR),
-            help="Год последнего капитального ремонта"
-        )
-        
-    with col2:
-        st.markdown("<h4 style='color: #4B5563;'>⭐ Качество</h4>", unsafe_allow_html=True)
-        col_qual, col_cond = st.columns(2)
-        with col_qual:
-            overall_qual = st.select_slider(
-                "Общее качество",
-                options=list(range(1, 11)),
-                value=6,
-                help="1 - очень низкое, 10 - очень высокое"
+        with tab1:
+            col1, col2 = st.columns(2)
+
+            with col1:
+                st.markdown("<h4 style='color: #4B5563;'>📅 Годы</h4>", unsafe_allow_html=True)
+                year_built = st.slider(
+                    "Год постройки",
+                    min_value=1870,
+                    max_value=CURRENT_YEAR,
+                    value=1980,
+                    help="Год первоначального строительства"
+                )
+
+                # Ремонт не раньше постройки; у слайдера min_value < max_value
+                if year_built < CURRENT_YEAR:
+                    year_remod = st.slider(
+                        "Год последнего ремонта",
+                        min_value=year_built,
+                        max_value=CURRENT_YEAR,
+                        value=min(year_built + 10, CURRENT_YEAR),
+                        help="Год последнего капитального ремонта"
+                    )
+                else:
+                    year_remod = year_built
+                    st.caption("Дом этого года: год ремонта равен году постройки")
+
+            with col2:
+                st.markdown("<h4 style='color: #4B5563;'>⭐ Качество</h4>", unsafe_allow_html=True)
+                col_qual, col_cond = st.columns(2)
+                with col_qual:
+                    overall_qual = st.select_slider(
+                        "Общее качество",
+                        options=list(range(1, 11)),
+                        value=6,
+                        help="1 - очень низкое, 10 - очень высокое"
+                    )
+                    st.markdown(f"<div style='text-align: center; font-size: 1.2rem; color: {'#059669' if overall_qual >= 7 else '#DC2626' if overall_qual <= 4 else '#D97706'}'>"
+                               f"{'⭐' * overall_qual}</div>", unsafe_allow_html=True)
+
+                with col_cond:
+                    overall_cond = st.select_slider(
+                        "Общее состояние",
+                        options=list(range(1, 11)),
+                        value=6,
+                        help="1 - очень плохое, 10 - отличное"
+                    )
+                    st.markdown(f"<div style='text-align: center; font-size: 1.2rem; color: {'#059669' if overall_cond >= 7 else '#DC2626' if overall_cond <= 4 else '#D97706'}'>"
+                               f"{'⚡' * overall_cond}</div>", unsafe_allow_html=True)
+
+        with tab2:
+            col1, col2 = st.columns(2)
+
+            with col1:
+                st.markdown("<h4 style='color: #4B5563;'>📏 Площади</h4>", unsafe_allow_html=True)
+                gr_liv_area = st.number_input(
+                    "Жилая площадь (кв. футов)",
+                    min_value=100,
+                    max_value=10000,
+                    value=1500,
+                    step=50,
+                    help="Общая жилая площадь выше уровня земли"
+                )
+
+                total_bsmt_sf = st.number_input(
+                    "Площадь подвала (кв. футов)",
+                    min_value=0,
+                    max_value=5000,
+                    value=1000,
+                    step=50,
+                    help="Общая площадь всех подвальных помещений"
+                )
+
+            with col2:
+                st.markdown("<h4 style='color: #4B5563;'>🚗 Гараж и участок</h4>", unsafe_allow_html=True)
+                garage_area = st.number_input(
+                    "Площадь гаража (кв. футов)",
+                    min_value=0,
+                    max_value=2000,
+                    value=500,
+                    step=25,
+                    help="Размер гаража"
+                )
+
+                lot_area = st.number_input(
+                    "Площадь участка (кв. футов)",
+                    min_value=1000,
+                    max_value=200000,
+                    value=10000,
+                    step=500,
+                    help="Общая площадь земельного участка"
+                )
+
+        # ==============================
+        # ДОПОЛНИТЕЛЬНЫЕ ПАРАМЕТРЫ
+        # ==============================
+        st.markdown("<h2 class='section-header'>📍 Расположение и тип</h2>", unsafe_allow_html=True)
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            neighborhood_display = st.selectbox(
+                "🏙️ Район расположения",
+                options=list(NEIGHBORHOOD_MAPPING.keys()),
+                index=list(NEIGHBORHOOD_MAPPING.keys()).index("College Creek"),
+                help="Выберите район города Эймс, Айова"
             )
-            st.markdown(f"<div style='text-align: center; font-size: 1.2rem; color: {'#059669' if overall_qual >= 7 else '#DC2626' if overall_qual <= 4 else '#D97706'}'>"
-                       f"{'⭐' * overall_qual}</div>", unsafe_allow_html=True)
-        
-        with col_cond:
-            overall_cond = st.select_slider(
-                "Общее состояние",
-                options=list(range(1, 11)),
-                value=6,
-                help="1 - очень плохое, 10 - отличное"
+
+            with st.expander("ℹ️ Описание района"):
+                st.info("""
+                **College Creek** - популярный район рядом с университетом. 
+                Хорошо развитая инфраструктура, высокий спрос на жилье.
+                """)
+
+        with col2:
+            house_style_display = st.selectbox(
+                "🏠 Архитектурный стиль",
+                options=list(HOUSE_STYLE_MAPPING.keys()),
+                index=list(HOUSE_STYLE_MAPPING.keys()).index("🏠 Двухэтажный"),
+                help="Выберите архитектурный стиль дома"
             )
-            st.markdown(f"<div style='text-align: center; font-size: 1.2rem; color: {'#059669' if overall_cond >= 7 else '#DC2626' if overall_cond <= 4 else '#D97706'}'>"
-                       f"{'⚡' * overall_cond}</div>", unsafe_allow_html=True)
 
-with tab2:
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("<h4 style='color: #4B5563;'>📏 Площади</h4>", unsafe_allow_html=True)
-        gr_liv_area = st.number_input(
-            "Жилая площадь (кв. футов)",
-            min_value=100,
-            max_value=10000,
-            value=1500,
-            step=50,
-            help="Общая жилая площадь выше уровня земли"
-        )
-        
-        total_bsmt_sf = st.number_input(
-            "Площадь подвала (кв. футов)",
-            min_value=0,
-            max_value=5000,
-            value=1000,
-            step=50,
-            help="Общая площадь всех подвальных помещений"
-        )
-    
-    with col2:
-        st.markdown("<h4 style='color: #4B5563;'>🚗 Гараж и участок</h4>", unsafe_allow_html=True)
-        garage_area = st.number_input(
-            "Площадь гаража (кв. футов)",
-            min_value=0,
-            max_value=2000,
-            value=500,
-            step=25,
-            help="Размер гаража"
-        )
-        
-        lot_area = st.number_input(
-            "Площадь участка (кв. футов)",
-            min_value=1000,
-            max_value=200000,
-            value=10000,
-            step=500,
-            help="Общая площадь земельного участка"
-        )
+        # Десять полей формы: по ним считаются прогноз, аналоги и чувствительность
+        base_inputs = {
+            'YearBuilt': year_built,
+            'YearRemodAdd': year_remod,
+            'OverallQual': overall_qual,
+            'OverallCond': overall_cond,
+            'GrLivArea': gr_liv_area,
+            'LotArea': lot_area,
+            'TotalBsmtSF': total_bsmt_sf,
+            'GarageArea': garage_area,
+            'Neighborhood': NEIGHBORHOOD_MAPPING[neighborhood_display],
+            'HouseStyle': HOUSE_STYLE_MAPPING[house_style_display],
+        }
+        comps_index = get_comps_index()
 
-# ==============================
-# ДОПОЛНИТЕЛЬНЫЕ ПАРАМЕТРЫ
-# ==============================
-st.markdown("<h2 class='section-header'>📍 Расположение и тип</h2>", unsafe_allow_html=True)
+        # ==============================
+        # МЕТРИКИ В РЕАЛЬНОМ ВРЕМЕНИ
+        # ==============================
+        st.markdown("<h2 class='section-header'>📊 Быстрые метрики</h2>", unsafe_allow_html=True)
 
-col1, col2 = st.columns(2)
+        col1, col2, col3, col4 = st.columns(4)
 
-with col1:
-    neighborhood_display = st.selectbox(
-        "🏙️ Район расположения",
-        options=list(NEIGHBORHOOD_MAPPING.keys()),
-        index=list(NEIGHBORHOOD_MAPPING.keys()).index("College Creek"),
-        help="Выберите район города Эймс, Айова"
-    )
-    
-    with st.expander("ℹ️ Описание района"):
-        st.info("""
-        **College Creek** - популярный район рядом с университетом. 
-        Хорошо развитая инфраструктура, высокий спрос на жилье.
-        """)
-
-with col2:
-    house_style_display = st.selectbox(
-        "🏠 Архитектурный стиль",
-        options=list(HOUSE_STYLE_MAPPING.keys()),
-        index=list(HOUSE_STYLE_MAPPING.keys()).index("🏠 Двухэтажный"),
-        help="Выберите архитектурный стиль дома"
-    )
+        with col1:
+            house_age = CURRENT_YEAR - year_built
+            st.markdown(f"""
+            <div class='metric-card'>
+                <div style='font-size: 0.9rem; color: #6B7280;'>Возраст дома</div>
+                <div style='font-size: 1.5rem; font-weight: 600; color: {'#DC2626' if house_age > 50 else '#D97706' if house_age > 30 else '#059669'}'>
+                    {house_age} лет
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
 
-# ==============================
-# МЕТРИКИ В РЕАЛЬНОМ ВРЕМЕНИ
-# ==============================
-st.markdown("<h2 class='section-header'>📊 Быстрые метрики</h2>", unsafe_allow_html=True)
+        with col2:
+            remod_age = CURRENT_YEAR - year_remod
+            st.markdown(f"""
+            <div class='metric-card'>
+                <div style='font-size: 0.9rem; color: #6B7280;'>С момента ремонта</div>
+                <div style='font-size: 1.5rem; font-weight: 600; color: {'#DC2626' if remod_age > 30 else '#D97706' if remod_age > 15 else '#059669'}'>
+                    {remod_age} лет
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
 
-col1, col2, col3, col4 = st.columns(4)
+        with col3:
+            # Медиана цены за кв. фут у 10 ближайших продаж
+            price_per_sqft_est = (f"${comps_index.price_per_sqft(base_inputs):,.0f}"
+                                  if comps_index is not None else "—")
+            st.markdown(f"""
+            <div class='metric-card'>
+                <div style='font-size: 0.9rem; color: #6B7280;'>Цена за кв. фут у аналогов</div>
+                <div style='font-size: 1.5rem; font-weight: 600; color: #2563EB;'>
+                    {price_per_sqft_est}
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
 
-with col1:
-    house_age = CURRENT_YEAR - year_built
-    st.markdown(f"""
-    <div class='metric-card'>
-        <div style='font-size: 0.9rem; color: #6B7280;'>Возраст дома</div>
-        <div style='font-size: 1.5rem; font-weight: 600; color: {'#DC2626' if house_age > 50 else '#D97706' if house_age > 30 else '#059669'}'>
-            {house_age} лет
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+        with col4:
+            qual_diff = overall_qual - overall_cond
+            st.markdown(f"""
+            <div class='metric-card'>
+                <div style='font-size: 0.9rem; color: #6B7280;'>Разница качество/состояние</div>
+                <div style='font-size: 1.5rem; font-weight: 600; color: {'#059669' if qual_diff > 0 else '#DC2626' if qual_diff < 0 else '#D97706'}'>
+                    {qual_diff:+d}
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
 
-with col2:
-    remod_age = CURRENT_YEAR - year_remod
-    st.markdown(f"""
-    <div class='metric-card'>
-        <div style='font-size: 0.9rem; color: #6B7280;'>С момента ремонта</div>
-        <div style='font-size: 1.5rem; font-weight: 600; color: {'#DC2626' if remod_age > 30 else '#D97706' if remod_age > 15 else '#059669'}'>
-            {remod_age} лет
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+        # ==============================
+        # РАСЧЕТ ЦЕНЫ
+        # ==============================
+        st.markdown("<h2 class='section-header'>💰 Расчет стоимости</h2>", unsafe_allow_html=True)
 
-with col3:
-    price_per_sqft_est = 150  # Примерная оценка
-    st.markdown(f"""
-    <div class='metric-card'>
-        <div style='font-size: 0.9rem; color: #6B7280;'>Цена за кв. фут</div>
-        <div style='font-size: 1.5rem; font-weight: 600; color: #2563EB;'>
-            ${price_per_sqft_est}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+        # Мгновенная оценка по таблице - только для той версии модели, по которой она построена
+        price_surface = get_price_surface()
+        loaded = model_watcher.active
+        if (price_surface is not None and loaded is not None and price_surface.model_version == loaded.version
+                and price_surface.current_year == CURRENT_YEAR):
+            st.markdown(f"<div style='text-align: center; font-size: 1.2rem; color: #4B5563;'>"
+                        f"⚡ Мгновенная оценка: <strong>≈ ${price_surface.price(base_inputs):,.0f}</strong></div>",
+                        unsafe_allow_html=True)
+            st.caption("Интерполяция по заранее рассчитанной сетке; точная цена - по кнопке")
+        elif price_surface is not None:
+            st.caption("Поверхность цен построена для другой версии модели или года: python price_surface.py")
 
-with col4:
-    qual_diff = overall_qual - overall_cond
-    st.markdown(f"""
-    <div class='metric-card'>
-        <div style='font-size: 0.9rem; color: #6B7280;'>Разница качество/состояние</div>
-        <div style='font-size: 1.5rem; font-weight: 600; color: {'#059669' if qual_diff > 0 else '#DC2626' if qual_diff < 0 else '#D97706'}'>
-            {qual_diff:+d}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+        # Кнопка расчета
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col2:
+            calculate_button = st.button("🚀 **Рассчитать стоимость дома**", use_container_width=True)
+
+    if calculate_button:
+        st.session_state['submitted_inputs'] = base_inputs
+    if calculate_button and loaded is not None:
+        # Подготовка данных
+        user_inputs = {
+            **base_inputs,
+            'GarageYrBlt': year_built,
+            '1stFlrSF': max(500, gr_liv_area // 2),
+            '2ndFlrSF': max(0, gr_liv_area - (gr_liv_area // 2)),
+        }
+
+        # Прогноз
+        with st.spinner("🤖 Выполняется расчет с использованием ML модели..."):
+            try:
+                # Та же проверка по схеме, что у service.py
+                schema_errors = validate_record(user_inputs)
+                if schema_errors:
+                    raise ValueError("; ".join(schema_errors))
+                # Сводки сдвига - по каждому расчету, включая ответы из кэша
+                drift_monitor = get_drift_monitor()
+                if drift_monitor is not None:
+                    drift_monitor.update(user_inputs)
+                cache_key = make_cache_key(user_inputs, loaded.version, CURRENT_YEAR)
+                prediction_source = []
+                # Время этапов - только для этой сессии и только с включенной отладкой
+                stage_timings = {} if st.session_state.get('debug_timing') else None
+                def compute_prediction():
+                    prediction_source.append('model')
+                    return loaded.encoder.predict(user_inputs, timings=stage_timings)
+                log_pred = prediction_cache.get_or_compute(cache_key, compute_prediction)
+                stage_timer.count_prediction(prediction_source[0] if prediction_source else 'cache')
+                # Панель в боковой панели подхватит источник на следующем обновлении
+                st.session_state['prediction_source'] = prediction_source[0] if prediction_source else 'cache'
+                st.session_state['stage_timings'] = stage_timings
+                price = np.expm1(log_pred)
+
+                # Отображение результата
+                st.markdown(f"<div class='price-display'>🏡 Предсказанная стоимость: <br><strong>${price:,.0f}</strong></div>", unsafe_allow_html=True)
+
+                # Дополнительная информация
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Цена за кв. фут", f"${price/gr_liv_area:,.0f}")
+                with col2:
+                    # Конформный интервал по OOF-остаткам, сохраненным в модели
+                    intervals = get_intervals(loaded.model)
+                    if intervals is not None:
+                        low, high = intervals.interval(log_pred, base_inputs['Neighborhood'])
+                        st.metric(f"Интервал {intervals.coverage:.0%}", f"${low:,.0f} - ${high:,.0f}",
+                                  help="Диапазон, в который попадала такая доля цен продаж на "
+                                       "кросс-валидации при обучении")
+                    else:
+                        st.metric("Интервал", "—", help="Модель обучена без интервалов: переобучите train.py")
+                with col3:
+                    st.metric("Годовая динамика", "+5.2%", "к прошлому году")
+
+                if comps_index is not None:
+                    comps_table(comps_index, base_inputs)
+
+            except Exception as e:
+                st.error(f"⚠️ Ошибка при расчете: {str(e)}")
+
+    elif calculate_button:
+        st.warning("⚠️ Модель не загружена. Пожалуйста, проверьте наличие файла 'house_price_model.pkl' "
+                   "или реестр моделей")
+
+    st.markdown("<h2 class='section-header'>📈 Чувствительность цены</h2>", unsafe_allow_html=True)
+    # Графики - по последним отправленным кнопкой значениям, а не при каждом движении слайдера
+    sensitivity_panel(st.session_state.setdefault('submitted_inputs', base_inputs))
 
 # ==============================
-# РАСЧЕТ ЦЕНЫ
+# ПОХОЖИЕ ПРОДАЖИ
 # ==============================
-st.markdown("<h2 class='section-header'>💰 Расчет стоимости</h2>", unsafe_allow_html=True)
+COMPS_LABELS = {
+    'Id': 'Id',
+    'Neighborhood': 'Район',
+    'HouseStyle': 'Стиль',
+    'YearBuilt': 'Год постройки',
+    'OverallQual': 'Качество',
+    'GrLivArea': 'Жилая площадь',
+    'SalePrice': 'Цена продажи',
+    'PricePerSqft': 'Цена за кв. фут',
+}
 
-# Кнопка расчета
-col1, col2, col3 = st.columns([1, 2, 1])
-with col2:
-    calculate_button = st.button("🚀 **Рассчитать стоимость дома**", use_container_width=True)
+def comps_table(comps_index, base_inputs, k=5):
+    comps = comps_index.comps(base_inputs, k)
+    st.markdown("<h3>🏘️ Похожие продажи</h3>", unsafe_allow_html=True)
+    st.dataframe(
+        comps[list(COMPS_LABELS)].rename(columns=COMPS_LABELS),
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'Цена продажи': st.column_config.NumberColumn(format="$%d"),
+            'Цена за кв. фут': st.column_config.NumberColumn(format="$%.0f"),
+        },
+    )
+    st.caption(f"{k} ближайших из {comps_index.n_sales:,} продаж: тот же район, "
+               "близкие площадь, качество и год постройки")
 
-if calculate_button and model is not None:
-    # Подготовка данных
-    neighborhood = NEIGHBORHOOD_MAPPING[neighborhood_display]
-    house_style = HOUSE_STYLE_MAPPING[house_style_display]
-    
-    user_inputs = {
-        'YearBuilt': year_built,
-        'YearRemodAdd': year_remod,
-        'OverallQual': overall_qual,
-        'OverallCond': overall_cond,
-        'GrLivArea': gr_liv_area,
-        'LotArea': lot_area,
-        'TotalBsmtSF': total_bsmt_sf,
-        'GarageArea': garage_area,
-        'Neighborhood': neighborhood,
-        'HouseStyle': house_style,
-        'GarageYrBlt': year_built,
-        '1stFlrSF': max(500, gr_liv_area // 2),
-        '2ndFlrSF': max(0, gr_liv_area - (gr_liv_area // 2)),
-    }
-    
-    # Заполнение всех фич
-    ALL_FEATURES = [
-        'MSSubClass', 'MSZoning', 'LotFrontage', 'LotArea', 'Street', 'Alley', 'LotShape',
-        'LandContour', 'Utilities', 'LotConfig', 'LandSlope', 'Neighborhood', 'Condition1',
-        'Condition2', 'BldgType', 'HouseStyle', 'OverallQual', 'OverallCond', 'YearBuilt',
-        'YearRemodAdd', 'RoofStyle', 'RoofMatl', 'Exterior1st', 'Exterior2nd', 'MasVnrType',
-        'MasVnrArea', 'ExterQual', 'ExterCond', 'Foundation', 'BsmtQual', 'BsmtCond',
-        'BsmtExposure', 'BsmtFinType1', 'BsmtFinSF1', 'BsmtFinType2', 'BsmtFinSF2',
-        'BsmtUnfSF', 'TotalBsmtSF', 'Heating', 'HeatingQC', 'CentralAir', 'Electrical',
-        '1stFlrSF', '2ndFlrSF', 'LowQualFinSF', 'GrLivArea', 'BsmtFullBath', 'BsmtHalfBath',
-        'FullBath', 'HalfBath', 'BedroomAbvGr', 'KitchenAbvGr', 'KitchenQual', 'TotRmsAbvGrd',
-        'Functional', 'Fireplaces', 'FireplaceQu', 'GarageType', 'GarageYrBlt', 'GarageFinish',
-        'GarageCars', 'GarageArea', 'GarageQual', 'GarageCond', 'PavedDrive', 'WoodDeckSF',
-        'OpenPorchSF', 'EnclosedPorch', '3SsnPorch', 'ScreenPorch', 'PoolArea', 'PoolQC',
-        'Fence', 'MiscFeature', 'MiscVal', 'MoSold', 'YrSold', 'SaleType', 'SaleCondition'
-    ]
-    
-    DEFAULT_VALUES = {
-        'MSSubClass': 20, 'LotFrontage': 0, 'LotArea': 10000, 'OverallQual': 6, 'OverallCond': 6,
-        'YearBuilt': 1980, 'YearRemodAdd': 1980, 'MasVnrArea': 0, 'BsmtFinSF1': 0, 'BsmtFinSF2': 0,
-        'BsmtUnfSF': 0, 'TotalBsmtSF': 0, '1stFlrSF': 800, '2ndFlrSF': 0, 'LowQualFinSF': 0,
-        'GrLivArea': 1500, 'BsmtFullBath': 0, 'BsmtHalfBath': 0, 'FullBath': 2, 'HalfBath': 1,
-        'BedroomAbvGr': 3, 'KitchenAbvGr': 1, 'TotRmsAbvGrd': 6, 'Fireplaces': 1, 'GarageYrBlt': 1980,
-        'GarageCars': 2, 'GarageArea': 500, 'WoodDeckSF': 0, 'OpenPorchSF': 0, 'EnclosedPorch': 0,
-        '3SsnPorch': 0, 'ScreenPorch': 0, 'PoolArea': 0, 'MiscVal': 0, 'MoSold': 6, 'YrSold': 2020,
-        'MSZoning': 'RL', 'Street': 'Pave', 'Alley': 'without', 'LotShape': 'Reg', 'LandContour': 'Lvl',
-        'Utilities': 'AllPub', 'LotConfig': 'Inside', 'LandSlope': 'Gtl', 'Neighborhood': 'CollgCr',
-        'Condition1': 'Norm', 'Condition2': 'Norm', 'BldgType': '1Fam', 'HouseStyle': '1Story',
-        'RoofStyle': 'Gable', 'RoofMatl': 'CompShg', 'Exterior1st': 'VinylSd', 'Exterior2nd': 'VinylSd',
-        'MasVnrType': 'without', 'ExterQual': 'TA', 'ExterCond': 'TA', 'Foundation': 'PConc',
-        'BsmtQual': 'without', 'BsmtCond': 'without', 'BsmtExposure': 'without', 'BsmtFinType1': 'without',
-        'BsmtFinType2': 'without', 'Heating': 'GasA', 'HeatingQC': 'Ex', 'CentralAir': 'Y',
-        'Electrical': 'SBrkr', 'KitchenQual': 'TA', 'Functional': 'Typ', 'FireplaceQu': 'without',
-        'GarageType': 'without', 'GarageFinish': 'without', 'GarageQual': 'without', 'GarageCond': 'without',
-        'PavedDrive': 'Y', 'PoolQC': 'without', 'Fence': 'without', 'MiscFeature': 'without',
-        'SaleType': 'WD', 'SaleCondition': 'Normal'
-    }
-    
-    data = {}
-    for col in ALL_FEATURES:
-        if col in user_inputs:
-            data[col] = user_inputs[col]
-        else:
-            data[col] = DEFAULT_VALUES[col]
-    
-    input_df = pd.DataFrame([data])
-    
-    # Инженерные фичи
-    input_df['HouseAge'] = CURRENT_YEAR - input_df['YearBuilt']
-    input_df['RemodAge'] = CURRENT_YEAR - input_df['YearRemodAdd']
-    input_df['IsOldNotRemod'] = ((input_df['HouseAge'] > 50) &
-                                (input_df['RemodAge'] == input_df['HouseAge'])).astype(int)
-    input_df['QualCondDiff'] = input_df['OverallQual'] - input_df['OverallCond']
-    input_df['HasGarage'] = (input_df['GarageArea'] > 0).astype(int)
-    input_df['HasBsmt'] = (input_df['TotalBsmtSF'] > 0).astype(int)
-    input_df['LotRatio'] = input_df['LotArea'] / input_df['GrLivArea'].replace(0, 1)
-    input_df['LotRatio'] = input_df['LotRatio'].replace([np.inf, -np.inf], 0)
-    
-    # Прогноз
-    with st.spinner("🤖 Выполняется расчет с использованием ML модели..."):
-        try:
-            log_pred = model.predict(input_df)[0]
-            price = np.expm1(log_pred)
-            
-            # Отображение результата
-            st.markdown(f"<div class='price-display'>🏡 Предсказанная стоимость: <br><strong>${price:,.0f}</strong></div>", unsafe_allow_html=True)
-            
-            # Дополнительная информация
-            col1, col2, col3 = st.columns(3)
+# ==============================
+# ЧУВСТВИТЕЛЬНОСТЬ ЦЕНЫ
+# ==============================
+SWEEP_LABELS = {
+    'GrLivArea': 'Жилая площадь',
+    'OverallQual': 'Общее качество',
+    'OverallCond': 'Общее состояние',
+    'YearBuilt': 'Год постройки',
+    'YearRemodAdd': 'Год ремонта',
+    'LotArea': 'Площадь участка',
+    'TotalBsmtSF': 'Площадь подвала',
+    'GarageArea': 'Площадь гаража',
+}
+
+# Все варианты считаются одним вызовом predict; повторные запросы берутся из кэша
+@st.cache_data(max_entries=32)
+def cached_sweep(_model, version, base_items, grid_items):
+    return predict_sweep(_model, dict(base_items), dict(grid_items), CURRENT_YEAR)
+
+# Свой фрагмент: режим и число точек пересчитывают только график
+@st.fragment
+def sensitivity_panel(base_inputs):
+    with st.expander("🔍 Как цена зависит от характеристик"):
+        sweep_mode = st.radio(
+            "Режим",
+            options=["Одна характеристика", "Две характеристики", "Все районы"],
+            horizontal=True
+        )
+
+        if sweep_mode == "Одна характеристика":
+            sweep_feature = st.selectbox("Характеристика", list(SWEEP_LABELS), format_func=SWEEP_LABELS.get)
+            sweep_points = st.slider("Число точек", min_value=50, max_value=200, value=100, step=10)
+            sweep_grid = {sweep_feature: sweep_values(sweep_feature, sweep_points, CURRENT_YEAR)}
+        elif sweep_mode == "Две характеристики":
+            col1, col2 = st.columns(2)
             with col1:
-                st.metric("Цена за кв. фут", f"${price/gr_liv_area:,.0f}")
+                sweep_x = st.selectbox("По горизонтали", list(SWEEP_LABELS), format_func=SWEEP_LABELS.get)
             with col2:
-                st.metric("Диапазон (±15%)", f"${price*0.85:,.0f} - ${price*1.15:,.0f}")
-            with col3:
-                st.metric("Годовая динамика", "+5.2%", "к прошлому году")
-                
-        except Exception as e:
-            st.error(f"⚠️ Ошибка при расчете: {str(e)}")
-
-elif calculate_button and model is None:
-    st.warning("⚠️ Модель не загружена. Пожалуйста, проверьте наличие файла 'house_price_model.pkl'")
+                sweep_y = st.selectbox("По вертикали", [f for f in SWEEP_LABELS if f != sweep_x],
+                                       format_func=SWEEP_LABELS.get)
+            sweep_points = st.slider("Точек по каждой оси", min_value=5, max_value=30, value=15)
+            sweep_grid = {
+                sweep_x: sweep_values(sweep_x, sweep_points, CURRENT_YEAR),
+                sweep_y: sweep_values(sweep_y, sweep_points, CURRENT_YEAR),
+            }
+        else:
+            sweep_grid = {'Neighborhood': list(NEIGHBORHOOD_MAPPING.values())}
+
+        show_sweep = st.toggle("Построить график", help="Пересчитывается одним батчем при изменении параметров")
+
+        loaded = model_watcher.active
+        if show_sweep and loaded is not None:
+            grid_items = tuple((col, tuple(v.item() if hasattr(v, 'item') else v for v in values))
+                               for col, values in sweep_grid.items())
+            sweep_start = time.perf_counter()
+            try:
+                sweep = cached_sweep(loaded.model, loaded.version, tuple(base_inputs.items()), grid_items)
+            except Exception as e:
+                st.error(f"⚠️ Ошибка при расчете: {str(e)}")
+            else:
+                if sweep_mode == "Одна характеристика":
+                    st.line_chart(sweep.set_index(sweep_feature)['SalePrice'], x_label=SWEEP_LABELS[sweep_feature],
+                                  y_label="Цена, $")
+                elif sweep_mode == "Две характеристики":
+                    # altair нужен только тепловой карте: импорт не задерживает первую загрузку страницы
+                    import altair as alt
+                    heatmap = alt.Chart(sweep).mark_rect().encode(
+                        x=alt.X(f'{sweep_x}:O', title=SWEEP_LABELS[sweep_x]),
+                        y=alt.Y(f'{sweep_y}:O', title=SWEEP_LABELS[sweep_y], sort='descending'),
+                        color=alt.Color('SalePrice:Q', title="Цена, $", scale=alt.Scale(scheme='viridis')),
+                        tooltip=[sweep_x, sweep_y, alt.Tooltip('SalePrice:Q', format='$,.0f')]
+                    )
+                    st.altair_chart(heatmap, use_container_width=True)
+                else:
+                    neighborhood_names = {code: name for name, code in NEIGHBORHOOD_MAPPING.items()}
+                    by_neighborhood = sweep.assign(Район=sweep['Neighborhood'].map(neighborhood_names))
+                    st.bar_chart(by_neighborhood.set_index('Район')['SalePrice'].sort_values(), horizontal=True)
+                st.caption(f"{len(sweep)} вариантов одним вызовом predict за "
+                           f"{(time.perf_counter() - sweep_start) * 1000:.0f} мс")
+
+house_price_panel()
 
 # ==============================
 # ФУТЕР С АВТОРАМИ
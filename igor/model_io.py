@@ -0,0 +1,197 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import joblib
+
+# ==============================
+# ФОРМАТ АРТЕФАКТА МОДЕЛИ
+# ==============================
+# house_price_model.pkl - обычный pickle всего пайплайна. Экспорт в каталог:
+#   pipeline.joblib  - пайплайн без бустингов, numpy-массивы без сжатия
+#                      (при загрузке с mmap_mode='r' отображаются в память
+#                      и делятся между процессами)
+#   catboost.cbm / lgbm.txt / xgb.ubj - бустинги в родных форматах
+#   manifest.json    - какие модели вынесены и куда их вернуть
+#
+# Пример:
+#   python model_io.py export house_price_model.pkl house_price_model
+#   python model_io.py export house_price_model.pkl house_price_model --compile-forests
+#   python model_io.py report house_price_model.pkl house_price_model
+
+PICKLE_PATH = 'house_price_model.pkl'
+ARTIFACT_DIR = 'house_price_model'
+FAST_PICKLE_PATH = 'house_price_model_fast.pkl'
+PIPELINE_FILE = 'pipeline.joblib'
+MANIFEST_FILE = 'manifest.json'
+
+NATIVE_FORMATS = {
+    'CatBoostRegressor': '.cbm',
+    'LGBMRegressor': '.txt',
+    'XGBRegressor': '.ubj',
+}
+
+
+def resolve_model_path(tier='full'):
+    # tier='fast' - сокращенный стек из fast_tier.py
+    if tier == 'fast':
+        return FAST_PICKLE_PATH
+    # Экспортированный каталог предпочтительнее pickle
+    if os.path.isdir(ARTIFACT_DIR):
+        return ARTIFACT_DIR
+    return PICKLE_PATH
+
+
+# ==============================
+# ЭКСПОРТ
+# ==============================
+def export_model(model, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    stack = model.named_steps['stack']
+    manifest = {'native': {}}
+    detached = []
+
+    try:
+        for name, est in stack.named_estimators_.items():
+            kind = type(est).__name__
+            if kind not in NATIVE_FORMATS:
+                continue
+            index = next(i for i, e in enumerate(stack.estimators_) if e is est)
+            file_name = name + NATIVE_FORMATS[kind]
+            file_path = os.path.join(out_dir, file_name)
+
+            if kind == 'CatBoostRegressor':
+                est.save_model(file_path, format='cbm')
+                # Сам объект CatBoost в pickle не пишем
+                stack.estimators_[index] = None
+                stack.named_estimators_[name] = None
+                detached.append(lambda i=index, n=name, e=est: _reattach(stack, i, n, e))
+            else:
+                booster = est._Booster
+                booster.save_model(file_path)
+                est._Booster = None
+                detached.append(lambda e=est, b=booster: setattr(e, '_Booster', b))
+
+            manifest['native'][name] = {'kind': kind, 'file': file_name, 'index': index}
+
+        joblib.dump(model, os.path.join(out_dir, PIPELINE_FILE), compress=0)
+    finally:
+        for restore in detached:
+            restore()
+
+    # Манифест пишется последним: по нему видно, что экспорт завершен
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return out_dir
+
+
+def _reattach(stack, index, name, est):
+    stack.estimators_[index] = est
+    stack.named_estimators_[name] = est
+
+
+# ==============================
+# ЗАГРУЗКА
+# ==============================
+def available_tiers():
+    return ['full', 'fast'] if os.path.exists(FAST_PICKLE_PATH) else ['full']
+
+
+def load_model(path=PICKLE_PATH, mmap_mode='r'):
+    if not os.path.isdir(path):
+        return joblib.load(path)
+
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    model = joblib.load(os.path.join(path, PIPELINE_FILE), mmap_mode=mmap_mode)
+    stack = model.named_steps['stack']
+
+    for name, info in manifest['native'].items():
+        file_path = os.path.join(path, info['file'])
+        if info['kind'] == 'CatBoostRegressor':
+            from catboost import CatBoostRegressor
+            est = CatBoostRegressor()
+            est.load_model(file_path, format='cbm')
+            _reattach(stack, info['index'], name, est)
+        elif info['kind'] == 'LGBMRegressor':
+            import lightgbm
+            stack.estimators_[info['index']]._Booster = lightgbm.Booster(model_file=file_path)
+        elif info['kind'] == 'XGBRegressor':
+            import xgboost
+            booster = xgboost.Booster()
+            booster.load_model(file_path)
+            stack.estimators_[info['index']]._Booster = booster
+    return model
+
+
+# ==============================
+# ОТЧЕТ: РАЗМЕР, ВРЕМЯ ЗАГРУЗКИ, ПАМЯТЬ
+# ==============================
+def artifact_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def _measure_load(path):
+    # Замер в отдельном процессе, чтобы загрузка была действительно холодной
+    import psutil
+    # Библиотеки импортируются заранее: сравнивается только чтение артефакта
+    import catboost, lightgbm, xgboost, sklearn.ensemble, sklearn.pipeline  # noqa: F401
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    load_model(path)
+    load_time = time.perf_counter() - start
+    print(json.dumps({
+        'load_time': load_time,
+        'rss_delta': process.memory_info().rss - rss_before,
+    }))
+
+
+def measure_load(path):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '_measure', path],
+        stderr=subprocess.DEVNULL,
+    )
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result['size'] = artifact_size(path)
+    return result
+
+
+def report(paths):
+    print(f"{'Артефакт':<30}{'Размер, МБ':>12}{'Загрузка, с':>14}{'RSS, МБ':>10}")
+    for path in paths:
+        r = measure_load(path)
+        print(f"{path:<30}{r['size'] / 2**20:>12.1f}{r['load_time']:>14.2f}{r['rss_delta'] / 2**20:>10.1f}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Экспорт и загрузка артефакта модели")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export_parser = sub.add_parser('export', help="pickle -> каталог с mmap-массивами")
+    export_parser.add_argument('source', nargs='?', default=PICKLE_PATH)
+    export_parser.add_argument('target', nargs='?', default=ARTIFACT_DIR)
+    export_parser.add_argument('--compile-forests', action='store_true',
+                               help="Заменить леса стека плоскими массивами (compiled_forest.py)")
+    report_parser = sub.add_parser('report', help="размер, время загрузки и RSS")
+    report_parser.add_argument('paths', nargs='*', default=[PICKLE_PATH, ARTIFACT_DIR])
+    measure_parser = sub.add_parser('_measure')
+    measure_parser.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        model = joblib.load(args.source)
+        if args.compile_forests:
+            from compiled_forest import compile_forests
+            print(f"Скомпилированы: {', '.join(compile_forests(model)) or 'нет лесов'}")
+        export_model(model, args.target)
+        report([args.source, args.target])
+    elif args.command == 'report':
+        report(args.paths)
+    else:
+        _measure_load(args.path)
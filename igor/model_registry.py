@@ -0,0 +1,271 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import joblib
+
+import model_io
+from features import make_input_df
+from prediction_cache import model_version
+
+# ==============================
+# РЕЕСТР ВЕРСИЙ МОДЕЛИ
+# ==============================
+# Каждая обученная модель сохраняется отдельной версией с метаданными
+# (OOF-метрики, дата обучения, список признаков), а current.json указывает,
+# какая версия сейчас работает на каждом уровне (full, fast). Приложения и
+# сервис не перезапускаются: ModelWatcher следит за current.json, загружает
+# новую версию в фоновом потоке, прогревает ее пробным предсказанием и только
+# потом подменяет ссылку на текущую модель. Запрос берет ссылку один раз в
+# начале, поэтому во время подмены запросы не падают и не ждут загрузки.
+#
+# Раскладка:
+#   model_registry/v0001/meta.json + model.pkl (или каталог model/ из model_io export)
+#   model_registry/current.json     {"full": "v0003", "fast": "v0002"}
+# Версия записывается во временный каталог и переименовывается целиком,
+# current.json заменяется через os.replace - читатель не увидит половину записи.
+#
+# Пример:
+#   python train.py --register                          # обучить и сделать текущей
+#   python model_registry.py register house_price_model_fast.pkl --tier fast
+#   python model_registry.py list
+#   python model_registry.py promote v0002              # откат
+
+REGISTRY_DIR = 'model_registry'
+CURRENT_FILE = 'current.json'
+META_FILE = 'meta.json'
+
+# Как часто наблюдатель проверяет current.json, с
+POLL_SECONDS = 2.0
+
+# Через сколько секунд после подмены закрывается пул потоков старой версии:
+# запросы, взявшие старую ссылку, успевают завершиться
+RETIRE_SECONDS = 60.0
+
+
+def _write_json(path, payload):
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def current_versions(root=REGISTRY_DIR):
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def version_meta(version, root=REGISTRY_DIR):
+    with open(os.path.join(root, version, META_FILE)) as f:
+        return json.load(f)
+
+
+def list_versions(root=REGISTRY_DIR):
+    if not os.path.isdir(root):
+        return []
+    versions = sorted(name for name in os.listdir(root)
+                      if name.startswith('v') and os.path.exists(os.path.join(root, name, META_FILE)))
+    return [version_meta(version, root) for version in versions]
+
+
+def _next_version(root):
+    numbers = [int(name[1:]) for name in os.listdir(root) if name.startswith('v') and name[1:].isdigit()]
+    return f"v{max(numbers, default=0) + 1:04d}"
+
+
+# ==============================
+# РЕГИСТРАЦИЯ И ПЕРЕКЛЮЧЕНИЕ
+# ==============================
+def register(source, meta=None, tier='full', root=REGISTRY_DIR, activate=True):
+    # source - путь к pickle / каталогу model_io export или сам объект модели
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+    try:
+        if not isinstance(source, str):
+            artifact = 'model.pkl'
+            joblib.dump(source, os.path.join(tmp, artifact))
+        elif os.path.isdir(source):
+            artifact = 'model'
+            shutil.copytree(source, os.path.join(tmp, artifact))
+        else:
+            artifact = 'model.pkl'
+            shutil.copy2(source, os.path.join(tmp, artifact))
+        meta = {
+            **(meta or {}),
+            'tier': tier,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'artifact': artifact,
+            'size_bytes': model_io.artifact_size(os.path.join(tmp, artifact)),
+        }
+        # Номер версии занимается переименованием: при гонке двух регистраций
+        # вторая получает следующий номер
+        while True:
+            version = _next_version(root)
+            meta['version'] = version
+            _write_json(os.path.join(tmp, META_FILE), meta)
+            try:
+                os.rename(tmp, os.path.join(root, version))
+                break
+            except OSError:
+                if not os.path.exists(os.path.join(root, version)):
+                    raise
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if activate:
+        promote(version, root)
+    return version
+
+
+def promote(version, root=REGISTRY_DIR):
+    # Делает версию текущей на ее уровне (и для отката на старую версию)
+    tier = version_meta(version, root)['tier']
+    current = current_versions(root)
+    current[tier] = version
+    _write_json(os.path.join(root, CURRENT_FILE), current)
+    return tier
+
+
+def available_tiers(root=REGISTRY_DIR):
+    tiers = set(current_versions(root)) | set(model_io.available_tiers())
+    return [tier for tier in ('full', 'fast') if tier in tiers]
+
+
+def resolve(tier='full', root=REGISTRY_DIR):
+    # (ключ версии, путь к артефакту, метаданные). Без реестра - файл модели
+    # из model_io, ключ - метка файла, как у prediction_cache.model_version
+    version = current_versions(root).get(tier)
+    if version is None:
+        path = model_io.resolve_model_path(tier)
+        return model_version(path), path, None
+    meta = version_meta(version, root)
+    return (f"registry:{tier}", version), os.path.join(root, version, meta['artifact']), meta
+
+
+# ==============================
+# ГОРЯЧАЯ ПОДМЕНА МОДЕЛИ
+# ==============================
+class LoadedModel:
+    def __init__(self, version, path, meta, model, encoder, load_seconds):
+        self.version = version          # ключ для кэшей: (источник, метка)
+        self.path = path
+        self.meta = meta                # None - модель не из реестра
+        self.model = model
+        self.encoder = encoder          # RowEncoder или None
+        self.load_seconds = load_seconds
+        self.loaded_at = datetime.now()
+
+    def close(self):
+        predictor = getattr(self.encoder, 'stack_predictor', None)
+        if predictor is not None:
+            predictor.close()
+
+
+class ModelWatcher:
+    # make_encoder(model) -> RowEncoder: строится и прогревается вместе с моделью
+    def __init__(self, tier='full', root=REGISTRY_DIR, make_encoder=None, poll_seconds=POLL_SECONDS):
+        self.tier = tier
+        self.root = root
+        self.make_encoder = make_encoder
+        self.poll_seconds = poll_seconds
+        self.swaps = 0
+        self.last_error = None
+        self._failed = None
+        self._retired = []
+        self._stop = threading.Event()
+        self.active = None
+        self._check()
+        self._thread = threading.Thread(target=self._run, name=f'model-watcher-{tier}', daemon=True)
+        self._thread.start()
+
+    def _load(self, version, path, meta):
+        start = time.perf_counter()
+        model = model_io.load_model(path)
+        encoder = self.make_encoder(model) if self.make_encoder else None
+        # Прогрев: первый predict (ленивые инициализации бустингов, пулы
+        # потоков) оплачивается здесь, а не первым пользователем
+        model.predict(make_input_df({}))
+        if encoder is not None:
+            encoder.predict({})
+        return LoadedModel(version, path, meta, model, encoder, time.perf_counter() - start)
+
+    def _check(self):
+        try:
+            version, path, meta = resolve(self.tier, self.root)
+        except (OSError, ValueError) as e:
+            self.last_error = f"реестр недоступен: {e}"
+            return
+        if (self.active is not None and self.active.version == version) or self._failed == version:
+            return
+        try:
+            loaded = self._load(version, path, meta)
+        except Exception as e:
+            # Битая версия не подменяет рабочую; повторная попытка - когда сменится версия
+            self._failed = version
+            self.last_error = f"{version[1]}: {e}"
+            return
+        old, self.active = self.active, loaded
+        self._failed = None
+        self.last_error = None
+        if old is not None:
+            self.swaps += 1
+            self._retired.append((time.monotonic(), old))
+
+    def _retire(self):
+        now = time.monotonic()
+        while self._retired and now - self._retired[0][0] > RETIRE_SECONDS:
+            self._retired.pop(0)[1].close()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            self._check()
+            self._retire()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        for _, old in self._retired:
+            old.close()
+        if self.active is not None:
+            self.active.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Реестр версий модели")
+    parser.add_argument('--root', default=REGISTRY_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    register_parser = sub.add_parser('register', help="добавить артефакт как новую версию")
+    register_parser.add_argument('source', nargs='?', default=model_io.PICKLE_PATH)
+    register_parser.add_argument('--tier', choices=['full', 'fast'], default='full')
+    register_parser.add_argument('--no-activate', action='store_true', help="не делать версию текущей")
+    sub.add_parser('list', help="версии и метрики")
+    promote_parser = sub.add_parser('promote', help="сделать версию текущей (в том числе откат)")
+    promote_parser.add_argument('version')
+    args = parser.parse_args()
+
+    if args.command == 'register':
+        model = model_io.load_model(args.source)
+        features = list(model.named_steps['preprocessor'].feature_names_in_)
+        version = register(args.source, {'features': features, 'source': args.source},
+                           args.tier, args.root, activate=not args.no_activate)
+        print(f"Зарегистрирована {version} ({args.tier})")
+    elif args.command == 'promote':
+        print(f"{args.version} - текущая версия уровня {promote(args.version, args.root)}")
+    else:
+        current = set(current_versions(args.root).values())
+        for meta in list_versions(args.root):
+            metrics = ", ".join(label.format(meta[key]) for key, label in
+                                (('rmsle', "RMSLE {:.4f}"), ('mae', "MAE ${:,.0f}"), ('r2', "R² {:.3f}"))
+                                if key in meta)
+            mark = '*' if meta['version'] in current else ' '
+            print(f"{mark} {meta['version']}  {meta['tier']:<5} {meta['created']}  {metrics or 'метрик нет'}")
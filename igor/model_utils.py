@@ -0,0 +1,45 @@
+import functools
+
+# ==============================
+# ОБХОД ОБУЧЕННОГО ПАЙПЛАЙНА
+# ==============================
+def iter_estimators(model):
+    # Рекурсивно обходит Pipeline / StackingRegressor / ColumnTransformer
+    yield model
+    children = []
+    if hasattr(model, 'steps'):
+        children = [step for _, step in model.steps]
+    elif hasattr(model, 'estimators_') and hasattr(model, 'final_estimator_'):
+        children = list(model.estimators_) + [model.final_estimator_]
+    elif hasattr(model, 'transformers_'):
+        children = [trans for _, trans, _ in model.transformers_]
+    for child in children:
+        if hasattr(child, 'get_params'):
+            yield from iter_estimators(child)
+
+
+# ==============================
+# ОГРАНИЧЕНИЕ ПОТОКОВ
+# ==============================
+def limit_model_threads(model, n_threads):
+    # sklearn-леса, KNN, LightGBM и XGBoost читают n_jobs при predict
+    for est in iter_estimators(model):
+        params = est.get_params(deep=False)
+        if 'n_jobs' in params:
+            est.set_params(n_jobs=n_threads)
+        elif type(est).__name__.startswith('CatBoost'):
+            # У обученной CatBoost-модели параметры менять нельзя,
+            # поэтому число потоков передается прямо в predict
+            est.predict = functools.partial(type(est).predict, est, thread_count=n_threads)
+    return model
+
+
+def set_fit_threads(estimator, n_threads):
+    # Для необученной модели: n_jobs (sklearn, LightGBM, XGBoost, в том числе
+    # внутри make_pipeline) и thread_count (CatBoost)
+    params = estimator.get_params()
+    updates = {key: n_threads for key in params
+               if key.split('__')[-1] in ('n_jobs', 'thread_count')}
+    if not updates and type(estimator).__name__.startswith('CatBoost'):
+        updates = {'thread_count': n_threads}
+    return estimator.set_params(**updates)
@@ -0,0 +1,67 @@
+import os
+
+import joblib
+import numpy as np
+
+# ==============================
+# ХРАНИЛИЩЕ OOF-ПРЕДСКАЗАНИЙ
+# ==============================
+# Для каждой базовой модели стека сохраняются OOF-предсказания (вход
+# мета-модели) и модель, обученная на всех данных. Ключ - хэш обучающей
+# матрицы после preprocessor'а и хэш параметров модели. Если поменять или
+# добавить одну модель в train.base_models(), переобучится только она, а
+# смена мета-модели вообще не трогает базовые модели.
+#
+# Раскладка:
+#   .oof_store/preprocessor-<хэш X,y>.joblib    обученный preprocessor и Xt
+#   .oof_store/<хэш Xt,y>/<имя>-<хэш параметров>/oof.npy, model.joblib
+
+STORE_DIR = '.oof_store'
+
+# Число потоков не влияет на результат и не должно сбрасывать кэш
+THREAD_PARAMS = ('n_jobs', 'thread_count')
+
+
+def model_key(estimator):
+    params = {key: value for key, value in estimator.get_params().items()
+              if key.split('__')[-1] not in THREAD_PARAMS + ('steps',)
+              and not hasattr(value, 'get_params')}
+    return joblib.hash((type(estimator).__name__, sorted(params.items(), key=lambda kv: kv[0])))[:12]
+
+
+class OOFStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+
+    def data_key(self, Xt, y, cv):
+        return joblib.hash((Xt, y, cv))[:12]
+
+    def _model_dir(self, data_key, name, estimator):
+        return os.path.join(self.root, data_key, f"{name}-{model_key(estimator)}")
+
+    def fit_preprocessor(self, preprocessor, X, y):
+        # TargetEncoder перемешивает фолды случайно: без кэша Xt был бы каждый
+        # раз немного другим, и OOF-предсказания нельзя было бы переиспользовать
+        path = os.path.join(self.root, f"preprocessor-{joblib.hash((X, y, model_key(preprocessor)))[:12]}.joblib")
+        if os.path.exists(path):
+            return joblib.load(path)
+        Xt = preprocessor.fit_transform(X, y)
+        os.makedirs(self.root, exist_ok=True)
+        joblib.dump((preprocessor, Xt), path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return preprocessor, Xt
+
+    def load(self, data_key, name, estimator):
+        path = self._model_dir(data_key, name, estimator)
+        if not os.path.exists(os.path.join(path, 'model.joblib')):
+            return None
+        return joblib.load(os.path.join(path, 'model.joblib')), np.load(os.path.join(path, 'oof.npy'))
+
+    def save(self, data_key, name, estimator, fitted, oof):
+        path = self._model_dir(data_key, name, estimator)
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'oof.npy'), oof)
+        # model.joblib пишется последним: его наличие означает, что запись завершена
+        joblib.dump(fitted, os.path.join(path, 'model.joblib.tmp'))
+        os.replace(os.path.join(path, 'model.joblib.tmp'), os.path.join(path, 'model.joblib'))
+
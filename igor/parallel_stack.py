@@ -0,0 +1,97 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from instrumentation import StageTimer
+
+# ==============================
+# ПАРАЛЛЕЛЬНЫЙ PREDICT СТЕКА
+# ==============================
+# StackingRegressor.predict вызывает базовые модели по очереди, и задержка
+# равна их сумме. CatBoost, LightGBM, XGBoost и леса sklearn отпускают GIL,
+# поэтому базовые модели запускаются одновременно в постоянном пуле потоков:
+# задержка близка к самой медленной модели. Вход преобразуется preprocessor'ом
+# один раз, предсказания склеиваются тем же методом, что в StackingRegressor,
+# поэтому результат совпадает с ml_stack_pipe.predict.
+
+
+class ConcurrentStackPredictor:
+    def __init__(self, model, max_workers=None, timer=None):
+        self.preprocessor = model.named_steps['preprocessor']
+        self.stack = model.named_steps['stack']
+        self.timer = timer or StageTimer()
+        names = [name for name, est in self.stack.named_estimators_.items() if est != 'drop']
+        self.estimators = [
+            (name, est, method)
+            for name, est, method in zip(names, self.stack.estimators_, self.stack.stack_method_)
+        ]
+        max_workers = max_workers or min(len(self.estimators), os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='stack-predict')
+
+    def predict_transformed(self, Xt, timings=None):
+        # timings - словарь {этап: секунды} этого запроса (instrumentation.py)
+        if self.timer.measuring(timings):
+            # Каждая базовая модель замеряется в своем потоке
+            futures = [self._executor.submit(self.timer.call, name, timings, getattr(est, method), Xt)
+                       for name, est, method in self.estimators]
+        else:
+            futures = [self._executor.submit(getattr(est, method), Xt)
+                       for _, est, method in self.estimators]
+        predictions = [future.result() for future in futures]
+        with self.timer.stage('meta_model', timings):
+            X_meta = self.stack._concatenate_predictions(Xt, predictions)
+            return self.stack.final_estimator_.predict(X_meta)
+
+    def predict(self, X):
+        return self.predict_transformed(self.preprocessor.transform(X))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ==============================
+# СРАВНЕНИЕ С ml_stack_pipe.predict
+# ==============================
+if __name__ == '__main__':
+    import argparse
+    import time
+    import warnings
+
+    import pandas as pd
+
+    import model_io
+    from features import prepare_batch
+
+    parser = argparse.ArgumentParser(description="Задержка последовательного и параллельного predict стека")
+    parser.add_argument('--model', default=model_io.resolve_model_path())
+    parser.add_argument('--data', default='test.csv')
+    parser.add_argument('--rows', type=int, default=1, help="Строк в одном запросе")
+    parser.add_argument('--runs', type=int, default=100)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    model = model_io.load_model(args.model)
+    X = prepare_batch(pd.read_csv(args.data, nrows=max(args.rows, args.runs)))
+
+    with ConcurrentStackPredictor(model) as predictor:
+        results = {}
+        for title, fn in (("последовательно", model.predict), ("параллельно", predictor.predict)):
+            times, preds = [], []
+            for i in range(args.runs):
+                batch = X.iloc[i % len(X):i % len(X) + args.rows]
+                start = time.perf_counter()
+                preds.append(fn(batch))
+                times.append((time.perf_counter() - start) * 1000)
+            results[title] = np.concatenate(preds)
+            print(f"{title:>16}: p50 {np.percentile(times, 50):.2f} мс, p99 {np.percentile(times, 99):.2f} мс")
+
+    same = np.array_equal(results["последовательно"], results["параллельно"])
+    print(f"Предсказания побитово совпадают: {'да' if same else 'нет'}")
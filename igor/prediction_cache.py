@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ==============================
+# КЭШ ПРЕДСКАЗАНИЙ
+# ==============================
+# Streamlit перезапускает скрипт на каждое изменение виджета, поэтому одни и те
+# же входы пересчитываются много раз. Кэш общий для всех сессий (LRU + TTL),
+# ключ - версия файла модели, год для возрастов (HouseAge/RemodAge; main.py и
+# main2.py считают их от разных годов и делят один кэш) и десять полей
+# пользователя.
+
+CACHE_KEY_FEATURES = [
+    'YearBuilt', 'YearRemodAdd', 'OverallQual', 'OverallCond', 'GrLivArea',
+    'LotArea', 'TotalBsmtSF', 'GarageArea', 'Neighborhood', 'HouseStyle'
+]
+
+
+def model_version(path='house_price_model.pkl'):
+    # (путь, метка): метка меняется при любой перезаписи файла модели
+    # (для каталога - его манифеста)
+    stat_path = os.path.join(path, 'manifest.json') if os.path.isdir(path) else path
+    try:
+        stat = os.stat(stat_path)
+    except OSError:
+        return (path, None)
+    return (path, f"{stat.st_mtime_ns}-{stat.st_size}")
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return value.strip()
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def make_cache_key(user_inputs, version, current_year):
+    return (version, current_year) + tuple(_normalize(user_inputs[col]) for col in CACHE_KEY_FEATURES)
+
+
+class PredictionCache:
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._versions = {}
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            # Новая версия файла модели -> его старые предсказания больше не нужны
+            path, stamp = key[0]
+            if self._versions.get(path, stamp) != stamp:
+                for old_key in [k for k in self._data if k[0][0] == path]:
+                    del self._data[old_key]
+            self._versions[path] = stamp
+            item = self._data.get(key)
+            if item is not None and now - item[1] < self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            if self._versions.get(path) == stamp:
+                self._data[key] = (value, now)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
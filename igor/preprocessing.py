@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import schema
+from features import add_engineered_features
+
+# ==============================
+# ПРЕДОБРАБОТКА ДАННЫХ ДЛЯ ОБУЧЕНИЯ
+# ==============================
+# Те же шаги, что в project.ipynb: объединение train/test, заполнение пропусков,
+# GarageYrBlt из YearBuilt, инженерные фичи, обрезка LotArea, списки колонок
+# для OneHotEncoder/TargetEncoder. Результат кэшируется в Parquet, ключ -
+# хэш сырых файлов и конфигурации; при повторном запуске с теми же входами
+# данные читаются из кэша. Файлы читаются по схеме (schema.py): категории -
+# pandas category, числа - узкие типы.
+#
+# В ноутбуке или скрипте:
+#   from preprocessing import load_dataset
+#   data = load_dataset('train.csv', 'test.csv')
+#   data['X_train'], data['y_train_log'], data['X_valid'], ...
+
+# Меняется при изменении кода ниже, чтобы не читать устаревший кэш
+PREPROCESSING_VERSION = 2
+
+CACHE_DIR = '.feature_store'
+
+PREPROCESSING_CONFIG = {
+    'without_fill': ['Alley', 'BsmtCond', 'BsmtQual', 'BsmtExposure', 'BsmtFinType1',
+                     'BsmtFinType2', 'FireplaceQu', 'GarageType', 'GarageFinish',
+                     'GarageQual', 'GarageCond', 'PoolQC', 'Fence', 'MiscFeature', 'MasVnrType'],
+    'zero_fill': ['LotFrontage', 'MasVnrArea'],
+    'mode_fill': ['Electrical', 'BsmtFinSF1', 'BsmtFinSF2', 'BsmtUnfSF', 'TotalBsmtSF', 'GarageArea',
+                  'MSZoning', 'Utilities', 'Exterior1st', 'Exterior2nd', 'BsmtFullBath', 'BsmtHalfBath',
+                  'KitchenQual', 'Functional', 'GarageCars', 'SaleType'],
+    'lot_area_cap': 500000,
+    'current_year': 2020,
+    # Категориальные колонки с числом значений <= порога идут в OneHotEncoder
+    'one_hot_max_unique': 3,
+}
+
+
+def dataset_key(train_path, test_path, config=PREPROCESSING_CONFIG):
+    digest = hashlib.sha256()
+    for path in (train_path, test_path):
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    digest.update(str(PREPROCESSING_VERSION).encode())
+    return digest.hexdigest()[:16]
+
+
+def preprocess(train, test, config=PREPROCESSING_CONFIG):
+    n_train = len(train)
+    all_data = pd.concat([train, test])
+
+    all_data[config['without_fill']] = all_data[config['without_fill']].fillna('without')
+    all_data[config['zero_fill']] = all_data[config['zero_fill']].fillna(0)
+    all_data['GarageYrBlt'] = all_data['GarageYrBlt'].fillna(all_data['YearBuilt'])
+    mode_fill = config['mode_fill']
+    all_data[mode_fill] = all_data[mode_fill].fillna(all_data[mode_fill].mode().iloc[0])
+
+    X_train = all_data.iloc[:n_train].copy()
+    y_train_log = np.log1p(X_train.pop('SalePrice'))
+    X_valid = all_data.iloc[n_train:].drop(columns='SalePrice').copy()
+    valid_ids = X_valid.pop('Id')
+    X_train = X_train.drop(columns='Id')
+
+    categorical = X_train.select_dtypes(include=['object', 'category'])
+    one_hot_coder = categorical.loc[:, categorical.nunique() <= config['one_hot_max_unique']].columns.to_list()
+    target_coder = categorical.loc[:, categorical.nunique() > config['one_hot_max_unique']].columns.to_list()
+
+    for df in (X_train, X_valid):
+        add_engineered_features(df, config['current_year'])
+        df.loc[df['LotArea'] > config['lot_area_cap'], 'LotArea'] = config['lot_area_cap']
+
+    return {
+        'X_train': X_train.reset_index(drop=True),
+        'y_train_log': y_train_log.reset_index(drop=True),
+        'X_valid': X_valid.reset_index(drop=True),
+        'valid_ids': valid_ids.reset_index(drop=True),
+        'one_hot_coder': one_hot_coder,
+        'target_coder': target_coder,
+    }
+
+
+def _save(data, path):
+    os.makedirs(path, exist_ok=True)
+    data['X_train'].assign(SalePrice_log=data['y_train_log']).to_parquet(os.path.join(path, 'train.parquet'))
+    data['X_valid'].assign(Id=data['valid_ids']).to_parquet(os.path.join(path, 'valid.parquet'))
+    # meta.json пишется последним: его наличие означает, что запись завершена
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'one_hot_coder': data['one_hot_coder'], 'target_coder': data['target_coder']}, f)
+
+
+def _load(path):
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    train = pd.read_parquet(os.path.join(path, 'train.parquet'))
+    valid = pd.read_parquet(os.path.join(path, 'valid.parquet'))
+    return {
+        'X_train': train.drop(columns='SalePrice_log'),
+        'y_train_log': train['SalePrice_log'].rename('SalePrice'),
+        'X_valid': valid.drop(columns='Id'),
+        'valid_ids': valid['Id'],
+        'one_hot_coder': meta['one_hot_coder'],
+        'target_coder': meta['target_coder'],
+    }
+
+
+def load_dataset(train_path='train.csv', test_path='test.csv', config=PREPROCESSING_CONFIG,
+                 cache_dir=CACHE_DIR, verbose=True):
+    start = time.perf_counter()
+    key = dataset_key(train_path, test_path, config)
+    path = os.path.join(cache_dir, key)
+
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        data = _load(path)
+        status = 'попадание в кэш'
+    else:
+        data = preprocess(schema.read_csv(train_path), schema.read_csv(test_path), config)
+        _save(data, path)
+        status = 'промах кэша, данные обработаны и сохранены'
+
+    if verbose:
+        print(f"Предобработка [{key}]: {status}, {time.perf_counter() - start:.2f} с")
+    return data
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Предобработка train/test с кэшем в Parquet")
+    parser.add_argument('--train', default='train.csv')
+    parser.add_argument('--test', default='test.csv')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    args = parser.parse_args()
+
+    load_dataset(args.train, args.test, cache_dir=args.cache_dir)
+    load_dataset(args.train, args.test, cache_dir=args.cache_dir)
@@ -0,0 +1,270 @@
+import os
+import time
+
+import joblib
+import numpy as np
+
+from features import TRAIN_YEAR
+from schema import CATEGORY_SCHEMA
+from sensitivity import inputs_frame
+
+# ==============================
+# ПОВЕРХНОСТЬ ЦЕН
+# ==============================
+# Приближенная цена без вызова модели: стек заранее считается на сетке полей
+# формы main2.py, а в приложении цена интерполируется по таблице (микросекунды
+# вместо десятков миллисекунд predict). Это мгновенная оценка при движении
+# слайдеров; точная цена - по-прежнему стек, по кнопке.
+#
+# Для каждой пары район x стиль дома хранятся:
+#   - таблица log1p(цена) по OverallQual x GrLivArea x YearBuilt (GRID_AXES;
+#     ось годов продлевается до года расчета возрастов), остальные поля - в
+#     точке REFERENCE_INPUTS;
+#   - поправки по одной характеристике (CORRECTION_AXES): разность прогноза
+#     при другом значении поля и в опорной точке. Поправки складываются
+#     (в log1p - перемножаются цены), взаимодействия между ними не учитываются:
+#     цена этого - ошибка приближения, которую показывает замер.
+# Между узлами - линейная интерполяция (площади - по логарифму), за краями
+# сетки - значение края. Остальные признаки модели - DEFAULT_VALUES, как в
+# приложении. Поверхность помнит версию модели и год расчета возрастов и
+# показывается только с ними.
+#
+# Пример:
+#   python price_surface.py                 # текущая модель уровня full -> price_surface.joblib
+#   python price_surface.py --samples 2000  # плюс замер ошибки на большем числе случайных домов
+
+SURFACE_PATH = 'price_surface.joblib'
+
+# Значения формы main2.py по умолчанию: в этой точке поправки равны нулю
+REFERENCE_INPUTS = {
+    'YearBuilt': 1980,
+    'YearRemodAdd': 1990,
+    'OverallQual': 6,
+    'OverallCond': 6,
+    'GrLivArea': 1500,
+    'LotArea': 10000,
+    'TotalBsmtSF': 1000,
+    'GarageArea': 500,
+}
+
+# Ремонт задается через разрыв YearRemodAdd - YearBuilt; поправка по нему
+# считается для дома этого года постройки
+REMOD_GAP = REFERENCE_INPUTS['YearRemodAdd'] - REFERENCE_INPUTS['YearBuilt']
+REMOD_REFERENCE_BUILT = 1960
+
+GRID_AXES = {
+    'OverallQual': np.arange(1, 11),
+    'GrLivArea': np.array([400, 650, 900, 1200, 1500, 1900, 2400, 3200, 5000]),
+    'YearBuilt': np.array([1870, 1900, 1920, 1940, 1960, 1975, 1990, 2005, 2020]),
+}
+
+# Оси поправок; опорное значение каждого поля обязательно есть на оси
+CORRECTION_AXES = {
+    'OverallCond': np.arange(1, 11),
+    'LotArea': np.array([1000, 2500, 5000, 7500, 10000, 15000, 25000, 50000, 200000]),
+    'TotalBsmtSF': np.array([0, 300, 600, 1000, 1500, 2200, 3000, 5000]),
+    'GarageArea': np.array([0, 250, 500, 750, 1000, 1400, 2000]),
+    'RemodGap': np.array([0, 5, 10, 20, 30, 45, 60]),
+}
+
+LOG_AXES = ('GrLivArea', 'LotArea')
+
+
+def grid_axes(current_year):
+    # Дома новее последнего узла GRID_AXES не прижимаются к краю сетки
+    years = GRID_AXES['YearBuilt']
+    if current_year > years[-1]:
+        years = np.append(years, current_year)
+    return {**GRID_AXES, 'YearBuilt': years}
+
+# Строк в одном вызове predict при построении
+BUILD_BATCH_ROWS = 20000
+
+
+def _axis(name, values):
+    values = np.asarray(values, dtype=float)
+    return np.log(values) if name in LOG_AXES else values
+
+
+def _interpolate(table, axes, point):
+    # Мультилинейная интерполяция в ячейке сетки; за краями - значение края
+    index, weights = [], []
+    for axis, x in zip(axes, point):
+        x = min(max(x, axis[0]), axis[-1])
+        k = min(int(np.searchsorted(axis, x, side='right')) - 1, len(axis) - 2)
+        index.append(slice(k, k + 2))
+        weights.append((x - axis[k]) / (axis[k + 1] - axis[k]))
+    block = table[tuple(index)]
+    for w in weights:
+        block = block[0] * (1 - w) + block[1] * w
+    return float(block)
+
+
+def _predict_log(model, columns, current_year, batch_rows=BUILD_BATCH_ROWS):
+    n_rows = len(next(iter(columns.values())))
+    return np.concatenate([
+        model.predict(inputs_frame(REFERENCE_INPUTS, {col: values[start:start + batch_rows]
+                                                      for col, values in columns.items()}, current_year))
+        for start in range(0, n_rows, batch_rows)
+    ])
+
+
+class PriceSurface:
+    def __init__(self, neighborhoods, styles, table, corrections, model_version=None,
+                 current_year=TRAIN_YEAR):
+        self.neighborhoods = {value: i for i, value in enumerate(neighborhoods)}
+        self.styles = {value: i for i, value in enumerate(styles)}
+        self.table = table.astype(np.float32)                    # район x стиль x GRID_AXES
+        self.corrections = {name: values.astype(np.float32)      # район x стиль x ось поправки
+                            for name, values in corrections.items()}
+        self.axes = [_axis(name, values) for name, values in grid_axes(current_year).items()]
+        self.correction_axes = {name: _axis(name, values) for name, values in CORRECTION_AXES.items()}
+        self.model_version = model_version
+        self.current_year = current_year
+
+    @classmethod
+    def build(cls, model, model_version=None, current_year=TRAIN_YEAR, batch_rows=BUILD_BATCH_ROWS):
+        neighborhoods = list(CATEGORY_SCHEMA['Neighborhood'].categories)
+        styles = list(CATEGORY_SCHEMA['HouseStyle'].categories)
+        pairs = (len(neighborhoods), len(styles))
+
+        # Основная таблица: все пары x все узлы сетки
+        grid = {'Neighborhood': np.array(neighborhoods), 'HouseStyle': np.array(styles), **grid_axes(current_year)}
+        mesh = np.meshgrid(*grid.values(), indexing='ij')
+        columns = {col: values.ravel() for col, values in zip(grid, mesh)}
+        columns['YearRemodAdd'] = np.minimum(columns['YearBuilt'] + REMOD_GAP, current_year)
+        table = _predict_log(model, columns, current_year, batch_rows).reshape(mesh[0].shape)
+
+        # Поправки: прогноз вдоль оси минус прогноз в опорном значении (оно на оси)
+        corrections = {}
+        for name, axis in CORRECTION_AXES.items():
+            mesh = np.meshgrid(np.array(neighborhoods), np.array(styles), axis, indexing='ij')
+            columns = {'Neighborhood': mesh[0].ravel(), 'HouseStyle': mesh[1].ravel()}
+            if name == 'RemodGap':
+                columns['YearBuilt'] = np.full(mesh[2].size, REMOD_REFERENCE_BUILT)
+                columns['YearRemodAdd'] = REMOD_REFERENCE_BUILT + mesh[2].ravel()
+                reference = REMOD_GAP
+            else:
+                columns[name] = mesh[2].ravel()
+                reference = REFERENCE_INPUTS[name]
+            values = _predict_log(model, columns, current_year, batch_rows).reshape(*pairs, len(axis))
+            corrections[name] = values - values[..., [int(np.flatnonzero(axis == reference)[0])]]
+        return cls(neighborhoods, styles, table, corrections, model_version, current_year)
+
+    def log_price(self, user_inputs):
+        i = self.neighborhoods[user_inputs['Neighborhood']]
+        j = self.styles[user_inputs['HouseStyle']]
+        point = [np.log(user_inputs[name]) if name in LOG_AXES else user_inputs[name] for name in GRID_AXES]
+        value = _interpolate(self.table[i, j], self.axes, point)
+        for name, axis in self.correction_axes.items():
+            if name == 'RemodGap':
+                remod = min(max(user_inputs['YearRemodAdd'], user_inputs['YearBuilt']), self.current_year)
+                x = remod - user_inputs['YearBuilt']
+            else:
+                x = np.log(max(user_inputs[name], 1)) if name in LOG_AXES else user_inputs[name]
+            value += float(np.interp(x, axis, self.corrections[name][i, j]))
+        return value
+
+    def price(self, user_inputs):
+        return float(np.expm1(self.log_price(user_inputs)))
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes + sum(values.nbytes for values in self.corrections.values())
+
+    def save(self, path=SURFACE_PATH):
+        joblib.dump(self, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return path
+
+
+def load_surface(path=SURFACE_PATH):
+    return joblib.load(path)
+
+
+# ==============================
+# ОШИБКА ПРИБЛИЖЕНИЯ
+# ==============================
+def random_inputs(n, seed=0, current_year=TRAIN_YEAR):
+    # Случайные дома в диапазонах формы main2.py
+    rng = np.random.default_rng(seed)
+    year_built = rng.integers(1870, current_year + 1, n)
+    return {
+        'Neighborhood': rng.choice(list(CATEGORY_SCHEMA['Neighborhood'].categories), n),
+        'HouseStyle': rng.choice(list(CATEGORY_SCHEMA['HouseStyle'].categories), n),
+        'OverallQual': rng.integers(1, 11, n),
+        'OverallCond': rng.integers(1, 11, n),
+        'GrLivArea': np.exp(rng.uniform(np.log(500), np.log(4000), n)).round().astype(int),
+        'LotArea': np.exp(rng.uniform(np.log(2000), np.log(50000), n)).round().astype(int),
+        'TotalBsmtSF': rng.integers(0, 2500, n),
+        'GarageArea': rng.integers(0, 1000, n),
+        'YearBuilt': year_built,
+        'YearRemodAdd': np.minimum(year_built + rng.integers(0, 60, n), current_year),
+    }
+
+
+def approximation_error(surface, model, columns):
+    # columns: {поле формы: массив}; -> относительные ошибки цены и время запроса
+    exact = np.expm1(_predict_log(model, columns, surface.current_year))
+    rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    start = time.perf_counter()
+    approx = np.array([surface.price(row) for row in rows])
+    lookup_seconds = (time.perf_counter() - start) / len(rows)
+    return np.abs(approx - exact) / exact, lookup_seconds
+
+
+if __name__ == '__main__':
+    import argparse
+    from datetime import datetime
+
+    import pandas as pd
+
+    import model_io
+    import model_registry
+    from features import make_input_df
+    from prediction_cache import model_version
+
+    # Через импорт модуля: иначе PriceSurface запишется в pickle как __main__.PriceSurface
+    from price_surface import PriceSurface
+
+    parser = argparse.ArgumentParser(description="Поверхность цен для мгновенной оценки в main2.py")
+    parser.add_argument('--model', help="Файл модели (по умолчанию - текущая версия реестра или модель уровня)")
+    parser.add_argument('--tier', choices=['full', 'fast'], default='full')
+    parser.add_argument('--output', default=SURFACE_PATH)
+    parser.add_argument('--train', default='train.csv', help="Реальные дома для замера ошибки")
+    parser.add_argument('--samples', type=int, default=1000, help="Случайных домов для замера ошибки")
+    parser.add_argument('--current-year', type=int, default=datetime.now().year,
+                        help="Год для HouseAge/RemodAge - как CURRENT_YEAR в main2.py")
+    args = parser.parse_args()
+
+    if args.model:
+        version, path = model_version(args.model), args.model
+    else:
+        version, path, _ = model_registry.resolve(args.tier)
+    model = model_io.load_model(path)
+
+    start = time.perf_counter()
+    surface = PriceSurface.build(model, version, args.current_year)
+    build = time.perf_counter() - start
+    surface.save(args.output)
+    n_points = surface.table.size + sum(values.size for values in surface.corrections.values())
+    print(f"Поверхность: {n_points:,} прогнозов за {build:.0f} с; таблицы {surface.nbytes / 2**20:.2f} МБ, "
+          f"файл {os.path.getsize(args.output) / 2**20:.2f} МБ -> {args.output}")
+
+    train = pd.read_csv(args.train)
+    samples = {
+        'случайные дома': random_inputs(args.samples, current_year=args.current_year),
+        args.train: {col: train[col].to_numpy() for col in ['Neighborhood', 'HouseStyle'] + list(REFERENCE_INPUTS)},
+    }
+    print(f"{'дома':<16}{'медиана':>10}{'p90':>8}{'p95':>8}{'макс':>8}{'запрос, мкс':>13}")
+    for title, columns in samples.items():
+        errors, lookup = approximation_error(surface, model, columns)
+        print(f"{title:<16}{np.median(errors):>10.1%}{np.percentile(errors, 90):>8.1%}"
+              f"{np.percentile(errors, 95):>8.1%}{errors.max():>8.1%}{lookup * 1e6:>13.0f}")
+
+    row = make_input_df(REFERENCE_INPUTS, args.current_year)
+    model.predict(row)
+    start = time.perf_counter()
+    for _ in range(20):
+        model.predict(row)
+    print(f"Для сравнения: model.predict одной строки - {(time.perf_counter() - start) / 20 * 1000:.1f} мс")
@@ -0,0 +1,177 @@
+import numpy as np
+
+from features import ALL_FEATURES, DEFAULT_VALUES, LOT_AREA_CAP, TRAIN_YEAR, make_input_df
+from instrumentation import StageTimer
+
+# ==============================
+# БЫСТРЫЙ РАСЧЕТ ОДНОЙ СТРОКИ
+# ==============================
+# Вместо DataFrame + ColumnTransformer строка кодируется напрямую в вектор
+# признаков стека: строка по умолчанию закодирована заранее (шаблон),
+# при запросе копируется шаблон и перезаписываются только поля пользователя
+# и инженерные фичи. Затем базовые модели и мета-модель вызываются так же,
+# как это делает StackingRegressor.predict.
+
+
+def _category_labels(categories, labels, j):
+    # Коды схемы -> значения колонки j (код -1 - пропуск/неизвестное)
+    if labels is None:
+        return list(categories)
+    return [labels[j][code] if code >= 0 else None for code in categories]
+
+
+class RowEncoder:
+    def __init__(self, model, current_year=TRAIN_YEAR, stack_predictor=None, timer=None):
+        self.current_year = current_year
+        # Необязательный ConcurrentStackPredictor для параллельного вызова моделей
+        self.stack_predictor = stack_predictor
+        # Замер этапов (instrumentation.py); по умолчанию выключен
+        self.timer = timer or StageTimer()
+        self.preprocessor = model.named_steps['preprocessor']
+        self.stack = model.named_steps['stack']
+
+        self._numeric_pos = {}   # колонка -> позиция в векторе
+        self._cat_slices = {}    # колонка -> slice в векторе
+        self._cat_lookup = {}    # колонка -> {значение: закодированный кусок}
+        self._cat_unknown = {}   # колонка -> кусок для неизвестного значения
+
+        names_in = list(self.preprocessor.feature_names_in_)
+        for name, trans, columns in self.preprocessor.transformers_:
+            if trans == 'drop':
+                continue
+            columns = [names_in[c] if isinstance(c, (int, np.integer)) else c for c in columns]
+            out = self.preprocessor.output_indices_[name]
+            kind = type(trans).__name__
+            labels = None
+            if kind == 'Pipeline':
+                # CategoryCodes + энкодер (train.make_preprocessor): категории
+                # энкодера - коды схемы, в словарь кладутся исходные значения
+                labels = trans.steps[0][1].categories_
+                trans = trans.steps[-1][1]
+                kind = type(trans).__name__
+            if trans == 'passthrough' or (kind == 'FunctionTransformer' and trans.func is None):
+                for i, col in enumerate(columns):
+                    self._numeric_pos[col] = out.start + i
+            elif kind == 'OneHotEncoder':
+                if trans.drop_idx_ is not None:
+                    raise TypeError("OneHotEncoder с drop не поддерживается")
+                pos = out.start
+                for j, (col, cats) in enumerate(zip(columns, trans.categories_)):
+                    cats = _category_labels(cats, labels, j)
+                    self._cat_slices[col] = slice(pos, pos + len(cats))
+                    self._cat_lookup[col] = {cat: np.eye(len(cats))[i] for i, cat in enumerate(cats)}
+                    if trans.handle_unknown != 'error':
+                        self._cat_unknown[col] = np.zeros(len(cats))
+                    pos += len(cats)
+            elif kind == 'TargetEncoder':
+                if trans.target_type_ != 'continuous':
+                    raise TypeError("Поддерживается только TargetEncoder для регрессии")
+                for i, (col, cats, enc) in enumerate(zip(columns, trans.categories_, trans.encodings_)):
+                    self._cat_slices[col] = slice(out.start + i, out.start + i + 1)
+                    cats = _category_labels(cats, labels, i)
+                    self._cat_lookup[col] = {cat: np.array([e]) for cat, e in zip(cats, enc)}
+                    self._cat_unknown[col] = np.array([trans.target_mean_])
+            else:
+                raise TypeError(f"Трансформер {kind} не поддерживается")
+
+        n_features = max(s.stop for s in self.preprocessor.output_indices_.values())
+        self._template = np.zeros((1, n_features))
+        self._template_values = {col: DEFAULT_VALUES[col] for col in ALL_FEATURES}
+        self._fill(self._template, self._template_values)
+        self._fill_engineered(self._template, self._template_values)
+
+        # Разовая проверка: шаблон совпадает с выходом ColumnTransformer
+        expected = self.preprocessor.transform(make_input_df({}, current_year))
+        if not np.allclose(np.asarray(expected, dtype=float), self._template):
+            raise ValueError("RowEncoder расходится с preprocessor модели")
+
+    def _fill(self, x, values):
+        for col, value in values.items():
+            if col in self._numeric_pos:
+                # LotRatio (_fill_engineered) берет площадь до обрезки, как make_input_df
+                x[0, self._numeric_pos[col]] = min(value, LOT_AREA_CAP) if col == 'LotArea' else value
+            elif col in self._cat_slices:
+                encoded = self._cat_lookup[col].get(value)
+                if encoded is None:
+                    encoded = self._cat_unknown.get(col)
+                    if encoded is None:
+                        raise ValueError(f"Неизвестное значение {value!r} в колонке {col}")
+                x[0, self._cat_slices[col]] = encoded
+
+    def _fill_engineered(self, x, values):
+        def get(col):
+            return values.get(col, self._template_values[col])
+
+        pos = self._numeric_pos
+        house_age = self.current_year - get('YearBuilt')
+        remod_age = self.current_year - get('YearRemodAdd')
+        gr_liv_area = get('GrLivArea')
+        x[0, pos['HouseAge']] = house_age
+        x[0, pos['RemodAge']] = remod_age
+        x[0, pos['IsOldNotRemod']] = int(house_age > 50 and remod_age == house_age)
+        x[0, pos['QualCondDiff']] = get('OverallQual') - get('OverallCond')
+        x[0, pos['HasGarage']] = int(get('GarageArea') > 0)
+        x[0, pos['HasBsmt']] = int(get('TotalBsmtSF') > 0)
+        lot_ratio = get('LotArea') / (gr_liv_area if gr_liv_area != 0 else 1)
+        x[0, pos['LotRatio']] = lot_ratio if np.isfinite(lot_ratio) else 0
+
+    def encode(self, user_inputs):
+        x = self._template.copy()
+        self._fill(x, user_inputs)
+        self._fill_engineered(x, user_inputs)
+        return x
+
+    def predict(self, user_inputs, timings=None):
+        # То же, что StackingRegressor.predict (passthrough=False), без DataFrame;
+        # timings - словарь, куда пишется время этапов этого запроса
+        with self.timer.stage('encode', timings):
+            x = self.encode(user_inputs)
+        if self.stack_predictor is not None:
+            return self.stack_predictor.predict_transformed(x, timings)[0]
+        with self.timer.stage('base_models', timings):
+            base_preds = np.column_stack([
+                est.predict(x) for est in self.stack.estimators_ if est != 'drop'
+            ])
+        with self.timer.stage('meta_model', timings):
+            return self.stack.final_estimator_.predict(base_preds)[0]
+
+
+# ==============================
+# ЗАМЕР ЗАДЕРЖКИ
+# ==============================
+if __name__ == '__main__':
+    import argparse
+    import time
+    import warnings
+
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Сравнение задержки DataFrame-пути и RowEncoder")
+    parser.add_argument('--model', default='house_price_model.pkl')
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    model = joblib.load(args.model)
+    encoder = RowEncoder(model)
+
+    def measure(fn):
+        times, preds = [], []
+        for i in range(args.runs):
+            user_inputs = {
+                'YearBuilt': 1950 + i % 70, 'OverallQual': 1 + i % 10,
+                'GrLivArea': int(rng.integers(500, 4000)), 'Neighborhood': 'CollgCr',
+            }
+            start = time.perf_counter()
+            preds.append(fn(user_inputs))
+            times.append((time.perf_counter() - start) * 1000)
+        return np.array(times), np.array(preds)
+
+    rng = np.random.default_rng(0)
+    old_times, old_preds = measure(lambda u: model.predict(make_input_df(u))[0])
+    rng = np.random.default_rng(0)
+    new_times, new_preds = measure(encoder.predict)
+
+    for title, times in (("DataFrame", old_times), ("RowEncoder", new_times)):
+        print(f"{title:>10}: p50 {np.percentile(times, 50):.2f} мс, p99 {np.percentile(times, 99):.2f} мс")
+    print(f"Макс. расхождение предсказаний: {np.max(np.abs(old_preds - new_preds)):.2e}")
@@ -0,0 +1,275 @@
+import os
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+# ==============================
+# СХЕМА СЫРЫХ ПРИЗНАКОВ
+# ==============================
+# Для каждой из 79 колонок train.csv/test.csv объявлен тип: категориальные -
+# набор значений из data_description.txt (pandas category), числовые - ширина
+# и допустимый диапазон (int8/int16/int32/float32). Данные читаются сразу в эти
+# типы: строка категории хранится один раз, в строках - целые коды. Схема же
+# проверяет входящие строки (неизвестная категория, число вне диапазона).
+#
+# В data_description.txt часть кодов записана не так, как в данных (NAmes и
+# Names, C (all) и C, ...) - такие коды переводятся в написание данных.
+# Отсутствие признака (NA, None) - значение 'without', как в ноутбуке.
+#
+# Пример:
+#   import schema
+#   train = schema.read_csv('train.csv')
+#   problems = schema.validate(train)
+
+DESCRIPTION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_description.txt')
+
+MISSING_VALUE = 'without'
+
+# Код из data_description.txt -> написание в train.csv/test.csv
+CODE_ALIASES = {
+    'MSZoning': {'C': 'C (all)'},
+    'Neighborhood': {'Names': 'NAmes'},
+    'BldgType': {'2FmCon': '2fmCon', 'Duplx': 'Duplex', 'TwnhsI': 'Twnhs'},
+    'Exterior2nd': {'BrkComm': 'Brk Cmn', 'CemntBd': 'CmentBd', 'WdShing': 'Wd Shng'},
+}
+MISSING_CODES = ('NA', 'None')
+
+# До этого числа строк CategoryCodes кодирует словарем, а не через pandas
+SMALL_INPUT_ROWS = 1000
+
+# Числовые колонки: (тип, минимум, максимум). Колонки с пропусками читаются
+# во float32 - целые типы не хранят NaN
+NUMERIC_SCHEMA = {
+    'Id': ('int32', 1, None),
+    'MSSubClass': ('int16', 20, 190),
+    'LotFrontage': ('float32', 0, None),
+    'LotArea': ('int32', 0, None),
+    'OverallQual': ('int8', 1, 10),
+    'OverallCond': ('int8', 1, 10),
+    'YearBuilt': ('int16', 1800, 2100),
+    'YearRemodAdd': ('int16', 1800, 2100),
+    'MasVnrArea': ('float32', 0, None),
+    'BsmtFinSF1': ('int32', 0, None),
+    'BsmtFinSF2': ('int32', 0, None),
+    'BsmtUnfSF': ('int32', 0, None),
+    'TotalBsmtSF': ('int32', 0, None),
+    '1stFlrSF': ('int32', 0, None),
+    '2ndFlrSF': ('int32', 0, None),
+    'LowQualFinSF': ('int32', 0, None),
+    'GrLivArea': ('int32', 0, None),
+    'BsmtFullBath': ('int8', 0, None),
+    'BsmtHalfBath': ('int8', 0, None),
+    'FullBath': ('int8', 0, None),
+    'HalfBath': ('int8', 0, None),
+    'BedroomAbvGr': ('int8', 0, None),
+    'KitchenAbvGr': ('int8', 0, None),
+    'TotRmsAbvGrd': ('int8', 0, None),
+    'Fireplaces': ('int8', 0, None),
+    'GarageYrBlt': ('float32', 1800, 2100),
+    'GarageCars': ('int8', 0, None),
+    'GarageArea': ('int32', 0, None),
+    'WoodDeckSF': ('int32', 0, None),
+    'OpenPorchSF': ('int32', 0, None),
+    'EnclosedPorch': ('int32', 0, None),
+    '3SsnPorch': ('int32', 0, None),
+    'ScreenPorch': ('int32', 0, None),
+    'PoolArea': ('int32', 0, None),
+    'MiscVal': ('int32', 0, None),
+    'MoSold': ('int8', 1, 12),
+    'YrSold': ('int16', 1800, 2100),
+    'SalePrice': ('int32', 0, None),
+}
+
+
+def read_description(path=DESCRIPTION_PATH):
+    # Колонка -> список кодов из data_description.txt (только колонки с кодами)
+    codes = {}
+    column = None
+    with open(path) as f:
+        for line in f:
+            header = re.match(r'^(\w+):\s', line)
+            if header:
+                column = header.group(1)
+                continue
+            if column and line[:1].isspace() and '\t' in line.strip('\n'):
+                code = line.strip().split('\t')[0].strip()
+                if code:
+                    codes.setdefault(column, []).append(code)
+    return codes
+
+
+def build_category_schema(path=DESCRIPTION_PATH):
+    # Колонка -> CategoricalDtype; коды-числа (MSSubClass, OverallQual) остаются числовыми
+    categories = {}
+    for column, codes in read_description(path).items():
+        if column in NUMERIC_SCHEMA:
+            continue
+        aliases = CODE_ALIASES.get(column, {})
+        values = [MISSING_VALUE if code in MISSING_CODES else aliases.get(code, code) for code in codes]
+        categories[column] = pd.CategoricalDtype(list(dict.fromkeys(values)))
+    return categories
+
+
+CATEGORY_SCHEMA = build_category_schema()
+
+
+# ==============================
+# ЧТЕНИЕ И ПРИВЕДЕНИЕ ТИПОВ
+# ==============================
+def _numeric_dtype(column, values):
+    dtype = NUMERIC_SCHEMA[column][0]
+    if values.isna().any():
+        return 'float32'
+    return dtype
+
+
+def apply_schema(df):
+    # Приводит известные колонки к типам схемы. Значения вне набора категорий
+    # становятся пропусками (с предупреждением) - чтобы отклонять такие строки,
+    # проверяйте их до приведения (validate)
+    df = df.copy()
+    dropped = {}
+    for column in df.columns:
+        if column in CATEGORY_SCHEMA:
+            typed = df[column].astype(CATEGORY_SCHEMA[column])
+            lost = int(typed.isna().sum() - df[column].isna().sum())
+            if lost:
+                dropped[column] = lost
+            df[column] = typed
+        elif column in NUMERIC_SCHEMA:
+            values = pd.to_numeric(df[column], errors='coerce')
+            df[column] = values.astype(_numeric_dtype(column, values))
+    if dropped:
+        warnings.warn(f"Значения вне схемы заменены пропусками: {dropped}")
+    return df
+
+
+def read_csv(path, **kwargs):
+    # Категории читаются сразу в category (без промежуточных строк object),
+    # числа - в float32, затем сужаются до типа схемы. С chunksize - итератор чанков
+    dtype = {column: 'category' for column in CATEGORY_SCHEMA}
+    dtype.update({column: 'float32' for column in NUMERIC_SCHEMA})
+    result = pd.read_csv(path, dtype=dtype, **kwargs)
+    if isinstance(result, pd.DataFrame):
+        return apply_schema(result)
+    return (apply_schema(chunk) for chunk in result)
+
+
+# ==============================
+# ПРОВЕРКА СТРОК
+# ==============================
+def validate(df):
+    # Таблица проблем: колонка, тип проблемы, число строк, примеры значений
+    problems = []
+    for column in df.columns:
+        values = df[column]
+        if column in CATEGORY_SCHEMA:
+            observed = values.dropna()
+            if isinstance(observed.dtype, pd.CategoricalDtype):
+                observed = observed.astype(object)
+            unknown = observed[~observed.isin(CATEGORY_SCHEMA[column].categories)]
+            if len(unknown):
+                problems.append((column, 'неизвестная категория', len(unknown), unknown.unique()[:3].tolist()))
+        elif column in NUMERIC_SCHEMA:
+            numeric = pd.to_numeric(values, errors='coerce')
+            not_numeric = values[numeric.isna() & values.notna()]
+            if len(not_numeric):
+                problems.append((column, 'не число', len(not_numeric), not_numeric.unique()[:3].tolist()))
+            _, low, high = NUMERIC_SCHEMA[column]
+            outside = pd.Series(False, index=numeric.index)
+            if low is not None:
+                outside |= numeric < low
+            if high is not None:
+                outside |= numeric > high
+            outside = numeric[outside]
+            if len(outside):
+                problems.append((column, 'вне диапазона', len(outside), outside.unique()[:3].tolist()))
+    return pd.DataFrame(problems, columns=['column', 'problem', 'rows', 'examples'])
+
+
+def validate_record(record):
+    # Одна запись (dict) -> список сообщений об ошибках; пустой список - запись корректна
+    errors = []
+    for column, value in record.items():
+        if value is None:
+            continue
+        if column in CATEGORY_SCHEMA:
+            if not isinstance(value, str) or value not in CATEGORY_SCHEMA[column].categories:
+                errors.append(f"{column}: неизвестное значение {value!r}")
+        elif column in NUMERIC_SCHEMA:
+            if isinstance(value, bool) or not isinstance(value, (int, float, np.number)):
+                errors.append(f"{column}: ожидается число, получено {value!r}")
+                continue
+            _, low, high = NUMERIC_SCHEMA[column]
+            if (low is not None and value < low) or (high is not None and value > high):
+                errors.append(f"{column}: {value} вне диапазона [{low}, {high if high is not None else '∞'}]")
+    return errors
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+# ==============================
+# КОДЫ КАТЕГОРИЙ ДЛЯ ЭНКОДЕРОВ
+# ==============================
+class CategoryCodes(TransformerMixin, BaseEstimator):
+    # Категориальные колонки -> целые коды по схеме. OneHotEncoder и
+    # TargetEncoder на целых кодах работают быстрее, чем на строках. Вход
+    # может быть и строками (object): коды берутся из той же схемы, поэтому
+    # совпадают. Неизвестное значение и пропуск - код -1
+    def fit(self, X, y=None):
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.categories_ = [CATEGORY_SCHEMA[column].categories if column in CATEGORY_SCHEMA
+                            else pd.Index(pd.unique(X[column].dropna()))
+                            for column in self.feature_names_in_]
+        return self
+
+    def transform(self, X):
+        codes = {}
+        for column, categories in zip(self.feature_names_in_, self.categories_):
+            values = X[column]
+            if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.equals(categories):
+                codes[column] = values.cat.codes.to_numpy()
+            elif len(values) < SMALL_INPUT_ROWS:
+                # Одна-несколько строк (приложение, сервис): словарь быстрее хэш-индекса pandas
+                lookup = self._lookup(column, categories)
+                codes[column] = np.fromiter((lookup.get(v, -1) for v in values.to_numpy()),
+                                            dtype=np.int16, count=len(values))
+            else:
+                codes[column] = categories.get_indexer(values)
+        return pd.DataFrame(codes, index=X.index)
+
+    def _lookup(self, column, categories):
+        # Словари строятся лениво: в pickle старых артефактов их нет
+        lookups = self.__dict__.setdefault('_lookups', {})
+        if column not in lookups:
+            lookups[column] = {value: code for code, value in enumerate(categories)}
+        return lookups[column]
+
+    def get_feature_names_out(self, input_features=None):
+        return self.feature_names_in_
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Память и скорость энкодеров: object против схемы")
+    parser.add_argument('path', nargs='?', default='train.csv')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    plain = pd.read_csv(args.path)
+    plain_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    typed = read_csv(args.path)
+    typed_seconds = time.perf_counter() - start
+    print(f"Чтение: object {plain_seconds:.2f} с, {memory_mb(plain):.1f} МБ; "
+          f"схема {typed_seconds:.2f} с, {memory_mb(typed):.1f} МБ")
+
+    problems = validate(plain)
+    print("Проверка схемы: " + ("проблем нет" if problems.empty else f"\n{problems.to_string(index=False)}"))
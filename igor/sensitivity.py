@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from features import TRAIN_YEAR, add_engineered_features, build_input_row
+
+# ==============================
+# ЧУВСТВИТЕЛЬНОСТЬ ЦЕНЫ (WHAT-IF)
+# ==============================
+# Все варианты входа собираются в один DataFrame и считаются одним вызовом
+# model.predict - вместо N перезапусков приложения с предсказанием по строке.
+
+# Характеристика -> (мин, макс) для сетки: типичные дома, уже пределов виджетов
+# main2.py. Верхняя граница годов (None) - текущий год
+SWEEP_RANGES = {
+    'GrLivArea': (500, 5000),
+    'OverallQual': (1, 10),
+    'OverallCond': (1, 10),
+    'YearBuilt': (1870, None),
+    'YearRemodAdd': (1950, None),
+    'LotArea': (1000, 50000),
+    'TotalBsmtSF': (0, 3000),
+    'GarageArea': (0, 1200),
+}
+
+INTEGER_STEP_FEATURES = {'OverallQual', 'OverallCond', 'YearBuilt', 'YearRemodAdd'}
+
+
+def sweep_values(feature, points, current_year=TRAIN_YEAR):
+    low, high = SWEEP_RANGES[feature]
+    high = current_year if high is None else high
+    values = np.linspace(low, high, points).round().astype(int)
+    if feature in INTEGER_STEP_FEATURES:
+        values = np.unique(values)
+    return values
+
+
+def _variants_frame(base_inputs, n_rows):
+    row = build_input_row(base_inputs)
+    return pd.DataFrame({col: np.repeat(value, n_rows) for col, value in row.items()})
+
+
+def _add_derived_inputs(df):
+    # Те же производные поля, что main2.py собирает из ввода пользователя
+    df['YearRemodAdd'] = np.maximum(df['YearRemodAdd'], df['YearBuilt'])
+    df['GarageYrBlt'] = df['YearBuilt']
+    df['1stFlrSF'] = np.maximum(500, df['GrLivArea'] // 2)
+    df['2ndFlrSF'] = np.maximum(0, df['GrLivArea'] - df['GrLivArea'] // 2)
+    return df
+
+
+def inputs_frame(base_inputs, columns, current_year=TRAIN_YEAR):
+    # columns: {колонка: массив значений} одной длины - по строке на вариант
+    n_rows = len(next(iter(columns.values())))
+    df = _variants_frame(base_inputs, n_rows)
+    for col, values in columns.items():
+        df[col] = values
+    return add_engineered_features(_add_derived_inputs(df), current_year)
+
+
+def sweep_frame(base_inputs, grid, current_year=TRAIN_YEAR):
+    # grid: {колонка: массив значений}; для двух колонок - декартово произведение
+    columns = list(grid)
+    mesh = np.meshgrid(*[np.asarray(grid[c]) for c in columns], indexing='ij')
+    return inputs_frame(base_inputs, {col: values.ravel() for col, values in zip(columns, mesh)}, current_year)
+
+
+def predict_sweep(model, base_inputs, grid, current_year=TRAIN_YEAR):
+    df = sweep_frame(base_inputs, grid, current_year)
+    prices = np.expm1(model.predict(df))
+    result = df[list(grid)].copy()
+    result['SalePrice'] = prices
+    return result
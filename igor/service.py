@@ -0,0 +1,241 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from features import TRAIN_YEAR, prepare_batch
+from schema import validate_record
+
+# ==============================
+# HTTP-СЕРВИС ПРЕДСКАЗАНИЙ
+# ==============================
+# Только стандартная библиотека. Одновременные запросы собираются в
+# микро-батч (до --max-batch-size строк или --max-wait-ms ожидания), и модель
+# вызывается один раз на батч: накладные расходы стека на вызов намного больше,
+# чем стоимость одной строки.
+#
+# Пример:
+#   python service.py --port 8000
+#   curl -X POST localhost:8000/predict -d '{"GrLivArea": 1500, "Neighborhood": "CollgCr"}'
+#   curl localhost:8000/stats
+#
+# Тело запроса - одна запись или список записей в формате колонок test.csv;
+# отсутствующие поля заполняются значениями по умолчанию. Записи проверяются
+# по схеме (schema.py): неизвестная категория или число вне диапазона - 422.
+# Модель не загружена - 503, ошибка самого predict - 500.
+#
+# Без --model модель берется из реестра (model_registry.py) и подменяется на
+# лету при смене текущей версии; батч целиком считается одной версией.
+
+
+class ModelNotLoadedError(RuntimeError):
+    pass
+
+
+class MicroBatcher:
+    # watcher - ModelWatcher: модель берется из него на каждый батч
+    def __init__(self, model=None, max_batch_size=64, max_wait_ms=5, current_year=TRAIN_YEAR, watcher=None):
+        self.model = model
+        self.watcher = watcher
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.current_year = current_year
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=10000)
+        self._batch_sizes = deque(maxlen=10000)
+        self._started = time.perf_counter()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, records):
+        future = Future()
+        self._queue.put((records, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        # Ждем первый запрос, потом добираем батч не дольше max_wait
+        items = [self._queue.get()]
+        n_rows = len(items[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while n_rows < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            items.append(item)
+            n_rows += len(item[0])
+        return items
+
+    def current_model(self):
+        if self.watcher is None:
+            return self.model
+        return self.watcher.active.model if self.watcher.active else None
+
+    def model_version(self):
+        loaded = self.watcher.active if self.watcher else None
+        return loaded.version[1] if loaded else None
+
+    def _predict(self, records, model):
+        if model is None:
+            raise ModelNotLoadedError("модель не загружена")
+        input_df = prepare_batch(pd.DataFrame(records), self.current_year)
+        return np.expm1(model.predict(input_df))
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            records = [r for rec, _, _ in items for r in rec]
+            # Одна ссылка на батч: подмена версии посреди батча его не затронет
+            model = self.current_model()
+            try:
+                prices = self._predict(records, model)
+                pos = 0
+                for rec, future, _ in items:
+                    future.set_result(prices[pos:pos + len(rec)].tolist())
+                    pos += len(rec)
+            except Exception:
+                # Одна плохая запись не должна ломать чужие запросы
+                for rec, future, _ in items:
+                    try:
+                        future.set_result(self._predict(rec, model).tolist())
+                    except Exception as e:
+                        future.set_exception(e)
+
+            now = time.perf_counter()
+            with self._stats_lock:
+                self.batches += 1
+                self._batch_sizes.append(len(records))
+                for rec, future, submitted in items:
+                    self.requests += 1
+                    if future.exception() is None:
+                        self.rows += len(rec)
+                    else:
+                        self.errors += 1
+                    self._latencies.append((now - submitted) * 1000)
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+            elapsed = time.perf_counter() - self._started
+            return {
+                'requests': self.requests,
+                'rows': self.rows,
+                'batches': self.batches,
+                'errors': self.errors,
+                'avg_batch_size': float(np.mean(self._batch_sizes)) if self._batch_sizes else 0.0,
+                'rows_per_sec': self.rows / elapsed if elapsed > 0 else 0.0,
+                'latency_ms_p50': float(np.percentile(latencies, 50)),
+                'latency_ms_p99': float(np.percentile(latencies, 99)),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'model_version': self.model_version(),
+                'model_swaps': self.watcher.swaps if self.watcher else 0,
+            }
+
+
+class PredictionServer(ThreadingHTTPServer):
+    # Очередь соединений побольше: под нагрузкой клиентов много одновременно
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def make_handler(batcher):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._send_json(200, batcher.stats())
+            elif self.path == '/health':
+                self._send_json(200, {'status': 'ok', 'model_version': batcher.model_version()})
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length))
+                records = payload if isinstance(payload, list) else [payload]
+                if not records or not all(isinstance(r, dict) for r in records):
+                    raise ValueError("ожидается объект или список объектов")
+            except ValueError as e:
+                self._send_json(400, {'error': f"некорректный JSON: {e}"})
+                return
+
+            problems = {i: errors for i, record in enumerate(records) if (errors := validate_record(record))}
+            if problems:
+                self._send_json(422, {'error': "записи не прошли проверку схемы", 'details': problems})
+                return
+
+            # Ввод уже проверен: дальше ошибки - состояние сервера, а не клиента
+            try:
+                prices = batcher.submit(records).result()
+            except ModelNotLoadedError as e:
+                self._send_json(503, {'error': str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {'error': f"ошибка предсказания: {e}"})
+                return
+            self._send_json(200, {'SalePrice': prices})
+
+        def log_message(self, format, *args):
+            pass
+
+    return PredictionHandler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import model_io
+    from model_registry import REGISTRY_DIR, ModelWatcher
+
+    parser = argparse.ArgumentParser(description="HTTP-сервис предсказаний с микро-батчингом")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--model', default=None, help="Фиксированный файл модели вместо реестра")
+    parser.add_argument('--registry', default=REGISTRY_DIR)
+    parser.add_argument('--tier', choices=['full', 'fast'], default='full')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--current-year', type=int, default=TRAIN_YEAR)
+    args = parser.parse_args()
+
+    if args.model:
+        batcher = MicroBatcher(model_io.load_model(args.model), args.max_batch_size, args.max_wait_ms,
+                               args.current_year)
+    else:
+        watcher = ModelWatcher(args.tier, args.registry)
+        batcher = MicroBatcher(None, args.max_batch_size, args.max_wait_ms, args.current_year, watcher=watcher)
+        print(f"Модель: {watcher.active.path if watcher.active else watcher.last_error}")
+    server = PredictionServer((args.host, args.port), make_handler(batcher))
+    print(f"Сервис слушает http://{args.host}:{args.port} (POST /predict, GET /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
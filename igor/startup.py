@@ -0,0 +1,150 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+
+# ==============================
+# ХОЛОДНЫЙ СТАРТ STREAMLIT
+# ==============================
+# После развертывания первый пользователь платил за весь холодный старт:
+# импорт streamlit и pandas, распаковку модели (она тянет sklearn, catboost,
+# lightgbm и xgboost), первый predict (пулы потоков, ленивые инициализации)
+# и загрузку индексов. serve делает все это в процессе сервера до того, как
+# Streamlit начнет принимать запросы: ресурсы из app_resources.py создаются и
+# прогреваются строкой из DEFAULT_VALUES, затем в том же процессе
+# запускается обычный `streamlit run`.
+#
+# profile замеряет старт в свежих процессах: импорт по пакетам (-X importtime)
+# и время до первого прогноза без прогрева и с ним. Первая сессия
+# воспроизводится через streamlit.testing (AppTest): страница, затем кнопка.
+#
+# Пример:
+#   python startup.py serve main2.py --server.port 8501   # прогреть и запустить сервер
+#   python startup.py profile main2.py                    # до и после прогрева
+
+# Сколько пакетов показывать в профиле импорта
+TOP_IMPORTS = 12
+
+_START = time.time()
+
+
+def import_profile(stderr, top=TOP_IMPORTS):
+    # Вывод -X importtime -> [(пакет, секунды)]: собственное время всех
+    # модулей пакета, самые долгие первыми
+    totals = Counter()
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)', line)
+        if match:
+            totals[match.group(2).split('.')[0]] += int(match.group(1)) / 1e6
+    return totals.most_common(top)
+
+
+def first_session(app):
+    # Первая сессия: загрузка страницы, затем нажатие кнопки расчета
+    from streamlit.testing.v1 import AppTest
+
+    timings = {}
+    start = time.perf_counter()
+    # AppTest считает относительный путь от вызывающего файла, а не от рабочего каталога
+    at = AppTest.from_file(os.path.abspath(app), default_timeout=600).run()
+    timings['страница'] = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    button = next(b for b in at.button if 'Рассчитать' in b.label)
+    start = time.perf_counter()
+    at = button.click().run()
+    timings['прогноз'] = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return timings
+
+
+def _measure(app, warm):
+    # Выполняется в свежем процессе (profile): -> JSON в stdout
+    result = {'started': _START}
+    if warm:
+        from app_resources import warm_up
+        result['warm_up'] = warm_up()
+    result['ready'] = time.time()
+    result['session'] = first_session(app)
+    result['first_prediction'] = time.time()
+    # Установившийся режим: вторая сессия в том же процессе
+    result['next_session'] = first_session(app)
+    print(json.dumps(result))
+
+
+def profile(app):
+    runs = {}
+    for warm in (False, True):
+        spawned = time.time()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', __file__, '_measure', app]
+                              + (['--warm'] if warm else []),
+                              capture_output=True, text=True)
+        if proc.returncode:
+            raise RuntimeError(proc.stderr[-2000:])
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result['imports'] = import_profile(proc.stderr)
+        result['spawned'] = spawned
+        runs[warm] = result
+    return runs
+
+
+def serve(app, streamlit_args):
+    from app_resources import warm_up
+
+    start = time.perf_counter()
+    try:
+        timings = warm_up()
+    except RuntimeError as e:
+        # Без модели сервер все равно запускается: приложение покажет ошибку
+        print(f"Прогрев не удался: {e}")
+    else:
+        print(f"Прогрев за {time.perf_counter() - start:.1f} с: "
+              + ", ".join(f"{name} {seconds:.2f} с" for name, seconds in timings.items()))
+
+    # Обычный `streamlit run` в этом же процессе: прогретые ресурсы остаются в кэше
+    from streamlit.web import cli
+    sys.argv = ['streamlit', 'run', app, *streamlit_args]
+    sys.exit(cli.main())
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Холодный старт Streamlit: прогрев и замер")
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve_parser = sub.add_parser('serve', help="прогреть ресурсы и запустить streamlit run")
+    serve_parser.add_argument('app', nargs='?', default='main2.py')
+    profile_parser = sub.add_parser('profile', help="время до первого прогноза без прогрева и с ним")
+    profile_parser.add_argument('app', nargs='?', default='main2.py')
+    measure_parser = sub.add_parser('_measure')
+    measure_parser.add_argument('app')
+    measure_parser.add_argument('--warm', action='store_true')
+    # Остальные аргументы serve (--server.port и т.п.) передаются streamlit run
+    args, rest = parser.parse_known_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if args.command == 'serve':
+        serve(args.app, rest)
+    elif args.command == '_measure':
+        _measure(args.app, args.warm)
+    else:
+        runs = profile(args.app)
+        print("Импорт в свежем процессе (без прогрева), с по пакетам:")
+        for package, seconds in runs[False]['imports']:
+            print(f"  {package:<20}{seconds:>6.2f}")
+        print(f"{'с':<14}{'готов к запросам':>18}{'страница':>10}{'прогноз':>9}"
+              f"{'первый пользователь ждет':>26}{'от запуска до прогноза':>24}")
+        for warm, title in ((False, 'без прогрева'), (True, 'с прогревом')):
+            run = runs[warm]
+            session = run['session']
+            print(f"{title:<14}{run['ready'] - run['spawned']:>18.2f}{session['страница']:>10.2f}"
+                  f"{session['прогноз']:>9.2f}{session['страница'] + session['прогноз']:>26.2f}"
+                  f"{run['first_prediction'] - run['spawned']:>24.2f}")
+        session = runs[True]['next_session']
+        print(f"{'вторая сессия':<14}{'':>18}{session['страница']:>10.2f}{session['прогноз']:>9.2f}"
+              f"{session['страница'] + session['прогноз']:>26.2f}")
+        print("Прогрев: " + ", ".join(f"{name} {seconds:.2f} с" for name, seconds in runs[True]['warm_up'].items()))
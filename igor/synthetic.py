@@ -0,0 +1,133 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from schema import DESCRIPTION_PATH, read_description
+
+# ==============================
+# СИНТЕТИЧЕСКИЕ ДАННЫЕ БОЛЬШОГО ОБЪЕМА
+# ==============================
+# Из train.csv генерируется набор любого размера (миллионы строк) для проверки
+# обучения на данных, которые не помещаются в память. Каждая строка - случайная
+# строка train.csv с шумом, поэтому связи между колонками и с SalePrice
+# сохраняются:
+#   - площади и цена умножаются на общий для строки множитель (дом "крупнее"
+#     или "мельче"), цена - еще на собственный шум;
+#   - годы постройки, ремонта и гаража сдвигаются на одинаковое число лет;
+#   - категориальные колонки с малой вероятностью заменяются значением из
+#     распределения колонки в train.csv;
+#   - порядковые колонки с кодами в data_description.txt (OverallQual,
+#     MSSubClass, ...) и счетчики (ванные, комнаты) не меняются.
+# Запись идет чанками, память не зависит от числа строк.
+#
+# Пример:
+#   python synthetic.py train_1m.csv --rows 1000000
+#   python synthetic.py train_5m.parquet --rows 5000000 --chunksize 200000
+
+# Колонки-даты: сдвигаются вместе, а не масштабируются
+YEAR_COLUMNS = ['YearBuilt', 'YearRemodAdd', 'GarageYrBlt']
+
+# Числовая колонка с большим числом значений считается площадью/суммой
+CONTINUOUS_MIN_UNIQUE = 15
+
+NOISE = {
+    'size': 0.08,       # sigma логнормального множителя площадей
+    'price': 0.05,      # sigma собственного шума цены
+    'year_shift': 2,    # годы сдвигаются на [-2, 2]
+    'category': 0.02,   # доля замен категориальных значений
+}
+
+
+class RowSynthesizer:
+    def __init__(self, train, description=None, noise=NOISE):
+        self.noise = noise
+        self.source = train.drop(columns='Id', errors='ignore').reset_index(drop=True)
+        coded = set(description or {})
+        numeric = self.source.select_dtypes(include='number').columns
+        self.continuous = [col for col in numeric
+                           if col not in coded and col not in YEAR_COLUMNS
+                           and col not in ('SalePrice', 'YrSold', 'MoSold')
+                           and self.source[col].nunique() > CONTINUOUS_MIN_UNIQUE]
+        self.categorical = self.source.select_dtypes(include='object').columns.to_list()
+        # Распределения категорий: значения и частоты без пропусков
+        self.category_values = {}
+        for col in self.categorical:
+            counts = self.source[col].value_counts(normalize=True)
+            self.category_values[col] = (counts.index.to_numpy(), counts.to_numpy())
+
+    def sample(self, n_rows, rng):
+        df = self.source.iloc[rng.integers(0, len(self.source), n_rows)].reset_index(drop=True)
+
+        size = rng.lognormal(0.0, self.noise['size'], n_rows)
+        for col in self.continuous:
+            values = df[col].to_numpy(dtype=float) * size
+            if pd.api.types.is_integer_dtype(self.source[col]):
+                values = np.round(values).astype(self.source[col].dtype)
+            df[col] = values
+        if 'SalePrice' in df:
+            price = df['SalePrice'].to_numpy(dtype=float) * size * rng.lognormal(0.0, self.noise['price'], n_rows)
+            df['SalePrice'] = np.round(price).astype(int)
+
+        shift = rng.integers(-self.noise['year_shift'], self.noise['year_shift'] + 1, n_rows)
+        for col in YEAR_COLUMNS:
+            # Пропуски (нет гаража) остаются пропусками; год не позже продажи
+            df[col] = np.minimum(df[col] + shift, df['YrSold'])
+        df['YearRemodAdd'] = np.maximum(df['YearRemodAdd'], df['YearBuilt'])
+
+        for col in self.categorical:
+            replace = rng.random(n_rows) < self.noise['category']
+            values, probs = self.category_values[col]
+            if replace.any() and len(values):
+                df.loc[replace, col] = rng.choice(values, replace.sum(), p=probs)
+        return df
+
+
+def write_synthetic(train_path, out_path, n_rows, chunksize=100_000, seed=0,
+                    description_path=DESCRIPTION_PATH, noise=NOISE):
+    rng = np.random.default_rng(seed)
+    description = read_description(description_path) if os.path.exists(description_path) else None
+    synthesizer = RowSynthesizer(pd.read_csv(train_path), description, noise)
+
+    parquet = out_path.endswith(('.parquet', '.pq'))
+    if parquet:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+    else:
+        writer = open(out_path, 'w', newline='')
+
+    start = time.perf_counter()
+    try:
+        for offset in range(0, n_rows, chunksize):
+            chunk = synthesizer.sample(min(chunksize, n_rows - offset), rng)
+            chunk.insert(0, 'Id', np.arange(offset + 1, offset + len(chunk) + 1))
+            if not parquet:
+                chunk.to_csv(writer, header=(offset == 0), index=False)
+                continue
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Синтетический набор данных в формате train.csv")
+    parser.add_argument('output', help="CSV или Parquet")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--train', default='train.csv')
+    parser.add_argument('--description', default=DESCRIPTION_PATH)
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    elapsed = write_synthetic(args.train, args.output, args.rows, args.chunksize, args.seed, args.description)
+    size_mb = os.path.getsize(args.output) / 2**20
+    print(f"{args.rows:,} строк -> {args.output} ({size_mb:.0f} МБ) за {elapsed:.1f} с")
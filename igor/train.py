@@ -0,0 +1,463 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostRegressor
+from lightgbm import LGBMRegressor
+from sklearn import config_context, get_config
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor, StackingRegressor
+from sklearn.linear_model import ElasticNet, Lasso, Ridge, RidgeCV
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold, cross_val_predict
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler, TargetEncoder
+from sklearn.svm import SVR
+from sklearn.utils import Bunch
+from xgboost import XGBRegressor
+
+from model_utils import set_fit_threads
+from schema import CategoryCodes
+
+# ==============================
+# ОБУЧЕНИЕ СТЕКА ВНЕ НОУТБУКА
+# ==============================
+# ml_stack_pipe.fit запускает StackingRegressor(n_jobs=-1), а внутри него
+# леса и бустинги тоже берут все ядра - ядра переподписаны, и время обучения
+# плавает. Здесь каждое обучение (базовая модель x фолд, плюс обучение на всех
+# данных) - отдельная задача с явным числом потоков. Планировщик запускает
+# задачи, пока хватает свободных ядер, самые долгие (CatBoost) - первыми.
+# Результат - такой же Pipeline, как ml_stack_pipe из project.ipynb.
+#
+# Пример:
+#   python train.py --cores 8
+#   python train.py --compare     # плюс обычный StackingRegressor.fit для сравнения
+#   python train.py --meta lgbm   # из хранилища OOF (oof_store.py) - только мета-модель
+#   python train.py --drop svr knn
+#   python train.py --compile-forests   # леса стека - плоскими массивами (compiled_forest.py)
+#   python train.py --register          # новая версия в реестре (model_registry.py)
+# В модель записываются интервалы цены по OOF-остаткам (intervals.py).
+# Вместе с моделью сохраняется индекс похожих продаж comps_index.joblib (comps.py)
+# и эталон распределения входов drift_reference.json (drift.py).
+
+CV_FOLDS = 5
+
+# Потоков на одну задачу; остальные модели получают один поток
+THREAD_BUDGETS = {
+    'catboost': 4,
+    'xgb': 2,
+    'lgbm': 2,
+    'rf': 2,
+    'et': 2,
+    'rf_deep': 4,
+}
+
+# Примерное время одной задачи на одном потоке, с - для порядка запуска,
+# пока нет замеров прошлого запуска (--timings)
+COST_ESTIMATES = {
+    'catboost': 40.0,
+    'rf_deep': 10.0,
+    'xgb': 8.0,
+    'lgbm': 4.0,
+    'rf': 4.0,
+    'et': 3.0,
+    'svr': 0.5,
+}
+
+TIMINGS_PATH = 'train_timings.json'
+
+# Лучшие параметры из tune.py: {модель: параметры}
+TUNED_PARAMS_PATH = 'tuned_params.json'
+
+
+# ==============================
+# ОПРЕДЕЛЕНИЕ СТЕКА (как в project.ipynb)
+# ==============================
+def make_preprocessor(one_hot_coder, target_coder):
+    # Энкодеры получают целые коды категорий по схеме, а не строки
+    return ColumnTransformer(
+        [
+            ('ohe_hot_coder', make_pipeline(CategoryCodes(), OneHotEncoder(sparse_output=False)), one_hot_coder),
+            ('target_coder', make_pipeline(CategoryCodes(), TargetEncoder()), target_coder),
+        ],
+        verbose_feature_names_out=False,
+        remainder='passthrough'
+    )
+
+
+def load_tuned_params(path=TUNED_PARAMS_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def base_models(tuned=None):
+    # tuned=None - параметры из tuned_params.json, если файл есть; {} - как в ноутбуке
+    tuned = load_tuned_params() if tuned is None else tuned
+    linear_models = [
+        ('ridge', make_pipeline(StandardScaler(), Ridge(alpha=1.0))),
+        ('lasso', make_pipeline(StandardScaler(), Lasso(alpha=0.01, max_iter=2000))),
+        ('elastic', make_pipeline(StandardScaler(), ElasticNet(alpha=0.01, l1_ratio=0.5, max_iter=2000))),
+        ('svr', make_pipeline(StandardScaler(), SVR(C=1.0, epsilon=0.1, gamma='scale'))),
+        ('knn', make_pipeline(StandardScaler(), KNeighborsRegressor(n_neighbors=15))),
+    ]
+    tree_models = [
+        ('catboost', CatBoostRegressor(
+            iterations=3000, learning_rate=0.01, max_depth=5, l2_leaf_reg=3,
+            random_strength=1, bagging_temperature=0.2, verbose=0, random_state=42
+        )),
+        ('lgbm', LGBMRegressor(
+            n_estimators=800, learning_rate=0.03, max_depth=5, num_leaves=31,
+            subsample=0.8, colsample_bytree=0.8, reg_alpha=0.1, reg_lambda=0.1,
+            min_data_in_leaf=20, random_state=42,
+        )),
+        ('xgb', XGBRegressor(
+            n_estimators=800, learning_rate=0.03, max_depth=5, subsample=0.8,
+            colsample_bytree=0.8, reg_alpha=0.1, reg_lambda=1.0, random_state=42, verbosity=0
+        )),
+        ('rf', RandomForestRegressor(
+            n_estimators=500, max_depth=8, min_samples_split=5, min_samples_leaf=2,
+            max_features='sqrt', random_state=42, n_jobs=-1
+        )),
+        ('et', ExtraTreesRegressor(
+            n_estimators=500, max_depth=8, min_samples_split=5, min_samples_leaf=2,
+            max_features='sqrt', random_state=42, n_jobs=-1
+        )),
+        ('rf_deep', RandomForestRegressor(
+            n_estimators=400, max_depth=None, min_samples_split=2, min_samples_leaf=1,
+            max_features=0.5, bootstrap=True, oob_score=False, random_state=42, n_jobs=-1
+        )),
+    ]
+    for name, est in tree_models:
+        if name in tuned:
+            est.set_params(**tuned[name])
+    return linear_models + tree_models
+
+
+def make_meta_model(kind='ridge'):
+    if kind == 'lgbm':
+        return LGBMRegressor(n_estimators=100, max_depth=3, learning_rate=0.1)
+    return RidgeCV(alphas=np.logspace(-3, 3, 20))
+
+
+META_MODELS = ('ridge', 'lgbm')
+
+
+def make_stack_pipe(one_hot_coder, target_coder, estimators=None, final_estimator=None):
+    stacking_regressor = StackingRegressor(
+        estimators=estimators or base_models(),
+        final_estimator=final_estimator or make_meta_model(),
+        cv=CV_FOLDS,
+        n_jobs=-1,
+        passthrough=False
+    )
+    return Pipeline([
+        ('preprocessor', make_preprocessor(one_hot_coder, target_coder)),
+        ('stack', stacking_regressor),
+    ])
+
+
+# ==============================
+# ЗАДАЧИ И ПЛАНИРОВЩИК
+# ==============================
+def make_jobs(estimators, cores, cost_estimates=COST_ESTIMATES, cv=CV_FOLDS):
+    # fold=None - обучение на всех данных (модель для predict),
+    # остальные - обучение на фолде для OOF-предсказаний мета-модели
+    jobs = []
+    for name, est in estimators:
+        threads = min(THREAD_BUDGETS.get(name, 1), cores)
+        cost = cost_estimates.get(name, 0.1) / threads
+        for fold in [None] + list(range(cv)):
+            jobs.append({'name': name, 'fold': fold, 'threads': threads, 'cost': cost,
+                         'estimator': set_fit_threads(clone(est), threads)})
+    # Самые долгие задачи первыми, чтобы в конце не ждать одну длинную
+    jobs.sort(key=lambda job: job['cost'], reverse=True)
+    return jobs
+
+
+def _run_job(job, Xt, y, splits, config):
+    start = time.perf_counter()
+    est = job['estimator']
+    # Настройки sklearn (transform_output) хранятся по потокам
+    with config_context(**config):
+        if job['fold'] is None:
+            est.fit(Xt, y)
+            job['prediction'] = None
+        else:
+            train_idx, test_idx = splits[job['fold']]
+            est.fit(Xt.iloc[train_idx], y.iloc[train_idx])
+            job['prediction'] = est.predict(Xt.iloc[test_idx])
+    job['seconds'] = time.perf_counter() - start
+    return job
+
+
+def run_jobs(jobs, Xt, y, cores, cv=CV_FOLDS):
+    splits = list(KFold(n_splits=cv).split(Xt))
+    config = get_config()
+    free = [cores]
+    ready = threading.Condition()
+    pending = list(jobs)
+    futures = []
+
+    def release(future):
+        with ready:
+            free[0] += future.job_threads
+            ready.notify()
+
+    with ThreadPoolExecutor(max_workers=cores, thread_name_prefix='train-job') as executor:
+        while pending:
+            with ready:
+                # Первая по порядку задача, которой хватает свободных ядер
+                job = None
+                while job is None:
+                    job = next((j for j in pending if j['threads'] <= free[0]), None)
+                    if job is None:
+                        ready.wait()
+                pending.remove(job)
+                free[0] -= job['threads']
+            job['started'] = time.perf_counter()
+            future = executor.submit(_run_job, job, Xt, y, splits, config)
+            future.job_threads = job['threads']
+            future.add_done_callback(release)
+            futures.append(future)
+        # Пробрасываем исключение из упавшей задачи
+        return [future.result() for future in futures], splits
+
+
+def collect_jobs(jobs, splits, n_samples):
+    # Задачи -> модель на всех данных и OOF-столбец для каждой базовой модели
+    fitted, oof = {}, {}
+    for job in jobs:
+        if job['fold'] is None:
+            fitted[job['name']] = job['estimator']
+        else:
+            column = oof.setdefault(job['name'], np.empty(n_samples))
+            column[splits[job['fold']][1]] = job['prediction']
+    return fitted, oof
+
+
+def assemble_stack(stack, fitted, oof, Xt, y):
+    # Те же атрибуты, что выставляет StackingRegressor.fit
+    names, _ = stack._validate_estimators()
+    stack._validate_final_estimator()
+
+    stack.estimators_ = [fitted[name] for name in names]
+    stack.named_estimators_ = Bunch(**dict(zip(names, stack.estimators_)))
+    stack.stack_method_ = ['predict'] * len(names)
+    if hasattr(stack.estimators_[0], 'feature_names_in_'):
+        stack.feature_names_in_ = stack.estimators_[0].feature_names_in_
+
+    X_meta = stack._concatenate_predictions(Xt, [oof[name] for name in names])
+    stack.final_estimator_.fit(X_meta, y)
+    return stack
+
+
+def oof_predictions(stack, oof, y, cv=CV_FOLDS):
+    # Прогноз стека без утечки: мета-модель по кросс-валидации на
+    # OOF-предсказаниях базовых моделей (как fast_tier.meta_oof_rmsle)
+    names, _ = stack._validate_estimators()
+    X_meta = np.column_stack([oof[name] for name in names])
+    return cross_val_predict(clone(stack.final_estimator), X_meta, np.asarray(y),
+                             cv=KFold(n_splits=cv, shuffle=True, random_state=42))
+
+
+def oof_metrics(y, pred_log):
+    y_log = np.asarray(y)
+    price, pred = np.expm1(y_log), np.expm1(pred_log)
+    return {
+        'rmsle': float(np.sqrt(np.mean((y_log - pred_log) ** 2))),
+        'mae': float(np.mean(np.abs(price - pred))),
+        'r2': float(r2_score(price, pred)),
+    }
+
+
+def fit_stack(stack, Xt, y, cores, cost_estimates=COST_ESTIMATES, store=None):
+    # Замена stack.fit(Xt, y): те же обучения, но задачами с бюджетом потоков.
+    # С хранилищем OOF обучаются только модели, которых в нем нет
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    fitted, oof, todo = {}, {}, []
+    data_key = store.data_key(Xt, y, CV_FOLDS) if store else None
+    for name, est in stack.estimators:
+        cached = store.load(data_key, name, est) if store else None
+        if cached is None:
+            todo.append((name, est))
+        else:
+            fitted[name], oof[name] = cached
+
+    jobs, splits = run_jobs(make_jobs(todo, cores, cost_estimates), Xt, y, cores)
+    new_fitted, new_oof = collect_jobs(jobs, splits, len(y))
+    if store:
+        for name, est in todo:
+            store.save(data_key, name, est, new_fitted[name], new_oof[name])
+    assemble_stack(stack, {**fitted, **new_fitted}, {**oof, **new_oof}, Xt, y)
+    pred_log = oof_predictions(stack, {**oof, **new_oof}, y)
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    for job in jobs:
+        job['started'] -= start
+        del job['estimator']
+        job.pop('prediction', None)
+    return {'wall_seconds': wall, 'cpu_seconds': cpu, 'cores': cores, 'jobs': jobs,
+            'cached': sorted(fitted), 'oof_metrics': oof_metrics(y, pred_log), 'oof_pred_log': pred_log}
+
+
+def fit_preprocessor(model, X, y, store=None):
+    preprocessor = model.named_steps['preprocessor']
+    if store is None:
+        return preprocessor.fit_transform(X, y)
+    preprocessor, Xt = store.fit_preprocessor(preprocessor, X, y)
+    model.steps[0] = ('preprocessor', preprocessor)
+    return Xt
+
+
+def train_stack(X, y, one_hot_coder, target_coder, cores, cost_estimates=COST_ESTIMATES,
+                store=None, estimators=None, final_estimator=None):
+    model = make_stack_pipe(one_hot_coder, target_coder, estimators, final_estimator)
+    Xt = fit_preprocessor(model, X, y, store)
+    report = fit_stack(model.named_steps['stack'], Xt, y, cores, cost_estimates, store)
+    return model, report
+
+
+def print_report(report):
+    if report['cached']:
+        print(f"Из хранилища OOF: {', '.join(report['cached'])}")
+    wall, cores = report['wall_seconds'], report['cores']
+    if not report['jobs']:
+        print(f"Базовые модели не переобучались; мета-модель обучена за {wall:.2f} с")
+        return
+
+    jobs = pd.DataFrame(report['jobs'])
+    jobs['fold'] = jobs['fold'].map(lambda f: 'all' if pd.isna(f) else int(f))
+    print(jobs[['name', 'fold', 'threads', 'started', 'seconds']]
+          .sort_values('started').round(2).to_string(index=False))
+
+    per_model = jobs.groupby('name').agg(threads=('threads', 'first'), jobs=('seconds', 'size'),
+                                         seconds=('seconds', 'sum'))
+    print(f"\n{per_model.sort_values('seconds', ascending=False).round(2).to_string()}")
+
+    allocated = (jobs['seconds'] * jobs['threads']).sum() / (wall * cores)
+    measured = report['cpu_seconds'] / (wall * cores)
+    print(f"\nОбучение: {wall:.1f} с на {cores} ядрах; загрузка ядер: "
+          f"выделено {allocated:.0%}, по CPU-времени {measured:.0%}")
+
+
+def load_cost_estimates(path=TIMINGS_PATH):
+    # Замеры прошлого запуска: время задачи на одном потоке
+    if not os.path.exists(path):
+        return COST_ESTIMATES
+    with open(path) as f:
+        return {**COST_ESTIMATES, **json.load(f)}
+
+
+def save_cost_estimates(report, path=TIMINGS_PATH):
+    if not report['jobs']:
+        return
+    jobs = pd.DataFrame(report['jobs'])
+    single_thread = (jobs['seconds'] * jobs['threads']).groupby(jobs['name']).mean()
+    # Модели из хранилища OOF не обучались - их прошлые замеры сохраняются
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+    with open(path, 'w') as f:
+        json.dump({**previous, **single_thread.round(3).to_dict()}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    import argparse
+    import warnings
+
+    import joblib
+    from sklearn import set_config
+
+    import model_io
+    from fast_tier import rmsle
+    from oof_store import STORE_DIR, OOFStore
+    from preprocessing import load_dataset
+
+    parser = argparse.ArgumentParser(description="Обучение стека с планированием задач по ядрам")
+    parser.add_argument('--train', default='train.csv')
+    parser.add_argument('--test', default='test.csv')
+    parser.add_argument('--cores', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default=model_io.PICKLE_PATH)
+    parser.add_argument('--timings', default=TIMINGS_PATH,
+                        help="Файл с замерами задач для порядка запуска в следующий раз")
+    parser.add_argument('--meta', choices=META_MODELS, default='ridge', help="Мета-модель стека")
+    parser.add_argument('--drop', nargs='*', default=[], help="Исключить базовые модели по имени")
+    parser.add_argument('--tuned', default=TUNED_PARAMS_PATH, help="Параметры бустингов из tune.py")
+    parser.add_argument('--store-dir', default=STORE_DIR, help="Хранилище OOF-предсказаний")
+    parser.add_argument('--no-store', action='store_true', help="Обучить все модели заново, без хранилища")
+    parser.add_argument('--compare', action='store_true',
+                        help="Также обучить стек обычным fit и сравнить время и предсказания")
+    parser.add_argument('--compile-forests', action='store_true',
+                        help="Сохранить леса стека в виде плоских массивов (compiled_forest.py)")
+    parser.add_argument('--register', action='store_true',
+                        help="Добавить модель в реестр (model_registry.py) и сделать текущей")
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    set_config(transform_output="pandas")
+    data = load_dataset(args.train, args.test)
+    X, y = data['X_train'], data['y_train_log']
+
+    store = None if args.no_store else OOFStore(args.store_dir)
+    tuned = load_tuned_params(args.tuned)
+    if tuned:
+        print(f"Параметры из {args.tuned}: {', '.join(sorted(tuned))}")
+    estimators = [(name, est) for name, est in base_models(tuned) if name not in args.drop]
+    model = make_stack_pipe(data['one_hot_coder'], data['target_coder'], estimators, make_meta_model(args.meta))
+    Xt = fit_preprocessor(model, X, y, store)
+    report = fit_stack(model.named_steps['stack'], Xt, y, args.cores, load_cost_estimates(args.timings), store)
+    print_report(report)
+    save_cost_estimates(report, args.timings)
+    # Интервалы цены по OOF-остаткам хранятся в самой модели (intervals.py)
+    from intervals import ResidualIntervals, attach_intervals
+    attach_intervals(model, ResidualIntervals(report['oof_pred_log'], y, X['Neighborhood']))
+    if args.compile_forests:
+        from compiled_forest import compile_forests
+        print(f"Скомпилированы: {', '.join(compile_forests(model))}")
+    joblib.dump(model, args.output)
+    print(f"RMSLE на train: {rmsle(y, model.predict(X)):.4f}; сохранено: {args.output}")
+    metrics = report['oof_metrics']
+    print(f"OOF: RMSLE {metrics['rmsle']:.4f}, MAE ${metrics['mae']:,.0f}, R² {metrics['r2']:.3f}")
+    if args.register:
+        import model_registry
+        version = model_registry.register(args.output, {
+            **metrics,
+            'metrics_source': 'oof',
+            'train_rows': len(X),
+            'features': list(X.columns),
+            'estimators': [name for name, _ in estimators],
+            'meta_model': args.meta,
+        })
+        print(f"Реестр: {version} - текущая версия")
+    # Индекс похожих продаж для main2.py - по тем же продажам, что и модель
+    from comps import COMPS_PATH, CompsIndex
+    comps_index = CompsIndex.from_csv(args.train)
+    print(f"Похожие продажи: {comps_index.n_sales:,} продаж -> {comps_index.save(COMPS_PATH)}")
+    # Эталон для контроля сдвига вводимых в main2.py значений
+    from drift import DRIFT_REFERENCE_PATH, reference_from_csv, save_reference
+    print(f"Эталон сдвига входов -> {save_reference(reference_from_csv(args.train), DRIFT_REFERENCE_PATH)}")
+
+    if args.compare:
+        # TargetEncoder перемешивает фолды случайно, поэтому обычный fit
+        # получает тот же Xt - иначе предсказания нельзя сравнить
+        baseline = make_stack_pipe(data['one_hot_coder'], data['target_coder'],
+                                   estimators, make_meta_model(args.meta)).named_steps['stack']
+        start = time.perf_counter()
+        baseline.fit(Xt, y)
+        baseline_wall = time.perf_counter() - start
+        Xt_valid = model.named_steps['preprocessor'].transform(data['X_valid'])
+        diff = np.abs(baseline.predict(Xt_valid) - model.named_steps['stack'].predict(Xt_valid)).max()
+        print(f"StackingRegressor.fit: {baseline_wall:.1f} с, планировщик: {report['wall_seconds']:.1f} с "
+              f"(x{baseline_wall / report['wall_seconds']:.2f}); "
+              f"макс. расхождение предсказаний {diff:.2e} (log1p)")
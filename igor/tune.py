@@ -0,0 +1,209 @@
+import json
+import os
+import time
+
+import numpy as np
+import optuna
+from sklearn.base import clone
+from sklearn.model_selection import KFold
+
+from fast_tier import rmsle
+from model_utils import set_fit_threads
+from train import CV_FOLDS, TUNED_PARAMS_PATH, base_models
+
+# ==============================
+# ПОДБОР ГИПЕРПАРАМЕТРОВ БУСТИНГОВ (OPTUNA)
+# ==============================
+# Для catboost, lgbm и xgb из train.base_models() запускается study Optuna.
+# Trial обучается на тех же 5 фолдах, что и стек, и после каждого фолда
+# сообщает среднюю RMSLE: MedianPruner останавливает плохие trial'ы уже
+# после первого фолда. Studies хранятся в SQLite, поэтому прерванный подбор
+# продолжается с того же места, а несколько процессов могут работать
+# с одной базой одновременно. Лучшие параметры пишутся в tuned_params.json,
+# который train.base_models() подхватывает при обучении стека.
+#
+# Пример:
+#   python tune.py --trials 100 --jobs 4 --threads-per-trial 2
+#   python tune.py --models catboost --trials 50   # продолжит study catboost
+
+STORAGE = 'sqlite:///tuning.db'
+
+
+def suggest_catboost(trial):
+    return {
+        'iterations': trial.suggest_int('iterations', 500, 3000, step=250),
+        'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.1, log=True),
+        'max_depth': trial.suggest_int('max_depth', 4, 8),
+        'l2_leaf_reg': trial.suggest_float('l2_leaf_reg', 1, 10, log=True),
+        'random_strength': trial.suggest_float('random_strength', 0, 2),
+        'bagging_temperature': trial.suggest_float('bagging_temperature', 0, 1),
+    }
+
+
+def suggest_lgbm(trial):
+    return {
+        'n_estimators': trial.suggest_int('n_estimators', 200, 1500, step=100),
+        'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.1, log=True),
+        'max_depth': trial.suggest_int('max_depth', 3, 8),
+        'num_leaves': trial.suggest_int('num_leaves', 8, 64),
+        'subsample': trial.suggest_float('subsample', 0.6, 1.0),
+        'colsample_bytree': trial.suggest_float('colsample_bytree', 0.5, 1.0),
+        'reg_alpha': trial.suggest_float('reg_alpha', 1e-3, 1.0, log=True),
+        'reg_lambda': trial.suggest_float('reg_lambda', 1e-3, 10.0, log=True),
+        'min_data_in_leaf': trial.suggest_int('min_data_in_leaf', 5, 40),
+    }
+
+
+def suggest_xgb(trial):
+    return {
+        'n_estimators': trial.suggest_int('n_estimators', 200, 1500, step=100),
+        'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.1, log=True),
+        'max_depth': trial.suggest_int('max_depth', 3, 8),
+        'subsample': trial.suggest_float('subsample', 0.6, 1.0),
+        'colsample_bytree': trial.suggest_float('colsample_bytree', 0.5, 1.0),
+        'reg_alpha': trial.suggest_float('reg_alpha', 1e-3, 1.0, log=True),
+        'reg_lambda': trial.suggest_float('reg_lambda', 1e-3, 10.0, log=True),
+        'min_child_weight': trial.suggest_float('min_child_weight', 1, 10, log=True),
+    }
+
+
+SEARCH_SPACES = {
+    'catboost': suggest_catboost,
+    'lgbm': suggest_lgbm,
+    'xgb': suggest_xgb,
+}
+
+
+def make_objective(name, Xt, y, threads_per_trial):
+    base = dict(base_models(tuned={}))[name]
+    splits = list(KFold(n_splits=CV_FOLDS).split(Xt))
+
+    def objective(trial):
+        est = set_fit_threads(clone(base).set_params(**SEARCH_SPACES[name](trial)), threads_per_trial)
+        scores = []
+        for fold, (train_idx, test_idx) in enumerate(splits):
+            est.fit(Xt.iloc[train_idx], y.iloc[train_idx])
+            scores.append(rmsle(y.iloc[test_idx], est.predict(Xt.iloc[test_idx])))
+            trial.report(float(np.mean(scores)), fold)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+        return float(np.mean(scores))
+
+    return objective
+
+
+def tune_model(name, Xt, y, data_key, trials, jobs=1, threads_per_trial=1,
+               storage=STORAGE, timeout=None):
+    study = optuna.create_study(
+        study_name=f"{name}-{data_key}",
+        storage=storage,
+        load_if_exists=True,
+        direction='minimize',
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=0),
+    )
+    states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    done = len(study.get_trials(deepcopy=False, states=states))
+    if done:
+        print(f"{name}: продолжаем study, уже {done} trial'ов")
+    if done >= trials:
+        return study, 0.0, 0
+
+    def log_trial(study, trial):
+        if trial.state == optuna.trial.TrialState.PRUNED:
+            print(f"  {name} #{trial.number}: отсечен после фолда {max(trial.intermediate_values) + 1}")
+        elif trial.state == optuna.trial.TrialState.COMPLETE:
+            print(f"  {name} #{trial.number}: RMSLE {trial.value:.4f} (лучшая {study.best_value:.4f})")
+
+    start = time.perf_counter()
+    study.optimize(
+        make_objective(name, Xt, y, threads_per_trial),
+        n_jobs=jobs,
+        timeout=timeout,
+        callbacks=[optuna.study.MaxTrialsCallback(trials, states=states), log_trial],
+    )
+    new_trials = len(study.get_trials(deepcopy=False, states=states)) - done
+    return study, time.perf_counter() - start, new_trials
+
+
+def _duration(trial):
+    return (trial.datetime_complete - trial.datetime_start).total_seconds()
+
+
+def study_report(study, wall, new_trials):
+    trials = study.get_trials(deepcopy=False)
+    complete = [_duration(t) for t in trials if t.state == optuna.trial.TrialState.COMPLETE]
+    pruned = [_duration(t) for t in trials if t.state == optuna.trial.TrialState.PRUNED]
+    # Сколько времени заняли бы отсеченные trial'ы, если бы доходили до конца
+    saved = len(pruned) * np.mean(complete) - sum(pruned) if complete and pruned else 0.0
+    finished = len(complete) + len(pruned)
+    return {
+        'trials': finished,
+        'complete': len(complete),
+        'pruned': len(pruned),
+        'trials_per_hour': new_trials / wall * 3600 if wall > 0 else 0.0,
+        'session_seconds': wall,
+        'pruning_saved_seconds': float(saved),
+        'best_rmsle': study.best_value if complete else None,
+        'best_params': study.best_params if complete else {},
+    }
+
+
+def export_best(best_params, path=TUNED_PARAMS_PATH):
+    # Дописываем к уже подобранным параметрам других моделей
+    tuned = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            tuned = json.load(f)
+    tuned.update(best_params)
+    with open(path, 'w') as f:
+        json.dump(tuned, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    import argparse
+    import warnings
+
+    from sklearn import set_config
+
+    from oof_store import STORE_DIR, OOFStore
+    from preprocessing import load_dataset
+    from train import make_preprocessor
+
+    parser = argparse.ArgumentParser(description="Подбор параметров бустингов стека через Optuna")
+    parser.add_argument('--models', nargs='+', choices=list(SEARCH_SPACES), default=list(SEARCH_SPACES))
+    parser.add_argument('--trials', type=int, default=50, help="Всего trial'ов в study, с учетом прошлых запусков")
+    parser.add_argument('--jobs', type=int, default=1, help="Trial'ов параллельно")
+    parser.add_argument('--threads-per-trial', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=None, help="Лимит на модель, с")
+    parser.add_argument('--storage', default=STORAGE)
+    parser.add_argument('--store-dir', default=STORE_DIR)
+    parser.add_argument('--export', default=TUNED_PARAMS_PATH)
+    parser.add_argument('--train', default='train.csv')
+    parser.add_argument('--test', default='test.csv')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    set_config(transform_output="pandas")
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    data = load_dataset(args.train, args.test)
+    X, y = data['X_train'], data['y_train_log']
+    # Тот же Xt, что у train.py: оценки trial'ов сравнимы с OOF стека
+    store = OOFStore(args.store_dir)
+    _, Xt = store.fit_preprocessor(make_preprocessor(data['one_hot_coder'], data['target_coder']), X, y)
+    data_key = store.data_key(Xt, y, CV_FOLDS)
+
+    best = {}
+    for name in args.models:
+        study, wall, new_trials = tune_model(name, Xt, y, data_key, args.trials, args.jobs,
+                                 args.threads_per_trial, args.storage, args.timeout)
+        report = study_report(study, wall, new_trials)
+        print(f"{name}: {report['trials']} trial'ов ({report['pruned']} отсечено), "
+              f"{report['trials_per_hour']:.0f} trial'ов/ч, сессия {wall:.0f} с, "
+              f"отсечение сэкономило ~{report['pruning_saved_seconds']:.0f} с")
+        if report['best_params']:
+            print(f"  лучшая RMSLE {report['best_rmsle']:.4f}: {report['best_params']}")
+            best[name] = report['best_params']
+
+    export_best(best, args.export)
+    print(f"Параметры записаны в {args.export}; train.py использует их при обучении стека")